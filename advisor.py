@@ -0,0 +1,165 @@
+import os
+import textwrap
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import ResultCache, params_key
+
+# AI 診断。生成はバックグラウンドのスレッドで行い、画面は届いた分から表示する。
+# 同じプロンプト (= 同じポートフォリオと結果) の応答はキャッシュし、
+# 生成中のものは複数のセッションで同じジョブを共有する。
+
+
+def build_prompt(params, result, fx_label):
+    p = params
+    total_now = p.initial_cash + p.initial_invest_yen + p.initial_foreign_cash + p.initial_foreign_bond + p.initial_foreign_stock + p.initial_ideco
+    ratio_stock = (p.initial_foreign_stock + p.initial_ideco) / total_now * 100
+    ratio_safe = (p.initial_cash + p.initial_invest_yen + p.initial_foreign_cash) / total_now * 100
+    return textwrap.dedent(f"""
+        FPとして、以下のシミュレーション結果に基づき、投資戦略と家計へのアドバイスをお願いします。
+
+        # ユーザー属性
+        - 世帯主: {p.head_age}歳, 年収{p.head_income_base}万 (定年{p.retirement_age}歳)
+        - 子供: 第1子{p.c1_year}年生まれ({p.c1_edu})
+
+        # 現在のポートフォリオ (総額 {total_now:,.0f}万円)
+        - 安全資産(現預金・国内等): {ratio_safe:.1f}%
+        - 外国債券: {(p.initial_foreign_bond / total_now * 100):.1f}%
+        - 外国株式(株・投信・iDeCo): {ratio_stock:.1f}%
+        - 為替シナリオ: {fx_label}
+
+        # 将来予測
+        - 最も苦しい時期: {result.min_assets_year}年 (資産残高 {result.min_assets_disp:,.0f}万円)
+        - 老後純資産: {result.final_net_assets:,.0f}万円
+
+        # アドバイスのポイント
+        1. 現在のポートフォリオのリスク許容度適合性（38歳、子供ありの家庭として）
+        2. 教育費ピーク時におけるリスク資産取り崩しの可能性と対策
+        3. 為替リスクへの脆弱性と、今後の投資戦略（債券や国内資産の比率など）
+
+        投資の観点を中心に、辛口かつ具体的に3点お願いします。
+    """)
+
+
+# --- バックエンド (stream(prompt) が文字列の断片を順に返す) ---
+class GeminiBackend:
+    def __init__(self, api_key, model='gemini-flash-latest'):
+        self.api_key = api_key
+        self.model = model
+        self.name = f'gemini:{model}'
+
+    def stream(self, prompt):
+        # クライアントは読み込みが重いので、最初に使うときに import する
+        import google.generativeai as genai
+        genai.configure(api_key=self.api_key)
+        for chunk in genai.GenerativeModel(self.model).generate_content(prompt, stream=True):
+            if chunk.text:
+                yield chunk.text
+
+
+class StubBackend:
+    """オフラインで動作確認・ベンチマークするための応答。プロンプトの将来予測をそのまま返す。"""
+
+    def __init__(self, latency=0.3, chunk_delay=0.02):
+        self.latency = latency  # 最初の断片が届くまでの時間 (秒)
+        self.chunk_delay = chunk_delay
+        self.name = 'stub'
+
+    def stream(self, prompt):
+        forecast = [line for line in prompt.splitlines() if line.startswith('- ')]
+        text = "**(オフライン用のスタブ応答です)**\n\n入力された条件:\n\n" + "\n".join(forecast) + "\n"
+        time.sleep(self.latency)
+        for i in range(0, len(text), 16):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield text[i:i + 16]
+
+
+BACKENDS = {'gemini': GeminiBackend, 'stub': StubBackend}
+# KAKEIKANRI_AI_BACKEND=stub で API キーなしに試せる
+DEFAULT_BACKEND = os.environ.get('KAKEIKANRI_AI_BACKEND', 'gemini')
+
+
+def make_backend(name=DEFAULT_BACKEND, api_key=None):
+    if name not in BACKENDS:
+        raise ValueError(f"未知のバックエンドです: {name}")
+    return BACKENDS[name](api_key) if name == 'gemini' else BACKENDS[name]()
+
+
+# --- 生成ジョブ ---
+class DiagnosisJob:
+    def __init__(self, key, chunks=(), done=False):
+        self.key = key
+        self.chunks = list(chunks)
+        self.done = done
+        self.error = None
+        self.cached = done  # 作った時点で完了していればキャッシュから
+        self._cond = threading.Condition()
+
+    @property
+    def text(self):
+        return ''.join(self.chunks)
+
+    def append(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.error = error
+            self.done = True
+            self._cond.notify_all()
+
+    def follow(self, timeout=None):
+        """届いた断片を先頭から順に返す (生成中なら続きを待つ)。エラーで終わったら例外を送出する。"""
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self.chunks) and not self.done:
+                    if not self._cond.wait(timeout):
+                        raise TimeoutError("AI の応答がありません")
+                new, done = self.chunks[i:], self.done
+            for chunk in new:
+                yield chunk
+            i += len(new)
+            if done and i >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+# 応答は1日保持する (同じ条件の再診断は API を呼ばない)
+ADVICE_CACHE = ResultCache(maxsize=128, ttl=24 * 3600)
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix='advisor')
+_RUNNING = {}
+_RUNNING_LOCK = threading.Lock()
+
+
+def _run(job, backend, prompt):
+    try:
+        for chunk in backend.stream(prompt):
+            job.append(chunk)
+    except Exception as e:
+        job.finish(e)
+    else:
+        ADVICE_CACHE.put(job.key, job.text)
+        job.finish()
+    finally:
+        with _RUNNING_LOCK:
+            _RUNNING.pop(job.key, None)
+
+
+def request_diagnosis(prompt, backend):
+    """診断を始めてジョブを返す (すぐに戻る)。キャッシュ済みなら完了済みのジョブを返す。"""
+    key = params_key('diagnosis', backend.name, prompt)
+    text = ADVICE_CACHE.get(key)
+    if text is not None:
+        return DiagnosisJob(key, [text], done=True)
+    with _RUNNING_LOCK:
+        job = _RUNNING.get(key)
+        if job is None:
+            job = _RUNNING[key] = DiagnosisJob(key)
+            _EXECUTOR.submit(_run, job, backend, prompt)
+    return job
@@ -0,0 +1,180 @@
+"""シミュレーションの主要な処理の速度を測るベンチマーク。Streamlit は不要。
+
+    python benchmark.py                       # 全ケースを実行して表示
+    python benchmark.py -o bench.json         # 結果を JSON に保存
+    python benchmark.py --compare bench.json  # 保存した結果と比べ、閾値を超えて遅くなったら終了コード 1
+    python benchmark.py --quick -k mortgage   # 重いケースを除き、名前に mortgage を含むものだけ
+
+比較には各ケースの中央値を使う。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import replace
+from functools import lru_cache
+
+import numpy as np
+
+from simulation import (
+    SimulationParams, simulate, build_timeline, compute_income, compute_expenses, compute_mortgage,
+)
+from mortgage import yearly_schedule
+from montecarlo import MarketAssumptions, simulate_paths
+from macro import DEFAULT_CORRELATIONS
+from historical import HistoricalReturns, block_bootstrap
+from pipeline import simulate_batch
+from strategy import STRATEGIES, simulate_strategies
+from charts import asset_figure, fan_figure, year_ticks
+from optimizer import optimize
+
+# 子どもが遅く生まれると end_year が伸びる (2060年生まれ -> 2083年まで 59年)
+LONG_HORIZON = replace(SimulationParams(), c1_year=2060)
+
+
+# 画面が使うシミュレーション側のモジュール (起動時に読み込まれる)
+APP_MODULES = 'simulation, montecarlo, historical, macro, cache, pipeline, sweep, solver, strategy, perf, advisor, optimizer'
+
+
+def _import_case(modules):
+    # 新しいプロセスで import するまでの時間 (コールドスタート)。Python 自体の起動時間も含む
+    return lambda: subprocess.run([sys.executable, '-c', f'import {modules}'], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def _case(name, func, heavy=False):
+    return {'name': name, 'func': func, 'heavy': heavy}
+
+def _fixture(build):
+    # 最初に使われたとき (計測前のウォームアップ) に1回だけ作る。-k や --quick で除いたケースの準備はしない
+    return lru_cache(maxsize=None)(build)
+
+def build_cases():
+    base = SimulationParams()
+    stable = replace(base, mortgage_rate_scenario='stable')
+    timeline = build_timeline(base)
+    n_years = len(timeline['西暦'])
+    rates_10k = np.random.default_rng(0).normal(0.8, 0.2, (10000, n_years))
+    # ブートストラップの速度はデータの中身に依らないので、50年分の月次データを乱数で代用する
+    history = HistoricalReturns(np.random.default_rng(0).normal(0.004, 0.03, (600, 5)), periods_per_year=12)
+    macro = MarketAssumptions(vol_inflation=1.0, vol_wage_growth=1.0, correlations=DEFAULT_CORRELATIONS)
+    base_result = simulate(base)
+    ticks = year_ticks(base_result.columns)
+    mc_10k = _fixture(lambda: simulate_paths(stable, 10000, seed=0))
+    sweep_grid = [replace(base, yield_foreign_stock=y, head_income_growth=g)
+                  for y in np.linspace(2, 8, 40) for g in np.linspace(0, 3, 25)]
+    batch_results = _fixture(lambda: simulate_batch(sweep_grid))
+
+    return [
+        _case('startup/python', _import_case('sys')),
+        _case('startup/import_app_modules', _import_case(APP_MODULES)),
+        _case('deterministic/simulate', lambda: simulate(base)),
+        _case('deterministic/simulate_long_horizon', lambda: simulate(LONG_HORIZON)),
+        _case('deterministic/simulate_monthly', lambda: simulate(replace(base, monthly=True))),
+        _case('stage/income', lambda: compute_income(base, timeline)),
+        _case('stage/expenses', lambda: compute_expenses(base, timeline)),
+        _case('mortgage/fixed_rate', lambda: compute_mortgage(base, timeline)),
+        _case('mortgage/variable_rate', lambda: compute_mortgage(stable, timeline)),
+        _case('mortgage/10k_rate_paths', lambda: yearly_schedule(5e7, rates_10k, timeline['西暦'], 2059)),
+        _case('montecarlo/1k', lambda: simulate_paths(stable, 1000, seed=0)),
+        _case('montecarlo/10k', lambda: simulate_paths(stable, 10000, seed=0)),
+        _case('montecarlo/10k_long_horizon', lambda: simulate_paths(LONG_HORIZON, 10000, seed=0)),
+        _case('montecarlo/10k_macro', lambda: simulate_paths(stable, 10000, seed=0, assumptions=macro)),
+        _case('montecarlo/bootstrap_10k_60y', lambda: block_bootstrap(history, 10000, 60, np.random.default_rng(0))),
+        _case('montecarlo/10k_monthly', lambda: simulate_paths(replace(stable, monthly=True), 10000, seed=0)),
+        _case('montecarlo/10k_float32', lambda: simulate_paths(stable, 10000, seed=0, dtype=np.float32)),
+        _case('montecarlo/10k_historical', lambda: simulate_paths(stable, 10000, seed=0, history=history)),
+        _case('strategy/5x2k_paths', lambda: simulate_strategies(stable, list(STRATEGIES), 2000, seed=0)),
+        _case('optimize/120x1000', lambda: optimize(stable, n_paths=1000, workers=1)),
+        _case('chart/assets', lambda: asset_figure(base_result, ticks)),
+        _case('chart/fan_10k_paths', lambda: fan_figure(mc_10k().years, (('総資産', mc_10k().total_assets, '#2563eb'), ('純資産', mc_10k().net_assets, '#059669')), ticks)),
+        _case('montecarlo/100k', lambda: simulate_paths(stable, 100000, seed=0), heavy=True),
+        _case('batch/1000_params', lambda: simulate_batch(sweep_grid)),
+        _case('export/1000_params_arrow', lambda: [b.to_arrow(b.index.astype(str)) for b in batch_results()]),
+    ]
+
+
+def measure(func, min_time=0.5, min_repeats=3, max_repeats=200):
+    # 1回目はウォームアップとして捨て、合計 min_time 秒を超えるまで繰り返す
+    func()
+    times = []
+    total = 0.0
+    while len(times) < min_repeats or (total < min_time and len(times) < max_repeats):
+        t = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - t
+        times.append(elapsed)
+        total += elapsed
+    return {
+        'median': statistics.median(times),
+        'min': min(times),
+        'mean': statistics.fmean(times),
+        'repeats': len(times),
+    }
+
+
+def run(cases, min_time=0.5, out=sys.stdout):
+    results = {}
+    for case in cases:
+        results[case['name']] = stats = measure(case['func'], min_time)
+        print(f"{case['name']:<40} {stats['median'] * 1000:>10.2f} ms  (min {stats['min'] * 1000:.2f} ms, n={stats['repeats']})", file=out)
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold):
+    # baseline より threshold (割合) を超えて遅くなったケースを返す
+    regressions = []
+    for name, stats in current['results'].items():
+        if name not in baseline.get('results', {}):
+            continue
+        before = baseline['results'][name]['median']
+        ratio = stats['median'] / before if before > 0 else float('inf')
+        if ratio > 1 + threshold:
+            regressions.append((name, before, stats['median'], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="シミュレーションのベンチマーク")
+    parser.add_argument('-o', '--output', help="結果を保存する JSON ファイル")
+    parser.add_argument('--compare', help="比較する過去の結果 (JSON)")
+    parser.add_argument('--threshold', type=float, default=0.2, help="遅くなったとみなす割合 (既定 0.2 = 20%%)")
+    parser.add_argument('-k', dest='pattern', help="名前にこの文字列を含むケースだけ実行する")
+    parser.add_argument('--quick', action='store_true', help="重いケース (10万パスなど) を除く")
+    parser.add_argument('--min-time', type=float, default=0.5, help="1ケースあたりの最小計測時間 (秒)")
+    args = parser.parse_args(argv)
+
+    cases = [c for c in build_cases()
+             if (not args.quick or not c['heavy']) and (not args.pattern or args.pattern in c['name'])]
+    current = run(cases, args.min_time)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"遅くなりました: {name} {before * 1000:.2f} ms -> {after * 1000:.2f} ms (x{ratio:.2f})")
+        if regressions:
+            return 1
+        print(f"{args.threshold:.0%} を超えて遅くなったケースはありません")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
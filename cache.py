@@ -0,0 +1,135 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, is_dataclass
+import numpy as np
+
+from simulation import simulate
+from montecarlo import MarketAssumptions, simulate_paths
+from strategy import simulate_strategies
+from optimizer import optimize
+
+# シミュレーション結果のプロセス内キャッシュ。モジュール変数なので
+# 同じ Streamlit サーバープロセスの全セッションで共有される。
+
+
+def _canonical(obj):
+    # ハッシュ用に正規化する (330 と 330.0 を同一視、dataclass は型名付きの dict)
+    if is_dataclass(obj):
+        return {'__type__': type(obj).__name__, **{k: _canonical(v) for k, v in asdict(obj).items()}}
+    if isinstance(obj, dict):
+        return {str(k): _canonical(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_canonical(v) for v in obj]
+    if isinstance(obj, (bool, np.bool_)):
+        return bool(obj)
+    if isinstance(obj, (int, float, np.integer, np.floating)):
+        return float(obj) + 0.0  # -0.0 -> 0.0
+    return obj
+
+def params_key(*parts):
+    payload = json.dumps(_canonical(parts), sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, maxsize=256, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl  # 秒。指定すると期限切れのエントリは無いものとして扱う
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                expires, value = self._data[key]
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (None if self.ttl is None else time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        # 計算はロックの外で行う (同時に同じキーが来た場合は両方計算し、後勝ち)
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
+
+
+# 決定論的な結果は小さいので多めに、モンテカルロは (paths, years) 行列を持つので少なめに保持する
+RESULT_CACHE = ResultCache(maxsize=512)
+MC_CACHE = ResultCache(maxsize=16)
+
+
+def cached_simulate(params):
+    # 戻り値は全セッションで共有されるので書き換えないこと
+    return RESULT_CACHE.get_or_compute(params_key('simulate', params), lambda: simulate(params))
+
+def cached_simulate_paths(params, n_paths=10000, seed=None, assumptions=MarketAssumptions(), history=None, block_years=5, dtype=None):
+    run = lambda: simulate_paths(params, n_paths, seed, assumptions, history, block_years, dtype)
+    if seed is None:
+        # シードなしは毎回違う結果になるべきなのでキャッシュしない
+        return run()
+    # 実績データは中身の代わりにファイルの指紋 (パス・更新時刻・サイズ) をキーにする
+    source = (history.fingerprint, block_years) if history is not None else None
+    key = params_key('simulate_paths', params, n_paths, seed, assumptions, source, None if dtype is None else np.dtype(dtype).name)
+    return MC_CACHE.get_or_compute(key, run)
+
+
+def cached_simulate_strategies(params, strategies, n_paths=None, seed=0, assumptions=MarketAssumptions(), history=None, block_years=5):
+    source = (history.fingerprint, block_years) if history is not None else None
+    key = params_key('simulate_strategies', params, list(strategies), n_paths, seed, assumptions, source)
+    return MC_CACHE.get_or_compute(key, lambda: simulate_strategies(params, strategies, n_paths, seed, assumptions, history, block_years))
+
+
+def cached_optimize(params, ranges, target, n_paths=1000, seed=0, assumptions=MarketAssumptions(), history=None, block_years=5):
+    source = (history.fingerprint, block_years) if history is not None else None
+    key = params_key('optimize', params, ranges, target, n_paths, seed, assumptions, source)
+    return MC_CACHE.get_or_compute(key, lambda: optimize(params, ranges, target, n_paths, seed, assumptions, history, block_years))
+
+
+def cached_solve(params, goal, target_success=1.0, n_paths=None, seed=0, assumptions=MarketAssumptions()):
+    # solver は pipeline 経由でこのモジュールを読み込むので、循環しないよう呼ばれたときに import する
+    from solver import GOALS, solve
+    goal = GOALS[goal] if isinstance(goal, str) else goal
+    run = lambda: solve(params, goal, target_success, n_paths, seed, assumptions)
+    if n_paths is not None and seed is None:
+        # シードなしのモンテカルロは毎回違う結果になるべきなのでキャッシュしない
+        return run()
+    key = params_key('solve', params, goal, target_success, n_paths, seed, assumptions)
+    return MC_CACHE.get_or_compute(key, run)
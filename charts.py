@@ -0,0 +1,132 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from cache import ResultCache
+from simulation import START_YEAR
+
+# グラフの組み立て。パスが何本あってもブラウザに送るデータ量が増えないよう、
+# モンテカルロの結果はサーバー側でパーセンタイルの帯と数本の代表パスにまとめてから描く。
+# 図は結果のキーごとにキャッシュし、条件が変わらない rerun では組み立て直さない。
+
+FAN_QUANTILES = (5, 25, 50, 75, 95)
+# 1本の線の点数がこれを超えたら WebGL (Scattergl) で描く
+WEBGL_POINTS = 1000
+
+# 図は全セッションで共有されるので書き換えないこと
+FIGURE_CACHE = ResultCache(maxsize=32)
+
+
+def cached_figure(key, build):
+    return FIGURE_CACHE.get_or_compute(key, build)
+
+
+def year_ticks(columns, step=5):
+    # 横軸の目盛 (西暦と世帯主・第1子の年齢) -> (tickvals, ticktext)
+    years = np.asarray(columns['西暦'])
+    mask = (years - START_YEAR) % step == 0
+    head = np.asarray(columns['世帯主年齢'])[mask].astype(int)
+    child = np.asarray(columns['第1子年齢'])[mask].astype(int)
+    vals = years[mask].tolist()
+    return vals, [f"{y}<br>(主{h}/子{c})" for y, h, c in zip(vals, head.tolist(), child.tolist())]
+
+
+def _layout(fig, ticks, yaxis_title="金額 (万円)"):
+    fig.update_layout(
+        xaxis=dict(title="西暦 (世帯主年齢/第1子年齢)", tickmode='array', tickvals=ticks[0], ticktext=ticks[1]),
+        yaxis_title=yaxis_title,
+        hovermode="x unified",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig
+
+
+def line_trace(x, y, **kwargs):
+    # 点が多い線は WebGL で描く (SVG より描画が速く、ブラウザのメモリも少ない)
+    trace = go.Scattergl if np.size(y) > WEBGL_POINTS else go.Scatter
+    return trace(x=x, y=y, **kwargs)
+
+
+def asset_figure(result, ticks):
+    """決定論的な結果の資産推移 (総資産・資産別の積み上げ・ローン残高)。"""
+    c = result.columns
+    years = c['西暦']
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=years, y=c['総資産'], name='<b>総資産</b>', line=dict(color='#2563eb', width=4), hovertemplate='%{y:,.0f}万円'))
+    # 積み上げ (リスク高い順あるいは流動性順)
+    for col, name, color in (('外国(株)', '外国株・投信', '#059669'), ('iDeCo', 'iDeCo(外国株)', '#f59e0b'), ('外国(債券)', '外国債券', '#34d399'),
+                             ('外国(現金)', '外貨預金', '#6ee7b7'), ('国内資産', '国内資産', '#93c5fd'), ('貯金', '貯金(生活防衛)', '#bfdbfe')):
+        fig.add_trace(go.Scatter(x=years, y=c[col], name=name, line=dict(color=color, width=1), stackgroup='one', hovertemplate='%{y:,.0f}万円'))
+
+    fig.add_trace(go.Scatter(x=years, y=c['ローン残高'], name='ローン残高', line=dict(color='#ef4444', dash='dot', width=2), hovertemplate='%{y:,.0f}万円'))
+    return _layout(fig, ticks)
+
+
+def fan_bands(values, q=FAN_QUANTILES):
+    # (paths, years) -> 各年のパーセンタイル (len(q), years)
+    return np.percentile(values, q, axis=0)
+
+
+def sample_paths(values, n=5):
+    """最終年の値が等間隔の順位にあるパスを n 本選ぶ (同じ結果なら毎回同じパス)。"""
+    if n <= 0 or len(values) == 0:
+        return values[:0]
+    order = np.argsort(values[:, -1], kind='stable')
+    ranks = np.linspace(0, len(order) - 1, n + 2)[1:-1].round().astype(int)
+    return values[order[ranks]]
+
+
+def _hex_rgba(color, alpha):
+    r, g, b = (int(color[i:i + 2], 16) for i in (1, 3, 5))
+    return f'rgba({r},{g},{b},{alpha})'
+
+
+def fan_figure(years, series, ticks, n_samples=5):
+    """パス (paths, years) をパーセンタイルの帯 (P5-P95, P25-P75)・中央値・代表パスで描く。
+
+    series は (名前, 値, 色 '#rrggbb') の並び。送るデータは系列ごとに
+    (len(FAN_QUANTILES) + n_samples) × years 点で、パスの本数に依らない。
+    """
+    fig = go.Figure()
+    for name, values, color in series:
+        bands = fan_bands(values)
+        # 代表パスは NaN で区切って1本の線にまとめる (凡例・ホバーを増やさない)
+        samples = sample_paths(values, n_samples)
+        if len(samples):
+            gap = np.full((len(samples), 1), np.nan)
+            xs = np.tile(np.append(np.asarray(years, dtype=float), np.nan), len(samples))
+            fig.add_trace(line_trace(xs, np.hstack([samples, gap]).ravel(), name=f'{name} 代表パス', mode='lines',
+                                     line=dict(color=_hex_rgba(color, 0.35), width=1), hoverinfo='skip', legendgroup=name))
+        for lo, hi, alpha, label in ((0, 4, 0.12, 'P5-P95'), (1, 3, 0.22, 'P25-P75')):
+            fig.add_trace(go.Scatter(x=years, y=bands[hi], name=f'{name} P{FAN_QUANTILES[hi]}', line=dict(color=color, width=0),
+                                     showlegend=False, legendgroup=name, hovertemplate='%{y:,.0f}万円'))
+            fig.add_trace(go.Scatter(x=years, y=bands[lo], name=f'{name} {label}', line=dict(color=color, width=0), fill='tonexty',
+                                     fillcolor=_hex_rgba(color, alpha), legendgroup=name, hovertemplate='%{y:,.0f}万円'))
+        fig.add_trace(go.Scatter(x=years, y=bands[2], name=f'<b>{name} P50</b>', line=dict(color=color, width=3), legendgroup=name, hovertemplate='%{y:,.0f}万円'))
+    return _layout(fig, ticks)
+
+
+def frontier_figure(result, labels):
+    """最適化の全候補と効率的フロンティア (資金ショート確率 × 老後純資産の中央値)。
+
+    labels は {パラメータ名: 表示名}。候補が多ければ WebGL で描く。
+    """
+    names = list(result.values)
+    risk = result.bankruptcy_probability * 100
+    custom = np.column_stack([result.values[n] for n in names])
+    hover = '<br>'.join(f'{labels[n]}: %{{customdata[{k}]:g}}' for k, n in enumerate(names)) + '<br>資金ショート %{x:.1f}%<br>中央値 %{y:,.0f}万円<extra></extra>'
+    fig = go.Figure()
+    fig.add_trace(line_trace(risk, result.median_final_net, mode='markers', name='候補', customdata=custom, hovertemplate=hover,
+                             marker=dict(color='#9ca3af', size=6, opacity=0.6)))
+    front = result.frontier
+    fig.add_trace(go.Scatter(x=risk[front], y=result.median_final_net[front], mode='lines+markers', name='効率的フロンティア',
+                             customdata=custom[front], hovertemplate=hover, line=dict(color='#2563eb', width=2)))
+    for i, name, color, symbol in ((result.current, '現在の設定', '#f59e0b', 'diamond'), (result.best, '最適', '#ef4444', 'star')):
+        fig.add_trace(go.Scatter(x=risk[[i]], y=result.median_final_net[[i]], mode='markers', name=name, customdata=custom[[i]],
+                                 hovertemplate=hover, marker=dict(color=color, size=14, symbol=symbol)))
+    fig.add_vline(x=result.target * 100, line_dash='dot', line_color='#6b7280')
+    fig.update_layout(
+        xaxis_title="資金ショート確率 (%)",
+        yaxis_title="老後純資産の中央値 (万円)",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    return fig
@@ -0,0 +1,131 @@
+"""過去の実績リターンをブロック・ブートストラップして市場シナリオを作る。
+
+実績データは NumPy の .npy (期間 × RETURN_COLUMNS、小数のリターン) と、同名の .json
+(列名・1年あたりの期間数・開始時点) の組で置く。.npy はメモリマップで開くので、
+同じマシンの全ワーカープロセス・全セッションが OS のページキャッシュ上の1つのコピーを共有する。
+
+    python historical.py returns.csv -o data/historical_returns.npy --periods-per-year 12
+
+CSV は1行1期間で、RETURN_COLUMNS の列を % で持つ (先頭列に年月などのラベルがあればそれを開始時点として記録する)。
+"""
+import argparse
+import csv
+import json
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+
+# 実績データの列 (fx は円から見た米ドルの価値の変化率)
+RETURN_COLUMNS = ('foreign_stock', 'foreign_bond', 'foreign_cash', 'fx', 'yen')
+DEFAULT_PATH = Path(os.environ.get('KAKEIKANRI_RETURNS', Path(__file__).parent / 'data' / 'historical_returns.npy'))
+
+
+@dataclass(frozen=True, eq=False)
+class HistoricalReturns:
+    data: np.ndarray  # (期間, 列) 小数のリターン。ファイルから読んだ場合はメモリマップ
+    columns: tuple = RETURN_COLUMNS
+    periods_per_year: int = 1
+    start: str = ''
+    fingerprint: str = ''  # キャッシュのキー用 (パス・更新時刻・サイズ)
+
+    @property
+    def n_years(self):
+        return self.data.shape[0] / self.periods_per_year
+
+    def annual_windows(self):
+        return _annual_windows(self)
+
+
+@lru_cache(maxsize=8)  # _load と同じ数だけ残す (古いデータの窓配列をいつまでも持たない)
+def _annual_windows(returns):
+    # 各期間から始まる1年間の複利リターン -> (列, 開始期間)。年次データならそのまま
+    ppy = returns.periods_per_year
+    order = [returns.columns.index(name) for name in RETURN_COLUMNS]
+    data = np.asarray(returns.data)[:, order]
+    if ppy > 1:
+        log_growth = np.vstack([np.zeros(len(order)), np.cumsum(np.log1p(data), axis=0)])
+        data = np.expm1(log_growth[ppy:] - log_growth[:-ppy])
+    return np.ascontiguousarray(data.T)
+
+
+@lru_cache(maxsize=8)
+def _load(path, mtime, size):
+    meta = json.loads(Path(path).with_suffix('.json').read_text(encoding='utf-8'))
+    data = np.load(path, mmap_mode='r')
+    columns = tuple(meta.get('columns', RETURN_COLUMNS))
+    if data.ndim != 2 or data.shape[1] != len(columns):
+        raise ValueError(f"{path}: 列数が {columns} と一致しません (shape={data.shape})")
+    missing = set(RETURN_COLUMNS) - set(columns)
+    if missing:
+        raise ValueError(f"{path}: 列が足りません: {sorted(missing)}")
+    return HistoricalReturns(data, columns, int(meta.get('periods_per_year', 1)), str(meta.get('start', '')), f"{path}:{mtime}:{size}")
+
+def load_returns(path=DEFAULT_PATH):
+    """実績データを開く。ファイルが変わらない限り同じプロセスでは1回だけ開く。"""
+    path = Path(path).resolve()
+    stat = path.stat()
+    return _load(str(path), stat.st_mtime_ns, stat.st_size)
+
+def find_returns(path=DEFAULT_PATH):
+    # 実績データがあれば開いて返す (なければ None)
+    return load_returns(path) if Path(path).exists() else None
+
+
+def block_bootstrap(returns, n_paths, n_years, rng, block_years=5):
+    """連続した block_years 年分の実績をランダムに選んでつなぎ、列ごとに (paths, years) の年次リターンを返す。
+
+    同じ時点の各資産・為替のリターンをまとめて選ぶので資産間の相関が保たれ、
+    ブロック内では実際に起きた順序 (暴落と回復の並びなど) がそのまま残る。
+    """
+    windows = returns.annual_windows()
+    ppy = returns.periods_per_year
+    n_windows = windows.shape[1]
+    if n_windows < 1:
+        raise ValueError("実績データが1年分に足りません")
+    block_years = max(1, min(int(block_years), (n_windows - 1) // ppy + 1))
+    n_blocks = -(-n_years // block_years)
+    starts = rng.integers(0, n_windows - (block_years - 1) * ppy, (n_paths, n_blocks), dtype=np.int32)
+    # 各年の参照先 = ブロックの開始 + ブロック内の経過年 (int32 の方が添字計算・取り出しが速い)
+    offsets = (ppy * (np.arange(n_years) % block_years)).astype(np.int32)
+    idx = starts.repeat(block_years, axis=1)[:, :n_years] + offsets
+    # 全列を1回で取り出す -> (列, paths, years)。各列はそのまま連続した配列
+    sampled = windows.take(idx, axis=1)
+    return {name: sampled[k] for k, name in enumerate(RETURN_COLUMNS)}
+
+
+def convert_csv(csv_path, out_path, periods_per_year=1):
+    """% で書かれた CSV を .npy + .json に変換する。"""
+    with open(csv_path, encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        raise ValueError(f"{csv_path}: データがありません")
+    missing = set(RETURN_COLUMNS) - set(rows[0])
+    if missing:
+        raise ValueError(f"{csv_path}: 列が足りません: {sorted(missing)}")
+    data = np.array([[float(row[name]) / 100 for name in RETURN_COLUMNS] for row in rows])
+    label = next((k for k in rows[0] if k not in RETURN_COLUMNS), None)
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(out_path, data)
+    meta = {'columns': list(RETURN_COLUMNS), 'periods_per_year': periods_per_year, 'start': rows[0][label] if label else ''}
+    out_path.with_suffix('.json').write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+    return data.shape
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="実績リターンの CSV をブートストラップ用の .npy に変換する")
+    parser.add_argument('input', help="CSV ファイル (列: " + ', '.join(RETURN_COLUMNS) + " を %% で)")
+    parser.add_argument('-o', '--output', default=str(DEFAULT_PATH), help="出力する .npy (既定: data/historical_returns.npy)")
+    parser.add_argument('--periods-per-year', type=int, default=1, help="1年あたりの行数 (年次 1 / 月次 12)")
+    args = parser.parse_args(argv)
+    try:
+        n, _ = convert_csv(args.input, args.output, args.periods_per_year)
+    except (ValueError, KeyError) as e:
+        parser.exit(1, f"エラー: {e}\n")
+    print(f"{n} 期間 ({n / args.periods_per_year:g} 年分) を {args.output} に書き出しました")
+
+
+if __name__ == '__main__':
+    main()
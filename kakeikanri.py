@@ -1,505 +1,574 @@
-import streamlit as st
-import pandas as pd
-import numpy as np
-import plotly.graph_objects as go
-import google.generativeai as genai
-import datetime
-
-# --- ページ設定 ---
-st.set_page_config(
-    page_title="将来家計シミュレーション (ポートフォリオ分析版)",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-# --- パスワード認証機能 ---
-def check_password():
-    if "password" not in st.secrets:
-        return True
-    def password_entered():
-        if st.session_state["password"] == st.secrets["password"]:
-            st.session_state["password_correct"] = True
-            del st.session_state["password"]
-        else:
-            st.session_state["password_correct"] = False
-    if "password_correct" not in st.session_state:
-        st.text_input("パスワードを入力してください", type="password", on_change=password_entered, key="password")
-        return False
-    elif not st.session_state["password_correct"]:
-        st.text_input("パスワードを入力してください", type="password", on_change=password_entered, key="password")
-        st.error("パスワードが間違っています")
-        return False
-    else:
-        return True
-
-if not check_password():
-    st.stop()
-
-# --- 定数データ ---
-EDUCATION_COSTS = {
-    '【A】公立中心(塾しっかり)': [10, 10, 10, 25, 25, 25, 35, 35, 35, 40, 45, 50, 60, 60, 80, 60, 70, 90, 90, 55, 55, 55, 0],
-    '【B】中高公立・私大文系': [10, 10, 10, 25, 25, 25, 35, 35, 35, 40, 45, 50, 60, 60, 80, 60, 70, 90, 135, 105, 105, 105, 0],
-    '【C】中高公立・私大理系': [10, 10, 10, 25, 25, 25, 35, 35, 35, 40, 45, 50, 60, 60, 80, 60, 70, 90, 170, 150, 150, 150, 0],
-    '【D】高校から私立(文系大)': [10, 10, 10, 25, 25, 25, 35, 35, 35, 40, 45, 50, 60, 60, 80, 100, 100, 110, 135, 105, 105, 105, 0],
-    '【E】高校から私立(理系大)': [10, 10, 10, 25, 25, 25, 35, 35, 35, 40, 45, 50, 60, 60, 80, 100, 100, 110, 170, 150, 150, 150, 0],
-    '【F】中学受験(私立中高一貫)・文系大': [10, 10, 10, 25, 25, 25, 35, 35, 35, 80, 100, 140, 145, 145, 150, 110, 110, 120, 135, 105, 105, 105, 0],
-    '【G】中学受験(私立中高一貫)・理系大': [10, 10, 10, 25, 25, 25, 35, 35, 35, 80, 100, 140, 145, 145, 150, 110, 110, 120, 170, 150, 150, 150, 0],
-    '【H】小学校から私立(文系大)': [10, 10, 10, 25, 25, 25, 160, 160, 160, 160, 170, 180, 145, 145, 150, 110, 110, 120, 135, 105, 105, 105, 0],
-    '【I】小学校から私立(理系大)': [10, 10, 10, 25, 25, 25, 160, 160, 160, 160, 170, 180, 145, 145, 150, 110, 110, 120, 170, 150, 150, 150, 0],
-}
-
-REARING_COSTS = {
-    '【A】標準プラン': [80, 80, 80, 90, 90, 90, 100, 100, 100, 110, 110, 120, 130, 130, 130, 140, 140, 140, 100, 100, 100, 100, 0],
-    '【B】ゆとりプラン': [100, 100, 100, 110, 110, 110, 120, 120, 120, 130, 130, 140, 150, 150, 150, 160, 160, 160, 150, 150, 150, 150, 0],
-}
-
-INCOME_PRESETS = {
-    '【A】保守的': {'base': 800, 'growth': 0.5},
-    '【B】標準': {'base': 800, 'growth': 1.5},
-    '【C】積極': {'base': 800, 'growth': 3.0},
-}
-
-LIVING_PRESETS = {
-    '【A】節約 (月30万)': 360,
-    '【B】標準 (月38万)': 456, 
-    '【C】ゆとり (月48万)': 576,
-}
-
-INFLATION_PRESETS = {'0% (ゼロ)': 0.00, '1% (低め)': 0.01, '2% (標準)': 0.02, '3% (高め)': 0.03}
-MORTGAGE_RATE_SCENARIOS = {'固定 (変動なし)': 'fixed', '安定 (±微減)': 'stable', '緩やか上昇 (+0.05%/年)': 'rising', '急上昇 (+0.2%/年)': 'sharp_rising'}
-
-# 為替シナリオ定義
-FX_SCENARIOS = {
-    '📈 円安トレンド (米ドル価値 +1.0%/年)': 0.01,
-    '➡️ 為替横ばい (±0%/年)': 0.00,
-    '📉 緩やかな円高 (米ドル価値 -1.0%/年)': -0.01,
-    '⏬ 急速な円高 (米ドル価値 -2.5%/年)': -0.025,
-}
-
-# --- 関数定義 ---
-def get_rate_fluctuation(scenario, current_base_rate):
-    if scenario == 'fixed': return current_base_rate
-    elif scenario == 'stable': return current_base_rate + (np.random.random() - 0.45) * 0.05
-    elif scenario == 'rising': return current_base_rate + 0.05
-    elif scenario == 'sharp_rising': return current_base_rate + 0.20
-    return current_base_rate
-
-def get_cost(age, cost_list):
-    if 0 <= age < len(cost_list): return cost_list[age]
-    return 0
-
-def get_boarding_cost(age, is_boarding, cost_per_year):
-    if is_boarding and (18 <= age <= 21): return cost_per_year
-    return 0
-
-# --- サイドバー設定 ---
-st.sidebar.title("🛠️ 条件設定")
-
-# 1. お子様・教育
-st.sidebar.header("👶 1. お子様・教育プラン")
-col1, col2 = st.sidebar.columns(2)
-with col1:
-    c1_year = st.number_input("第1子 誕生年", value=2025, step=1)
-with col2:
-    c1_month = st.number_input("第1子 誕生月", value=2, min_value=1, max_value=12)
-c1_edu = st.sidebar.selectbox("第1子 教育コース", list(EDUCATION_COSTS.keys()), index=8) # 【I】小学校から私立
-c1_boarding = st.sidebar.checkbox("第1子 大学は下宿(仕送り)", value=False)
-
-has_child2 = st.sidebar.checkbox("第2子を含める", value=False)
-if has_child2:
-    col3, col4 = st.sidebar.columns(2)
-    with col3:
-        c2_year = st.number_input("第2子 誕生年", value=2028, step=1)
-    with col4:
-        c2_month = st.number_input("第2子 誕生月", value=4, min_value=1, max_value=12)
-    c2_edu = st.sidebar.selectbox("第2子 教育コース", list(EDUCATION_COSTS.keys()), index=0)
-    c2_boarding = st.sidebar.checkbox("第2子 大学は下宿(仕送り)", value=False)
-else:
-    c2_year, c2_month = None, None
-    c2_edu = None
-    c2_boarding = False
-
-if c1_boarding or c2_boarding:
-    boarding_cost_yearly = st.sidebar.number_input("年間仕送り額 (家賃+生活費)", value=150, step=10)
-else:
-    boarding_cost_yearly = 0
-
-# 2. 収入・生活費・定年
-st.sidebar.header("👛 2. 収入・定年設定")
-head_age = st.sidebar.number_input("世帯主 現在年齢", value=38, step=1) # 38歳
-income_preset_key = st.sidebar.selectbox("世帯主収入シナリオ", list(INCOME_PRESETS.keys()), index=1)
-income_preset = INCOME_PRESETS[income_preset_key]
-head_income_base = st.sidebar.number_input("世帯主 現在年収 (万円)", value=1050, step=10) # 1050万円
-head_income_growth = st.sidebar.number_input("世帯主 昇給率 (%/年)", value=income_preset['growth'], step=0.1)
-
-st.sidebar.markdown("##### 👴 定年・再雇用")
-retirement_age = st.sidebar.number_input("定年年齢", value=60, step=1)
-reemploy_ratio = st.sidebar.slider("再雇用時の年収掛目(%)", 30, 100, 60)
-retire_completely_age = st.sidebar.number_input("完全リタイア年齢", value=65, step=1)
-
-st.sidebar.markdown("##### 💴 年金")
-pension_start_age = st.sidebar.number_input("年金受給開始年齢", value=65, step=1)
-pension_amount = st.sidebar.number_input("世帯の年金受給額(年額)", value=240, step=10)
-
-st.sidebar.markdown("---")
-partner_income = st.sidebar.number_input("パートナー現在年収 (万円)", value=0, step=10)
-
-st.sidebar.markdown("---")
-living_preset_key = st.sidebar.selectbox("生活費 (住居費別)", list(LIVING_PRESETS.keys()), index=2) # ゆとり
-living_cost_base = st.sidebar.number_input("年間生活費 (万円)", value=LIVING_PRESETS[living_preset_key], step=10)
-fixed_cost_housing = st.sidebar.number_input("固定資産税・維持費 (年額)", value=19.2, step=0.1)
-inflation_key = st.sidebar.selectbox("物価上昇率", list(INFLATION_PRESETS.keys()), index=2)
-inflation_rate = INFLATION_PRESETS[inflation_key]
-
-# 3. 資産・運用
-st.sidebar.header("💰 3. 資産・ポートフォリオ")
-initial_cash = st.sidebar.number_input("現在の貯金 (万円)", value=330, step=10) # 330万円
-safety_net_val = st.sidebar.number_input("生活防衛資金 (万円)", value=300, step=10)
-st.sidebar.markdown("---")
-initial_invest_yen = st.sidebar.number_input("国内資産 (為替リスクなし)", value=360, step=10) # 360万円
-yield_yen = st.sidebar.number_input("国内資産 年利回り (%)", value=0.5, step=0.1)
-
-st.sidebar.markdown("##### 🌍 外国資産 (為替リスクあり)")
-st.caption("iDeCoもここに含んで計算します")
-fx_scenario_key = st.sidebar.selectbox("為替リスクシナリオ", list(FX_SCENARIOS.keys()))
-fx_change_rate = FX_SCENARIOS[fx_scenario_key]
-
-col_f1, col_f2 = st.sidebar.columns(2)
-with col_f1:
-    initial_foreign_cash = st.sidebar.number_input("外貨現預金 (万円)", value=58, step=10)
-    yield_foreign_cash = st.sidebar.number_input("外貨預金 利回り(%)", value=2.0, step=0.1)
-    
-    initial_foreign_bond = st.sidebar.number_input("外国債券 (万円)", value=406, step=10)
-    yield_foreign_bond = st.sidebar.number_input("外国債券 利回り(%)", value=3.0, step=0.1)
-
-with col_f2:
-    initial_foreign_stock = st.sidebar.number_input("外国投信・株 (万円)", value=1683, step=10)
-    yield_foreign_stock = st.sidebar.number_input("外国株 利回り(%)", value=5.0, step=0.1)
-
-    initial_ideco = st.sidebar.number_input("うちiDeCo残高 (万円)", value=190, step=10)
-    ideco_monthly = st.sidebar.number_input("iDeCo 毎月掛金 (万円)", value=3.0, step=0.1)
-    # iDeCoは外国株式相当として扱う
-    
-st.sidebar.markdown("---")
-invest_surplus = st.sidebar.checkbox("生活防衛資金を超える黒字を投資に回す", value=True)
-if invest_surplus:
-    foreign_allocation = st.sidebar.slider("黒字分の外国株式(リスク資産)への配分(%)", 0, 100, 100)
-else:
-    foreign_allocation = 0
-
-# 4. 住宅ローン (一番下へ移動)
-st.sidebar.header("🏠 4. 住宅ローン")
-mortgage_principal = st.sidebar.number_input("借入金額 (万円)", value=6460, step=100)
-col_m1, col_m2 = st.sidebar.columns(2)
-with col_m1:
-    mortgage_start_year = st.number_input("返済開始年", value=2024)
-with col_m2:
-    mortgage_end_year = st.number_input("完済予定年", value=2059)
-mortgage_base_rate = st.sidebar.number_input("基準金利 (%)", value=2.841, step=0.001, format="%.3f")
-mortgage_reduction_rate = st.sidebar.number_input("引下幅 (%)", value=2.057, step=0.001, format="%.3f")
-mortgage_rate_scenario = MORTGAGE_RATE_SCENARIOS[st.sidebar.selectbox("金利変動シナリオ", list(MORTGAGE_RATE_SCENARIOS.keys()))]
-
-
-# --- シミュレーション実行 ---
-start_year = 2025
-last_child_grad_year = c1_year + 23
-if has_child2: last_child_grad_year = max(last_child_grad_year, c2_year + 23)
-end_year = max(start_year + 45, last_child_grad_year) 
-years = list(range(start_year, end_year + 1))
-
-df = pd.DataFrame(index=years)
-df['西暦'] = df.index
-df['経過年数'] = df['西暦'] - start_year
-df['世帯主年齢'] = head_age + df['経過年数']
-df['第1子年齢'] = df['西暦'] - c1_year
-df['第2子年齢'] = (df['西暦'] - c2_year) if has_child2 else np.nan
-
-# 収入計算
-head_incomes = []
-pension_incomes = []
-peak_income = 0 
-for i, year in enumerate(years):
-    age = df['世帯主年齢'].iloc[i]
-    if age < retirement_age:
-        inc = head_income_base * (1 + head_income_growth / 100) ** i
-        head_incomes.append(inc)
-        peak_income = inc 
-    elif age < retire_completely_age:
-        inc = peak_income * (reemploy_ratio / 100)
-        head_incomes.append(inc)
-    else:
-        head_incomes.append(0)
-    if age >= pension_start_age:
-        pension_incomes.append(pension_amount)
-    else:
-        pension_incomes.append(0)
-df['世帯主労働収入'] = head_incomes
-df['年金収入'] = pension_incomes
-df['世帯収入'] = df['世帯主労働収入'] + partner_income + df['年金収入']
-
-# 支出
-df['教育費'] = df['第1子年齢'].apply(lambda x: get_cost(x, EDUCATION_COSTS[c1_edu]))
-if has_child2: df['教育費'] += df['第2子年齢'].apply(lambda x: get_cost(x, EDUCATION_COSTS[c2_edu]))
-df['養育費'] = df['第1子年齢'].apply(lambda x: get_cost(x, REARING_COSTS['【A】標準プラン']))
-if has_child2: df['養育費'] += df['第2子年齢'].apply(lambda x: get_cost(x, REARING_COSTS['【A】標準プラン']))
-df['仕送り'] = df['第1子年齢'].apply(lambda x: get_boarding_cost(x, c1_boarding, boarding_cost_yearly))
-if has_child2: df['仕送り'] += df['第2子年齢'].apply(lambda x: get_boarding_cost(x, c2_boarding, boarding_cost_yearly))
-df['生活費(インフレ込)'] = living_cost_base * (1 + inflation_rate) ** df['経過年数'] + fixed_cost_housing
-df['支出計(ローン除)'] = df['教育費'] + df['養育費'] + df['仕送り'] + df['生活費(インフレ込)']
-
-# 資産計算
-current_cash = initial_cash * 10000
-current_yen_asset = initial_invest_yen * 10000
-# 外国資産
-cur_f_cash = initial_foreign_cash * 10000
-cur_f_bond = initial_foreign_bond * 10000
-cur_f_stock = initial_foreign_stock * 10000
-cur_ideco = initial_ideco * 10000
-
-current_loan_balance = mortgage_principal * 10000
-current_base_rate = mortgage_base_rate
-safety_net_amount = safety_net_val * 10000
-
-# ローン初期計算
-months_before = max(0, (start_year - mortgage_start_year) * 12 + 3)
-monthly_r_init = (mortgage_base_rate - mortgage_reduction_rate) / 100 / 12
-if monthly_r_init < 0: monthly_r_init = 0
-total_months = (mortgage_end_year - mortgage_start_year) * 12
-for _ in range(months_before):
-    if current_loan_balance > 0:
-        interest = current_loan_balance * monthly_r_init
-        if total_months > 0:
-            if monthly_r_init > 0:
-                payment = (current_loan_balance * monthly_r_init * (1+monthly_r_init)**total_months) / ((1+monthly_r_init)**total_months - 1)
-            else:
-                payment = current_loan_balance / total_months
-            current_loan_balance -= (payment - interest)
-            total_months -= 1
-
-cash_hist, yen_hist, f_cash_hist, f_bond_hist, f_stock_hist, ideco_hist = [], [], [], [], [], []
-loan_hist, payment_hist, balance_hist = [], [], []
-bankrupt_year = None
-min_assets_val = float('inf')
-min_assets_year = start_year
-
-for i, year in enumerate(years):
-    # iDeCo積立 (60歳まで)
-    age = df['世帯主年齢'].iloc[i]
-    ideco_add = 0
-    if age < 60:
-        ideco_add = ideco_monthly * 10000 * 12
-    # iDeCo運用: 外国株並みの利回りと仮定 + 為替変動
-    ideco_growth_rate = (1 + yield_foreign_stock / 100) * (1 + fx_change_rate) - 1
-    ideco_gain = (cur_ideco + ideco_add / 2) * ideco_growth_rate
-    cur_ideco += ideco_add + ideco_gain
-    
-    # 住宅ローン
-    annual_payment = 0
-    if i > 0: current_base_rate = get_rate_fluctuation(mortgage_rate_scenario, current_base_rate)
-    applied_rate = max(0, current_base_rate - mortgage_reduction_rate)
-    monthly_r = applied_rate / 100 / 12
-    for _ in range(12):
-        if current_loan_balance <= 0: break
-        months_left = (mortgage_end_year - year) * 12
-        if months_left <= 0: months_left = 1
-        if monthly_r > 0:
-            p = (current_loan_balance * monthly_r * (1+monthly_r)**months_left) / ((1+monthly_r)**months_left - 1)
-        else:
-            p = current_loan_balance / months_left
-        interest = current_loan_balance * monthly_r
-        current_loan_balance -= (p - interest)
-        annual_payment += p
-    
-    # キャッシュフロー
-    income = df['世帯収入'].iloc[i] * 10000
-    spending = df['支出計(ローン除)'].iloc[i] * 10000 + annual_payment
-    cash_flow = income - spending - ideco_add
-    
-    # --- 資産運用 (成長) ---
-    current_yen_asset *= (1 + yield_yen / 100)
-    
-    # 外国資産成長 (利回り + 為替)
-    f_cash_growth = (1 + yield_foreign_cash / 100) * (1 + fx_change_rate) - 1
-    f_bond_growth = (1 + yield_foreign_bond / 100) * (1 + fx_change_rate) - 1
-    f_stock_growth = (1 + yield_foreign_stock / 100) * (1 + fx_change_rate) - 1
-    
-    cur_f_cash *= (1 + f_cash_growth)
-    cur_f_bond *= (1 + f_bond_growth)
-    cur_f_stock *= (1 + f_stock_growth)
-    
-    current_cash += cash_flow
-    
-    # --- 生活防衛資金ロジック ---
-    # 取り崩し順序: 外国現預金 -> 外国債券 -> 外国株 -> 国内資産 (リスク低い順に切り崩すか、流動性重視か。ここでは分散して取り崩すロジックは複雑なため、リスク資産(外国株)から取り崩す設定にするか、あるいは「投資全体」として扱うか。
-    # ここではシンプルに「外国株(投信)」を調整弁にする (NISA想定)
-    
-    if current_cash < safety_net_amount:
-        deficit = safety_net_amount - current_cash
-        # まず外国株から
-        if cur_f_stock >= deficit:
-            cur_f_stock -= deficit
-            current_cash += deficit
-        else:
-            # 外国株で足りなければ外国債券
-            deficit -= cur_f_stock
-            current_cash += cur_f_stock
-            cur_f_stock = 0
-            if cur_f_bond >= deficit:
-                cur_f_bond -= deficit
-                current_cash += deficit
-            else:
-                # 債券でも足りなければ国内資産
-                deficit -= cur_f_bond
-                current_cash += cur_f_bond
-                cur_f_bond = 0
-                if current_yen_asset >= deficit:
-                    current_yen_asset -= deficit
-                    current_cash += deficit
-                else:
-                    # 全て尽きた
-                    current_cash += current_yen_asset
-                    current_yen_asset = 0
-                    if current_cash < 0 and bankrupt_year is None:
-                        bankrupt_year = year
-                
-    elif current_cash > safety_net_amount and invest_surplus:
-        surplus = current_cash - safety_net_amount
-        current_cash = safety_net_amount
-        
-        # 外国株式へ配分
-        cur_f_stock += surplus * (foreign_allocation / 100.0)
-        # 残りは国内資産へ
-        current_yen_asset += surplus * (1 - foreign_allocation / 100.0)
-
-    total_assets = current_cash + current_yen_asset + cur_f_cash + cur_f_bond + cur_f_stock + cur_ideco
-    if total_assets < min_assets_val:
-        min_assets_val = total_assets
-        min_assets_year = year
-
-    cash_hist.append(current_cash / 10000)
-    yen_hist.append(current_yen_asset / 10000)
-    f_cash_hist.append(cur_f_cash / 10000)
-    f_bond_hist.append(cur_f_bond / 10000)
-    f_stock_hist.append(cur_f_stock / 10000)
-    ideco_hist.append(cur_ideco / 10000)
-    loan_hist.append(current_loan_balance / 10000)
-    payment_hist.append(annual_payment / 10000)
-    balance_hist.append((income - spending - ideco_add)/10000)
-
-df['貯金'] = cash_hist
-df['国内資産'] = yen_hist
-df['外国(現金)'] = f_cash_hist
-df['外国(債券)'] = f_bond_hist
-df['外国(株)'] = f_stock_hist
-df['iDeCo'] = ideco_hist
-df['ローン残高'] = loan_hist
-df['ローン返済'] = payment_hist
-df['年間収支'] = balance_hist
-df['総資産'] = df['貯金'] + df['国内資産'] + df['外国(現金)'] + df['外国(債券)'] + df['外国(株)'] + df['iDeCo']
-df['純資産'] = df['総資産'] - df['ローン残高']
-df['教育・養育・仕送り'] = df['教育費'] + df['養育費'] + df['仕送り']
-
-# --- 表示 ---
-st.title("将来家計シミュレーション 📊")
-st.markdown("ポートフォリオ詳細分析版")
-
-# KPI
-total_child_cost = df['教育・養育・仕送り'].sum()
-final_net_assets = df['純資産'].iloc[-1]
-min_assets_disp = df.loc[df['西暦'] == min_assets_year, '総資産'].values[0]
-
-col1, col2, col3 = st.columns(3)
-with col1:
-    st.metric("👶 教育・養育費の総額", f"{total_child_cost:,.0f} 万円", "仕送り含む" if (c1_boarding or c2_boarding) else "自宅通学")
-with col2:
-    if bankrupt_year:
-        st.error(f"⚠️ {bankrupt_year}年に資金ショート")
-    else:
-        is_safe = min_assets_disp > safety_net_val
-        color = "normal" if is_safe else "off"
-        st.metric("📉 最も家計が苦しくなる時期", f"{min_assets_year}年", f"残高 {min_assets_disp:,.0f} 万円", delta_color=color)
-with col3:
-    st.metric("👴 老後時点の純資産 (ローン完済後)", f"{final_net_assets:,.0f} 万円")
-
-# グラフ
-st.subheader("📈 資産推移シミュレーション")
-st.caption("マウスを合わせると、年齢と金額(万円)が確認できます。")
-
-fig = go.Figure()
-fig.add_trace(go.Scatter(x=df['西暦'], y=df['総資産'], name='<b>総資産</b>', line=dict(color='#2563eb', width=4), hovertemplate='%{y:,.0f}万円'))
-# 積み上げ (リスク高い順あるいは流動性順)
-fig.add_trace(go.Scatter(x=df['西暦'], y=df['外国(株)'], name='外国株・投信', line=dict(color='#059669', width=1), stackgroup='one', hovertemplate='%{y:,.0f}万円'))
-fig.add_trace(go.Scatter(x=df['西暦'], y=df['iDeCo'], name='iDeCo(外国株)', line=dict(color='#f59e0b', width=1), stackgroup='one', hovertemplate='%{y:,.0f}万円'))
-fig.add_trace(go.Scatter(x=df['西暦'], y=df['外国(債券)'], name='外国債券', line=dict(color='#34d399', width=1), stackgroup='one', hovertemplate='%{y:,.0f}万円'))
-fig.add_trace(go.Scatter(x=df['西暦'], y=df['外国(現金)'], name='外貨預金', line=dict(color='#6ee7b7', width=1), stackgroup='one', hovertemplate='%{y:,.0f}万円'))
-fig.add_trace(go.Scatter(x=df['西暦'], y=df['国内資産'], name='国内資産', line=dict(color='#93c5fd', width=1), stackgroup='one', hovertemplate='%{y:,.0f}万円'))
-fig.add_trace(go.Scatter(x=df['西暦'], y=df['貯金'], name='貯金(生活防衛)', line=dict(color='#bfdbfe', width=1), stackgroup='one', hovertemplate='%{y:,.0f}万円'))
-
-fig.add_trace(go.Scatter(x=df['西暦'], y=df['ローン残高'], name='ローン残高', line=dict(color='#ef4444', dash='dot', width=2), hovertemplate='%{y:,.0f}万円'))
-
-tick_vals = []
-tick_text = []
-for index, row in df.iterrows():
-    if (row['西暦'] - start_year) % 5 == 0:
-        tick_vals.append(row['西暦'])
-        tick_text.append(f"{row['西暦']}<br>(主{int(row['世帯主年齢'])}/子{int(row['第1子年齢'])})")
-
-fig.update_layout(
-    xaxis=dict(title="西暦 (世帯主年齢/第1子年齢)", tickmode='array', tickvals=tick_vals, ticktext=tick_text),
-    yaxis_title="金額 (万円)",
-    hovermode="x unified",
-    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-)
-st.plotly_chart(fig, use_container_width=True)
-
-# データテーブル
-with st.expander("詳細データを見る"):
-    display_cols = ['西暦', '世帯主年齢', '世帯収入', '年間収支', '総資産', '貯金', '国内資産', '外国(株)', '外国(債券)', 'iDeCo', 'ローン残高']
-    st.dataframe(df[display_cols].style.format("{:,.0f}"), use_container_width=True)
-
-# AI診断
-st.markdown("---")
-st.subheader("🤖 AIファイナンシャル・プランナー")
-user_api_key = st.text_input("Gemini APIキー (入力すると診断開始)", type="password")
-
-if st.button("投資・家計診断を実行する") and user_api_key:
-    try:
-        genai.configure(api_key=user_api_key)
-        model = genai.GenerativeModel('gemini-flash-latest')
-        
-        boarding_status = "なし"
-        if c1_boarding or c2_boarding: boarding_status = f"あり(年{boarding_cost_yearly}万)"
-        
-        # アセットアロケーション計算
-        total_now = initial_cash + initial_invest_yen + initial_foreign_cash + initial_foreign_bond + initial_foreign_stock + initial_ideco
-        ratio_stock = (initial_foreign_stock + initial_ideco) / total_now * 100
-        ratio_safe = (initial_cash + initial_invest_yen + initial_foreign_cash) / total_now * 100
-        
-        prompt = f"""
-        FPとして、以下のシミュレーション結果に基づき、投資戦略と家計へのアドバイスをお願いします。
-
-        # ユーザー属性
-        - 世帯主: {head_age}歳, 年収{head_income_base}万 (定年{retirement_age}歳)
-        - 子供: 第1子{c1_year}年生まれ({c1_edu})
-        
-        # 現在のポートフォリオ (総額 {total_now:,.0f}万円)
-        - 安全資産(現預金・国内等): {ratio_safe:.1f}%
-        - 外国債券: {(initial_foreign_bond/total_now*100):.1f}%
-        - 外国株式(株・投信・iDeCo): {ratio_stock:.1f}%
-        - 為替シナリオ: {fx_scenario_key}
-        
-        # 将来予測
-        - 最も苦しい時期: {min_assets_year}年 (資産残高 {min_assets_disp:,.0f}万円)
-        - 老後純資産: {final_net_assets:,.0f}万円
-        
-        # アドバイスのポイント
-        1. 現在のポートフォリオのリスク許容度適合性（38歳、子供ありの家庭として）
-        2. 教育費ピーク時におけるリスク資産取り崩しの可能性と対策
-        3. 為替リスクへの脆弱性と、今後の投資戦略（債券や国内資産の比率など）
-        
-        投資の観点を中心に、辛口かつ具体的に3点お願いします。
-        """
-        with st.spinner("AIがポートフォリオを分析中..."):
-            st.markdown(model.generate_content(prompt).text)
-    except Exception as e:
-        st.error(f"エラーが発生しました: {e}")
+import time
+_import_started = time.perf_counter()
+import streamlit as st
+import plotly.graph_objects as go
+import numpy as np
+from dataclasses import replace
+import os
+from simulation import (
+    EDUCATION_COSTS, INCOME_PRESETS, LIVING_PRESETS, INFLATION_PRESETS,
+    MORTGAGE_RATE_SCENARIOS, FX_SCENARIOS, DEFAULT_DRAWDOWN_ORDER, SimulationParams,
+)
+from montecarlo import MarketAssumptions
+from historical import find_returns
+from macro import FACTOR_LABELS, DEFAULT_CORRELATIONS, cholesky_factor
+from cache import RESULT_CACHE, MC_CACHE, params_key, cached_simulate_paths, cached_simulate_strategies, cached_optimize, cached_solve
+from pipeline import SIMULATION_PIPELINE, simulate_incremental
+from sweep import SWEEP_PARAMETERS, MAX_AXES, axis_values, cached_run_sweep, cached_tornado
+from solver import GOALS, search_range
+from strategy import STRATEGIES, Strategy
+from advisor import ADVICE_CACHE, DEFAULT_BACKEND, build_prompt, make_backend, request_diagnosis
+from charts import FIGURE_CACHE, asset_figure, cached_figure, fan_figure, frontier_figure, year_ticks
+from optimizer import SEARCH_SPACE
+from perf import PerfRecorder, record_startup, mark_first_render, startup
+# 2回目以降の rerun ではモジュールが読み込み済みなので、初回だけが起動時の import 時間になる
+record_startup('imports', time.perf_counter() - _import_started)
+
+# --- ページ設定 ---
+st.set_page_config(
+    page_title="将来家計シミュレーション (ポートフォリオ分析版)",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# モンテカルロのパス行列は全セッション共有のキャッシュに残るので float32 で持つ (万円で有効数字7桁)
+MC_DTYPE = np.float32
+
+# --- 処理時間の計測 (サーバー側で KAKEIKANRI_DEBUG=1 のときだけ有効。閲覧者からは切り替えられない) ---
+# KAKEIKANRI_PERF_LOG にファイル名を指定すると、計測結果をそこへ JSONL で追記する
+if "perf" not in st.session_state:
+    st.session_state["perf"] = PerfRecorder()
+perf = st.session_state["perf"]
+perf.enabled = os.environ.get("KAKEIKANRI_DEBUG") == "1"
+perf.log_path = os.environ.get("KAKEIKANRI_PERF_LOG") or None
+perf.start_run()
+
+# --- パスワード認証機能 ---
+def check_password():
+    if "password" not in st.secrets:
+        return True
+    def password_entered():
+        if st.session_state["password"] == st.secrets["password"]:
+            st.session_state["password_correct"] = True
+            del st.session_state["password"]
+        else:
+            st.session_state["password_correct"] = False
+    if "password_correct" not in st.session_state:
+        st.text_input("パスワードを入力してください", type="password", on_change=password_entered, key="password")
+        return False
+    elif not st.session_state["password_correct"]:
+        st.text_input("パスワードを入力してください", type="password", on_change=password_entered, key="password")
+        st.error("パスワードが間違っています")
+        return False
+    else:
+        return True
+
+if not check_password():
+    st.stop()
+
+# --- サイドバー設定 ---
+st.sidebar.title("🛠️ 条件設定")
+
+# 1. お子様・教育
+st.sidebar.header("👶 1. お子様・教育プラン")
+col1, col2 = st.sidebar.columns(2)
+with col1:
+    c1_year = st.number_input("第1子 誕生年", value=2025, step=1)
+with col2:
+    c1_month = st.number_input("第1子 誕生月", value=2, min_value=1, max_value=12)
+c1_edu = st.sidebar.selectbox("第1子 教育コース", list(EDUCATION_COSTS.keys()), index=8) # 【I】小学校から私立
+c1_boarding = st.sidebar.checkbox("第1子 大学は下宿(仕送り)", value=False)
+
+has_child2 = st.sidebar.checkbox("第2子を含める", value=False)
+if has_child2:
+    col3, col4 = st.sidebar.columns(2)
+    with col3:
+        c2_year = st.number_input("第2子 誕生年", value=2028, step=1)
+    with col4:
+        c2_month = st.number_input("第2子 誕生月", value=4, min_value=1, max_value=12)
+    c2_edu = st.sidebar.selectbox("第2子 教育コース", list(EDUCATION_COSTS.keys()), index=0)
+    c2_boarding = st.sidebar.checkbox("第2子 大学は下宿(仕送り)", value=False)
+else:
+    c2_year, c2_month = None, None
+    c2_edu = None
+    c2_boarding = False
+
+if c1_boarding or c2_boarding:
+    boarding_cost_yearly = st.sidebar.number_input("年間仕送り額 (家賃+生活費)", value=150, step=10)
+else:
+    boarding_cost_yearly = 0
+
+# 2. 収入・生活費・定年
+st.sidebar.header("👛 2. 収入・定年設定")
+head_age = st.sidebar.number_input("世帯主 現在年齢", value=38, step=1) # 38歳
+income_preset_key = st.sidebar.selectbox("世帯主収入シナリオ", list(INCOME_PRESETS.keys()), index=1)
+income_preset = INCOME_PRESETS[income_preset_key]
+head_income_base = st.sidebar.number_input("世帯主 現在年収 (万円)", value=1050, step=10) # 1050万円
+head_income_growth = st.sidebar.number_input("世帯主 昇給率 (%/年)", value=income_preset['growth'], step=0.1)
+
+st.sidebar.markdown("##### 👴 定年・再雇用")
+retirement_age = st.sidebar.number_input("定年年齢", value=60, step=1)
+reemploy_ratio = st.sidebar.slider("再雇用時の年収掛目(%)", 30, 100, 60)
+retire_completely_age = st.sidebar.number_input("完全リタイア年齢", value=65, step=1)
+
+st.sidebar.markdown("##### 💴 年金")
+pension_start_age = st.sidebar.number_input("年金受給開始年齢", value=65, step=1)
+pension_amount = st.sidebar.number_input("世帯の年金受給額(年額)", value=240, step=10)
+
+st.sidebar.markdown("---")
+partner_income = st.sidebar.number_input("パートナー現在年収 (万円)", value=0, step=10)
+
+st.sidebar.markdown("---")
+living_preset_key = st.sidebar.selectbox("生活費 (住居費別)", list(LIVING_PRESETS.keys()), index=2) # ゆとり
+living_cost_base = st.sidebar.number_input("年間生活費 (万円)", value=LIVING_PRESETS[living_preset_key], step=10)
+fixed_cost_housing = st.sidebar.number_input("固定資産税・維持費 (年額)", value=19.2, step=0.1)
+inflation_key = st.sidebar.selectbox("物価上昇率", list(INFLATION_PRESETS.keys()), index=2)
+inflation_rate = INFLATION_PRESETS[inflation_key]
+
+# 3. 資産・運用
+st.sidebar.header("💰 3. 資産・ポートフォリオ")
+initial_cash = st.sidebar.number_input("現在の貯金 (万円)", value=330, step=10) # 330万円
+safety_net_val = st.sidebar.number_input("生活防衛資金 (万円)", value=300, step=10)
+st.sidebar.markdown("---")
+initial_invest_yen = st.sidebar.number_input("国内資産 (為替リスクなし)", value=360, step=10) # 360万円
+yield_yen = st.sidebar.number_input("国内資産 年利回り (%)", value=0.5, step=0.1)
+
+st.sidebar.markdown("##### 🌍 外国資産 (為替リスクあり)")
+st.caption("iDeCoもここに含んで計算します")
+fx_scenario_key = st.sidebar.selectbox("為替リスクシナリオ", list(FX_SCENARIOS.keys()))
+fx_change_rate = FX_SCENARIOS[fx_scenario_key]
+
+col_f1, col_f2 = st.sidebar.columns(2)
+with col_f1:
+    initial_foreign_cash = st.sidebar.number_input("外貨現預金 (万円)", value=58, step=10)
+    yield_foreign_cash = st.sidebar.number_input("外貨預金 利回り(%)", value=2.0, step=0.1)
+    
+    initial_foreign_bond = st.sidebar.number_input("外国債券 (万円)", value=406, step=10)
+    yield_foreign_bond = st.sidebar.number_input("外国債券 利回り(%)", value=3.0, step=0.1)
+
+with col_f2:
+    initial_foreign_stock = st.sidebar.number_input("外国投信・株 (万円)", value=1683, step=10)
+    yield_foreign_stock = st.sidebar.number_input("外国株 利回り(%)", value=5.0, step=0.1)
+
+    initial_ideco = st.sidebar.number_input("うちiDeCo残高 (万円)", value=190, step=10)
+    ideco_monthly = st.sidebar.number_input("iDeCo 毎月掛金 (万円)", value=3.0, step=0.1)
+    # iDeCoは外国株式相当として扱う
+    
+st.sidebar.markdown("---")
+invest_surplus = st.sidebar.checkbox("生活防衛資金を超える黒字を投資に回す", value=True)
+if invest_surplus:
+    foreign_allocation = st.sidebar.slider("黒字分の外国株式(リスク資産)への配分(%)", 0, 100, 100)
+else:
+    foreign_allocation = 0
+monthly = st.sidebar.checkbox(
+    "月次で資金繰りを計算する", value=False,
+    help="賞与 (6・12月)・学費の納付 (4・10月)・年金 (偶数月) を月ごとに反映し、年度の途中で生活防衛資金を割った月に取り崩します。計算は年次の数倍かかります",
+)
+
+# 4. 住宅ローン (一番下へ移動)
+st.sidebar.header("🏠 4. 住宅ローン")
+mortgage_principal = st.sidebar.number_input("借入金額 (万円)", value=6460, step=100)
+col_m1, col_m2 = st.sidebar.columns(2)
+with col_m1:
+    mortgage_start_year = st.number_input("返済開始年", value=2024)
+with col_m2:
+    mortgage_end_year = st.number_input("完済予定年", value=2059)
+mortgage_base_rate = st.sidebar.number_input("基準金利 (%)", value=2.841, step=0.001, format="%.3f")
+mortgage_reduction_rate = st.sidebar.number_input("引下幅 (%)", value=2.057, step=0.001, format="%.3f")
+mortgage_rate_scenario = MORTGAGE_RATE_SCENARIOS[st.sidebar.selectbox("金利変動シナリオ", list(MORTGAGE_RATE_SCENARIOS.keys()))]
+
+# 5. モンテカルロ分析
+st.sidebar.header("🎲 5. モンテカルロ分析")
+mc_enabled = st.sidebar.checkbox("市場変動をランダムに試行する", value=False)
+if mc_enabled:
+    mc_paths = st.sidebar.selectbox("試行回数", [1000, 5000, 10000, 20000], index=2)
+    mc_seed = st.sidebar.number_input("乱数シード", value=0, step=1)
+    mc_history, mc_block_years = None, 5
+    try:
+        history = find_returns()
+    except (OSError, ValueError) as e:
+        history = None
+        st.sidebar.warning(f"実績データを読み込めませんでした: {e}")
+    if history is not None and st.sidebar.radio("市場の変動", ["正規分布", "過去の実績 (ブロック・ブートストラップ)"], horizontal=True) != "正規分布":
+        mc_history = history
+        mc_block_years = st.sidebar.number_input("ブロックの長さ (年)", value=5, min_value=1, max_value=20, step=1)
+        st.sidebar.caption(f"{history.start} から {history.n_years:g} 年分の実績を使います (利回りの設定は使いません)")
+    with st.sidebar.expander("変動の大きさ (年率・標準偏差)"):
+        market = MarketAssumptions(
+            vol_foreign_stock=st.number_input("外国株 (%)", value=18.0, step=1.0),
+            vol_foreign_bond=st.number_input("外国債券 (%)", value=6.0, step=0.5),
+            vol_foreign_cash=st.number_input("外貨預金 (%)", value=0.5, step=0.1),
+            vol_yen=st.number_input("国内資産 (%)", value=1.0, step=0.1),
+            vol_fx=st.number_input("為替 (%)", value=10.0, step=1.0),
+            vol_mortgage_rate=st.number_input("住宅ローン基準金利 (%pt/年)", value=0.15, step=0.05),
+        )
+    with st.sidebar.expander("物価・賃金の変動と相関"):
+        if st.checkbox("物価上昇率・昇給率も変動させる", value=False):
+            st.caption("生活費・教育費・養育費・仕送りは試行ごとの物価の推移に合わせて増えます")
+            market = replace(
+                market,
+                vol_inflation=st.number_input("物価上昇率 (%pt)", value=1.0, step=0.1, min_value=0.0),
+                inflation_persistence=st.slider("物価上昇率の持続性", 0.0, 0.95, 0.5, step=0.05),
+                vol_wage_growth=st.number_input("昇給率 (%pt)", value=1.0, step=0.1, min_value=0.0),
+            )
+            corr_rows = st.data_editor(
+                [{'因子1': FACTOR_LABELS[a], '因子2': FACTOR_LABELS[b], '相関係数': rho} for a, b, rho in DEFAULT_CORRELATIONS],
+                num_rows="dynamic", hide_index=True, key="mc_correlations",
+                column_config={
+                    '因子1': st.column_config.SelectboxColumn(options=list(FACTOR_LABELS.values()), required=True),
+                    '因子2': st.column_config.SelectboxColumn(options=list(FACTOR_LABELS.values()), required=True),
+                    '相関係数': st.column_config.NumberColumn(min_value=-1.0, max_value=1.0, step=0.05, required=True),
+                },
+            )
+            by_label = {label: name for name, label in FACTOR_LABELS.items()}
+            market = replace(market, correlations=tuple(
+                (by_label[row['因子1']], by_label[row['因子2']], float(row['相関係数']))
+                for row in corr_rows if row.get('因子1') and row.get('因子2') and row.get('相関係数') is not None
+            ))
+            try:
+                cholesky_factor(market.correlations)
+            except ValueError as e:
+                st.error(f"{e} (相関なしで計算します)")
+                market = replace(market, correlations=())
+
+# 6. 感度分析
+st.sidebar.header("📐 6. 感度分析")
+sweep_enabled = st.sidebar.checkbox("パラメータを振って比較する", value=False)
+sweep_ranges = {}
+if sweep_enabled:
+    sweep_names = st.sidebar.multiselect(
+        f"振るパラメータ (最大{MAX_AXES}個)", list(SWEEP_PARAMETERS.keys()),
+        default=['yield_foreign_stock', 'head_income_growth'], max_selections=MAX_AXES,
+        format_func=lambda name: SWEEP_PARAMETERS[name][0],
+    )
+    for name in sweep_names:
+        label, low, high = SWEEP_PARAMETERS[name]
+        col_s1, col_s2, col_s3 = st.sidebar.columns(3)
+        with col_s1:
+            low = st.number_input(f"{label} 下限", value=low, key=f"sweep_low_{name}")
+        with col_s2:
+            high = st.number_input(f"{label} 上限", value=high, key=f"sweep_high_{name}")
+        with col_s3:
+            steps = st.number_input(f"{label} 分割数", value=10, min_value=2, max_value=50, key=f"sweep_steps_{name}")
+        sweep_ranges[name] = (low, high, int(steps))
+
+# 7. 安全ラインの逆算
+st.sidebar.header("🎯 7. 安全ラインの逆算")
+solver_enabled = st.sidebar.checkbox("生活防衛資金を割らない限界を求める", value=False)
+if solver_enabled:
+    solver_goals = st.sidebar.multiselect("求める値", list(GOALS.keys()), default=list(GOALS.keys()), format_func=lambda name: GOALS[name].label)
+    solver_mc = st.sidebar.checkbox("モンテカルロの成功率で判定する", value=False)
+    if solver_mc:
+        solver_target = st.sidebar.slider("目標成功率 (%)", 50, 99, 90) / 100
+        solver_paths = st.sidebar.selectbox("判定に使う試行回数", [500, 1000, 2000], index=1)
+    else:
+        solver_target, solver_paths = 1.0, None
+
+# 8. 取り崩し・配分の戦略
+st.sidebar.header("🧭 8. 取り崩し・配分の戦略")
+strategy_enabled = st.sidebar.checkbox("戦略を並べて比較する", value=False)
+if strategy_enabled:
+    strategy_names = st.sidebar.multiselect("比較する戦略", list(STRATEGIES.keys()), default=list(STRATEGIES.keys()), format_func=lambda name: STRATEGIES[name].label)
+    strategies = [STRATEGIES[name] for name in strategy_names]
+    custom_order = st.sidebar.multiselect(
+        "自分で決めた取り崩し順 (選んだ順)", ['外国(株)', '外国(債券)', '国内資産', '外国(現金)', 'iDeCo'], default=[],
+        help="選ぶと、この順に取り崩す戦略を比較に加えます。iDeCo は60歳から取り崩せます",
+    )
+    if custom_order and tuple(custom_order) != DEFAULT_DRAWDOWN_ORDER:
+        strategies.append(Strategy("取り崩し順: " + " → ".join(custom_order), drawdown_order=tuple(custom_order)))
+
+# 9. 配分・生活防衛資金・iDeCo の最適化
+st.sidebar.header("🧮 9. 配分・生活防衛資金・iDeCo の最適化")
+optimize_enabled = st.sidebar.checkbox("最適な組み合わせを探す", value=False)
+if optimize_enabled:
+    optimize_target = st.sidebar.slider("許容する資金ショート確率 (%)", 0, 50, 5) / 100
+    optimize_paths = st.sidebar.selectbox("評価に使う試行回数", [500, 1000, 2000], index=1)
+    optimize_ranges = {}
+    for name, (label, low, high, steps) in SEARCH_SPACE.items():
+        step = 1.0 if high > 10 else 0.1
+        low, high = st.sidebar.slider(f"{label} の範囲", float(low), float(high), (float(low), float(high)), step=step, key=f"opt_range_{name}")
+        steps = st.sidebar.number_input(f"{label} の分割数", value=steps, min_value=1, max_value=20, step=1, key=f"opt_steps_{name}")
+        optimize_ranges[name] = (low, high, int(steps))
+perf.lap('widgets')
+
+
+# --- シミュレーション実行 ---
+params = SimulationParams(
+    c1_year=c1_year, c1_month=c1_month, c1_edu=c1_edu, c1_boarding=c1_boarding,
+    has_child2=has_child2, c2_year=c2_year, c2_month=c2_month, c2_edu=c2_edu, c2_boarding=c2_boarding,
+    boarding_cost_yearly=boarding_cost_yearly,
+    head_age=head_age, head_income_base=head_income_base, head_income_growth=head_income_growth,
+    retirement_age=retirement_age, reemploy_ratio=reemploy_ratio, retire_completely_age=retire_completely_age,
+    pension_start_age=pension_start_age, pension_amount=pension_amount, partner_income=partner_income,
+    living_cost_base=living_cost_base, fixed_cost_housing=fixed_cost_housing, inflation_rate=inflation_rate,
+    initial_cash=initial_cash, safety_net_val=safety_net_val,
+    initial_invest_yen=initial_invest_yen, yield_yen=yield_yen, fx_change_rate=fx_change_rate,
+    initial_foreign_cash=initial_foreign_cash, yield_foreign_cash=yield_foreign_cash,
+    initial_foreign_bond=initial_foreign_bond, yield_foreign_bond=yield_foreign_bond,
+    initial_foreign_stock=initial_foreign_stock, yield_foreign_stock=yield_foreign_stock,
+    initial_ideco=initial_ideco, ideco_monthly=ideco_monthly,
+    invest_surplus=invest_surplus, foreign_allocation=foreign_allocation,
+    monthly=monthly,
+    mortgage_principal=mortgage_principal, mortgage_start_year=mortgage_start_year, mortgage_end_year=mortgage_end_year,
+    mortgage_base_rate=mortgage_base_rate, mortgage_reduction_rate=mortgage_reduction_rate,
+    mortgage_rate_scenario=mortgage_rate_scenario,
+)
+# 同じ条件の結果はセッションをまたいで再利用し、変更のあったステージだけを再計算する
+result = simulate_incremental(params)
+bankrupt_year = result.bankrupt_year
+min_assets_year = result.min_assets_year
+perf.lap('simulate')
+
+# --- 表示 ---
+st.title("将来家計シミュレーション 📊")
+st.markdown("ポートフォリオ詳細分析版")
+
+# KPI
+total_child_cost = result.total_child_cost
+final_net_assets = result.final_net_assets
+min_assets_disp = result.min_assets_disp
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.metric("👶 教育・養育費の総額", f"{total_child_cost:,.0f} 万円", "仕送り含む" if (c1_boarding or c2_boarding) else "自宅通学")
+with col2:
+    if bankrupt_year:
+        st.error(f"⚠️ {bankrupt_year}年に資金ショート")
+    else:
+        is_safe = min_assets_disp > safety_net_val
+        color = "normal" if is_safe else "off"
+        st.metric("📉 最も家計が苦しくなる時期", f"{min_assets_year}年", f"残高 {min_assets_disp:,.0f} 万円", delta_color=color)
+with col3:
+    st.metric("👴 老後時点の純資産 (ローン完済後)", f"{final_net_assets:,.0f} 万円")
+
+# グラフ
+st.subheader("📈 資産推移シミュレーション")
+st.caption("マウスを合わせると、年齢と金額(万円)が確認できます。")
+
+perf.lap('kpi')
+
+# 図は結果 (= 入力条件) が変わったときだけ組み立て直す
+tick_vals, tick_text = ticks = year_ticks(result.columns)
+perf.lap('chart_ticks')
+fig = cached_figure(params_key('figure/assets', params), lambda: asset_figure(result, ticks))
+perf.lap('chart_figure')
+st.plotly_chart(fig, use_container_width=True)
+perf.lap('chart_render')
+
+# モンテカルロ分析
+if mc_enabled:
+    st.subheader("🎲 モンテカルロ分析")
+    mc = cached_simulate_paths(params, n_paths=mc_paths, seed=int(mc_seed), assumptions=market, history=mc_history, block_years=int(mc_block_years), dtype=MC_DTYPE)
+    final_p5, final_p50 = np.percentile(mc.net_assets[:, -1], (5, 50))
+
+    col_mc1, col_mc2, col_mc3 = st.columns(3)
+    with col_mc1:
+        st.metric("⚠️ 資金ショート確率", f"{mc.bankruptcy_probability * 100:.1f} %", f"{mc.n_paths:,} 回試行", delta_color="off")
+    with col_mc2:
+        st.metric("👴 老後純資産 (中央値 P50)", f"{final_p50:,.0f} 万円")
+    with col_mc3:
+        st.metric("📉 老後純資産 (下位5% P5)", f"{final_p5:,.0f} 万円")
+
+    st.caption("濃い帯は P25〜P75、薄い帯は P5〜P95。細線は最終年の順位が等間隔の代表パスです。")
+    mc_key = params_key('figure/monte_carlo', params, mc_paths, int(mc_seed), market, mc_history.fingerprint if mc_history is not None else None, int(mc_block_years))
+    fig_mc = cached_figure(mc_key, lambda: fan_figure(mc.years, (('総資産', mc.total_assets, '#2563eb'), ('純資産', mc.net_assets, '#059669')), ticks))
+    st.plotly_chart(fig_mc, use_container_width=True)
+    perf.lap('monte_carlo')
+
+# 感度分析
+if sweep_enabled and sweep_ranges:
+    st.subheader("📐 感度分析")
+    st.caption("他の条件は現在の設定のまま、選んだパラメータだけを振ったときの結果です。")
+
+    # トルネード図: 各パラメータを下限・上限に振ったときの老後純資産
+    base_final, tornado_rows = cached_tornado(params, {name: (low, high) for name, (low, high, _) in sweep_ranges.items()})
+    tornado_labels = [SWEEP_PARAMETERS[r['name']][0] for r in tornado_rows][::-1]
+    fig_tornado = go.Figure()
+    fig_tornado.add_trace(go.Bar(y=tornado_labels, x=[r['low_final_net'] - base_final for r in tornado_rows][::-1], base=base_final, orientation='h', name='下限', marker_color='#ef4444', customdata=[r['low'] for r in tornado_rows][::-1], hovertemplate='値 %{customdata}<br>%{x:,.0f}万円'))
+    fig_tornado.add_trace(go.Bar(y=tornado_labels, x=[r['high_final_net'] - base_final for r in tornado_rows][::-1], base=base_final, orientation='h', name='上限', marker_color='#2563eb', customdata=[r['high'] for r in tornado_rows][::-1], hovertemplate='値 %{customdata}<br>%{x:,.0f}万円'))
+    fig_tornado.add_vline(x=base_final, line_dash='dot', line_color='#6b7280')
+    fig_tornado.update_layout(barmode='overlay', xaxis_title="老後時点の純資産 (万円)", legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1))
+    st.plotly_chart(fig_tornado, use_container_width=True)
+
+    # ヒートマップ: 最初の2軸 (3軸目はスライダーで断面を選ぶ)
+    sweep = cached_run_sweep(params, {name: axis_values(name, low, high, steps) for name, (low, high, steps) in sweep_ranges.items()})
+    axis_names = list(sweep.axes)
+    if len(axis_names) >= 2:
+        sl = (slice(None), slice(None))
+        if len(axis_names) == 3:
+            third = sweep.axes[axis_names[2]]
+            k = st.select_slider(SWEEP_PARAMETERS[axis_names[2]][0], options=list(range(len(third))), value=len(third) // 2, format_func=lambda i: f"{third[i]:g}")
+            sl = (slice(None), slice(None), k)
+        x_vals, y_vals = sweep.axes[axis_names[1]], sweep.axes[axis_names[0]]
+        tab_net, tab_min, tab_bankrupt = st.tabs(["老後純資産", "最も苦しい年", "資金ショート年"])
+        for tab, values, title, colorscale in (
+            (tab_net, sweep.final_net_assets[sl], "万円", 'RdYlGn'),
+            (tab_min, sweep.min_assets_year[sl], "年", 'Viridis'),
+            (tab_bankrupt, sweep.bankrupt_year[sl], "年 (空欄はショートなし)", 'Reds_r'),
+        ):
+            with tab:
+                fig_heat = go.Figure(go.Heatmap(z=values, x=x_vals, y=y_vals, colorscale=colorscale, colorbar=dict(title=title), hovertemplate='%{y:g} / %{x:g}<br>%{z:,.0f}<extra></extra>'))
+                fig_heat.update_layout(xaxis_title=SWEEP_PARAMETERS[axis_names[1]][0], yaxis_title=SWEEP_PARAMETERS[axis_names[0]][0])
+                st.plotly_chart(fig_heat, use_container_width=True)
+    st.caption(f"資金ショートする組み合わせ: {sweep.bankrupt.mean() * 100:.1f} % ({sweep.bankrupt.size:,} 通り中)")
+    perf.lap('sweep')
+
+# 安全ラインの逆算
+if solver_enabled and solver_goals:
+    st.subheader("🎯 安全ラインの逆算")
+    if solver_paths:
+        st.caption(f"{solver_paths:,} 回の市場シナリオのうち {solver_target * 100:.0f}% 以上で生活防衛資金 ({safety_net_val:,} 万円) を最後まで維持できる限界です。")
+        solver_market = market if mc_enabled else MarketAssumptions()
+        solver_seed = int(mc_seed) if mc_enabled else 0
+    else:
+        st.caption(f"現在の前提のまま、生活防衛資金 ({safety_net_val:,} 万円) を最後まで維持できる限界です。")
+        solver_market, solver_seed = MarketAssumptions(), 0
+    solver_cols = st.columns(len(solver_goals))
+    for col, name in zip(solver_cols, solver_goals):
+        goal = GOALS[name]
+        res = cached_solve(params, goal, target_success=solver_target, n_paths=solver_paths, seed=solver_seed, assumptions=solver_market)
+        current = getattr(params, goal.field)
+        with col:
+            if res.value is None:
+                low, high = search_range(goal, params)
+                st.metric(goal.label, "該当なし", f"{low:g}〜{high:g} の範囲では条件を満たしません", delta_color="off")
+            else:
+                suffix = " 以上" if res.bounded and goal.feasible_side == 'low' else (" 以下" if res.bounded else "")
+                st.metric(goal.label, f"{res.value:,.0f}{suffix}", f"現在 {current:,.0f} との差 {res.value - current:+,.0f}", delta_color="normal" if goal.feasible_side == 'low' else "inverse")
+    perf.lap('solver')
+
+# 取り崩し・配分の戦略
+if strategy_enabled and strategies:
+    st.subheader("🧭 取り崩し・配分の戦略比較")
+    if mc_enabled:
+        st.caption(f"全戦略を同じ {mc_paths:,} 回の市場シナリオで計算しています。")
+        strategy_results = cached_simulate_strategies(params, strategies, mc_paths, int(mc_seed), market, mc_history, int(mc_block_years))
+    else:
+        st.caption("現在の前提 (利回り・為替は固定) のまま、取り崩し方と配分だけを変えた結果です。")
+        strategy_results = cached_simulate_strategies(params, strategies)
+    if monthly:
+        st.caption("戦略の比較は年次で計算しています (月次の計算は現行の取り崩し順のみ対応)。")
+    fig_strategy = go.Figure()
+    strategy_rows = []
+    for s, res in zip(strategies, strategy_results):
+        net = np.median(res.net_assets, axis=0) if mc_enabled else res.net_assets[0]
+        fig_strategy.add_trace(go.Scatter(x=res.years, y=net, name=s.label, hovertemplate='%{y:,.0f}万円'))
+        row = {'戦略': s.label, '老後純資産 (万円)': net[-1]}
+        if mc_enabled:
+            row['資金ショート確率 (%)'] = res.bankruptcy_probability * 100
+            row['生活防衛資金を割る確率 (%)'] = (res.shortfall_idx >= 0).mean() * 100
+        else:
+            row['資金ショート'] = f"{res.years[res.bankrupt_idx[0]]}年" if res.bankrupt_idx[0] >= 0 else "なし"
+            row['生活防衛資金を割る'] = f"{res.years[res.shortfall_idx[0]]}年" if res.shortfall_idx[0] >= 0 else "なし"
+        if res.spending_cut is not None:
+            row['削った生活費 (万円)'] = res.spending_cut.sum(axis=1).mean()
+        strategy_rows.append(row)
+    fig_strategy.update_layout(
+        xaxis=dict(title="西暦 (世帯主年齢/第1子年齢)", tickmode='array', tickvals=tick_vals, ticktext=tick_text),
+        yaxis_title="純資産 (万円)" + (" 中央値" if mc_enabled else ""),
+        hovermode="x unified",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+    )
+    st.plotly_chart(fig_strategy, use_container_width=True)
+    st.dataframe(strategy_rows, hide_index=True, use_container_width=True,
+                 column_config={k: st.column_config.NumberColumn(format="%.0f") for k in ('老後純資産 (万円)', '削った生活費 (万円)')})
+    perf.lap('strategies')
+
+# 配分・生活防衛資金・iDeCo の最適化
+if optimize_enabled:
+    st.subheader("🧮 配分・生活防衛資金・iDeCo の最適化")
+    optimize_market = market if mc_enabled else MarketAssumptions()
+    optimize_seed = int(mc_seed) if mc_enabled else 0
+    optimize_history, optimize_block_years = (mc_history, int(mc_block_years)) if mc_enabled else (None, 5)
+    opt = cached_optimize(params, optimize_ranges, optimize_target, optimize_paths, optimize_seed, optimize_market, optimize_history, optimize_block_years)
+    best, now = opt.candidate(opt.best), opt.candidate(opt.current)
+    st.caption(f"{len(opt.median_final_net):,} 通りの組み合わせを、同じ {opt.n_paths:,} 回の市場シナリオで評価しました。"
+               + ("" if opt.feasible.any() else " 許容する資金ショート確率を満たす組み合わせがないため、最も安全な組み合わせを表示しています。"))
+    opt_cols = st.columns(len(best) + 1)
+    for col, name in zip(opt_cols, best):
+        with col:
+            st.metric(SEARCH_SPACE[name][0], f"{best[name]:g}", f"現在 {now[name]:g} との差 {best[name] - now[name]:+g}", delta_color="off")
+    with opt_cols[-1]:
+        st.metric("老後純資産の中央値", f"{opt.median_final_net[opt.best]:,.0f} 万円",
+                  f"資金ショート {opt.bankruptcy_probability[opt.best] * 100:.1f}% (現在 {opt.bankruptcy_probability[opt.current] * 100:.1f}%)", delta_color="off")
+    optimize_labels = {name: label for name, (label, *_) in SEARCH_SPACE.items()}
+    opt_key = params_key('figure/frontier', params, optimize_ranges, optimize_target, optimize_paths, optimize_seed, optimize_market,
+                         (optimize_history.fingerprint, optimize_block_years) if optimize_history is not None else None)
+    st.plotly_chart(cached_figure(opt_key, lambda: frontier_figure(opt, optimize_labels)), use_container_width=True)
+    st.dataframe([{**{optimize_labels[k]: v for k, v in opt.candidate(i).items()},
+                   '資金ショート確率 (%)': opt.bankruptcy_probability[i] * 100,
+                   '老後純資産 中央値 (万円)': opt.median_final_net[i],
+                   '老後純資産 P5 (万円)': opt.p5_final_net[i],
+                   '生活防衛資金を割る確率 (%)': opt.shortfall_probability[i] * 100} for i in opt.frontier],
+                 hide_index=True, use_container_width=True,
+                 column_config={k: st.column_config.NumberColumn(format="%.1f" if '%' in k else "%.0f")
+                                for k in ('資金ショート確率 (%)', '老後純資産 中央値 (万円)', '老後純資産 P5 (万円)', '生活防衛資金を割る確率 (%)')})
+    perf.lap('optimize')
+
+# データテーブル (DataFrame は開いたときだけ作る)
+with st.expander("詳細データを見る", key="detail_table", on_change="rerun") as detail_table:
+    if detail_table.open:
+        display_cols = ['西暦', '世帯主年齢', '世帯収入', '年間収支', '総資産', '貯金', '国内資産', '外国(株)', '外国(債券)', 'iDeCo', 'ローン残高']
+        if monthly:
+            display_cols.insert(display_cols.index('貯金') + 1, '年内最低貯金')
+        # Styler (jinja2) を使わず、列の表示形式で桁区切りにする
+        st.dataframe(result.to_frame(display_cols).round(0), use_container_width=True, column_config={
+            col: st.column_config.NumberColumn(format="%d" if col in ('西暦', '世帯主年齢') else "localized") for col in display_cols
+        })
+    # Parquet はボタンが押されたときに作る (全列を Arrow 経由でコピーせずに書き出す)
+    st.download_button("全列を Parquet でダウンロード", data=lambda: result.to_parquet(), file_name="kakeikanri.parquet",
+                       mime="application/vnd.apache.parquet", on_click="ignore")
+perf.lap('table')
+
+# AI診断
+st.markdown("---")
+st.subheader("🤖 AIファイナンシャル・プランナー")
+if DEFAULT_BACKEND == 'gemini':
+    user_api_key = st.text_input("Gemini APIキー (入力すると診断開始)", type="password")
+else:
+    user_api_key = None
+    st.caption(f"AI バックエンド: {DEFAULT_BACKEND} (オフライン用)")
+ai_prompt = build_prompt(params, result, fx_scenario_key)
+if st.button("投資・家計診断を実行する") and (user_api_key or DEFAULT_BACKEND != 'gemini'):
+    # 生成はバックグラウンドで始まり、ここではすぐ戻る。同じ条件なら前回の応答を使う
+    st.session_state["ai_job"] = (request_diagnosis(ai_prompt, make_backend(DEFAULT_BACKEND, user_api_key)), ai_prompt)
+ai_box = st.container()
+perf.lap('ai')
+mark_first_render()
+
+# --- パフォーマンス (デバッグ時のみ) ---
+if perf.enabled:
+    with st.sidebar.expander("⏱️ パフォーマンス", expanded=True):
+        if perf.log_path:
+            st.caption(f"計測結果を {perf.log_path} に追記しています")
+        perf.finish_run(params_key=params_key(params), startup=startup)
+        summary = perf.summary()
+        st.caption(f"起動から最初の表示まで {startup['first_render']:.2f} 秒 (うち import {startup['imports']:.2f} 秒)")
+        st.caption(f"直近 {len(perf.history)} 回の再実行 (ミリ秒)")
+        st.dataframe(
+            [{'処理': name, '今回': row['last'], 'P50': row['p50'], 'P90': row['p90'], 'P99': row['p99'], '回数': row['n']} for name, row in summary.items()],
+            hide_index=True, use_container_width=True,
+            column_config={k: st.column_config.NumberColumn(format="%.1f") for k in ('今回', 'P50', 'P90', 'P99')},
+        )
+        caches = {'結果': RESULT_CACHE.stats(), 'モンテカルロ': MC_CACHE.stats(), 'AI診断': ADVICE_CACHE.stats(), 'グラフ': FIGURE_CACHE.stats()}
+        caches.update({f'ステージ: {name}': stats for name, stats in SIMULATION_PIPELINE.stats().items()})
+        st.caption("キャッシュのヒット率")
+        st.dataframe(
+            [{'キャッシュ': name, 'ヒット率': f"{c['hit_rate'] * 100:.0f}%", 'ヒット': c['hits'], 'ミス': c['misses'], '件数': c['size']} for name, c in caches.items()],
+            hide_index=True, use_container_width=True,
+        )
+
+# AI診断の表示。ページの他の部分を描いた後で、届いた分から順に表示する
+if "ai_job" in st.session_state:
+    ai_job, job_prompt = st.session_state["ai_job"]
+    with ai_box:
+        if job_prompt != ai_prompt:
+            st.caption("条件が変わっています。以下は前回の条件での診断です。")
+        try:
+            if ai_job.done and ai_job.error is None:
+                st.markdown(ai_job.text)
+            else:
+                with st.spinner("AIがポートフォリオを分析中..."):
+                    st.write_stream(ai_job.follow(timeout=120))
+        except Exception as e:
+            st.error(f"エラーが発生しました: {e}")
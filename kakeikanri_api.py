@@ -0,0 +1,319 @@
+"""家計シミュレーションを他のツールから使うためのローカル JSON API。
+
+    python kakeikanri_api.py --port 8765 --workers 2
+    curl -s localhost:8765/simulate -d '{"head_income_base": 700}'
+    curl -s localhost:8765/simulate -d '{"scenarios": [{"scenario_id": "a"}, {"c1_year": 2027}], "columns": ["西暦", "総資産"]}'
+    curl -s localhost:8765/stats
+
+POST /simulate は1件のパラメータ (SimulationParams のフィールド名) か、"scenarios" に
+複数件を受け取り、シナリオごとに年次の列と KPI を返す。"columns" で返す列を選べる
+("all" なら全列)。同時に届いたリクエストのシナリオは数ミリ秒まとめてから
+simulate_batch で一括計算し、結果は RESULT_CACHE に入れる。キャッシュはプロセスごとなので、
+API サーバーは画面 (Streamlit) とは別のキャッシュを持ち、計算結果は共有しない。
+GET /stats はリクエストの所要時間 (p50/p99)・バッチの大きさ・キャッシュの状況を返す。
+外部のサービスには接続せず、127.0.0.1 でだけ待ち受ける。
+"""
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from simulation import SimulationParams
+from pipeline import simulate_batch
+from cache import RESULT_CACHE, params_key
+
+HOST = '127.0.0.1'
+# 列を指定しないときに返す列 (画面の詳細データと同じ)
+DEFAULT_COLUMNS = ['西暦', '世帯主年齢', '世帯収入', '年間収支', '総資産', '純資産', '貯金', '国内資産',
+                   '外国(株)', '外国(債券)', 'iDeCo', 'ローン残高']
+# 1リクエストで受け付けるシナリオ数の上限
+MAX_SCENARIOS = 10000
+
+
+class RequestError(ValueError):
+    """クライアントの入力の誤り (400 で返す)。"""
+
+
+# --- まとめて計算する ---
+class SimulationBatcher:
+    """届いたシナリオをキューに溜め、空いたワーカーが溜まっている分をまとめて計算する。
+
+    ワーカーが全部ふさがっている間に届いたシナリオは次のバッチに入るので、混むほど
+    バッチが大きくなる。空いているときも max_wait 秒だけ後続を待ってからまとめる。
+    ワーカーはスレッドなので、結果は同じプロセスの RESULT_CACHE で共有される。
+    """
+
+    def __init__(self, workers=2, max_batch=512, max_wait=0.005):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.batched_scenarios = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(workers)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-batch')
+        threading.Thread(target=self._collect, name='api-collector', daemon=True).start()
+
+    def submit(self, params):
+        """1シナリオを計算に回し、SimulationResult を返す Future を返す (キャッシュ済みならすぐ完了する)。"""
+        future = Future()
+        key = params_key('simulate', params)
+        result = RESULT_CACHE.get(key)
+        if result is not None:
+            future.set_result(result)
+        else:
+            self._queue.put((key, params, future))
+        return future
+
+    def _collect(self):
+        while True:
+            self._slots.acquire()  # 空いたワーカーができてからキューを見る
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(items) < self.max_batch:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        items.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+            self._pool.submit(self._run, items)
+
+    def _run(self, items):
+        try:
+            # 同じパラメータは1回だけ計算する
+            unique = {}
+            for key, params, _ in items:
+                unique.setdefault(key, params)
+            try:
+                results = self._simulate(unique)
+            except Exception:
+                # 計算できないシナリオが混ざっていても他のリクエストを巻き込まないよう、1件ずつ計算し直す
+                results = {}
+                for key, params in unique.items():
+                    try:
+                        results.update(self._simulate({key: params}))
+                    except Exception as e:
+                        results[key] = e
+            with self._lock:
+                self.batches += 1
+                self.batched_scenarios += len(unique)
+            for key, _, future in items:
+                if isinstance(results[key], Exception):
+                    future.set_exception(results[key])
+                else:
+                    future.set_result(results[key])
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _simulate(unique):
+        # {キー: パラメータ} -> {キー: SimulationResult}。結果は RESULT_CACHE にも入れる
+        keys = list(unique)
+        results = {}
+        for batch in simulate_batch(list(unique.values())):
+            for j, i in enumerate(batch.index):
+                results[keys[i]] = result = batch.result(j)
+                RESULT_CACHE.put(keys[i], result)
+        return results
+
+
+# --- 所要時間の記録 ---
+class LatencyStats:
+    def __init__(self, history=10000):
+        self.requests = 0
+        self.scenarios = 0
+        self._times = deque(maxlen=history)  # 直近のリクエストの所要時間 (秒)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, scenarios):
+        with self._lock:
+            self._times.append(seconds)
+            self.requests += 1
+            self.scenarios += scenarios
+
+    def summary(self, q=(50, 90, 99)):
+        # ミリ秒
+        with self._lock:
+            values = np.array(self._times) * 1000
+            out = {'requests': self.requests, 'scenarios': self.scenarios, 'n': len(values)}
+        if len(values):
+            out.update({f'p{p}_ms': float(v) for p, v in zip(q, np.percentile(values, q))})
+            out['max_ms'] = float(values.max())
+        return out
+
+
+# --- リクエストと応答 ---
+def parse_request(body):
+    """JSON の本文 -> (シナリオ ID, SimulationParams) の並びと、返す列名 (None なら全列)。"""
+    try:
+        payload = json.loads(body or b'{}')
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise RequestError(f"JSON として読めません: {e}") from None
+    columns = DEFAULT_COLUMNS
+    if isinstance(payload, dict) and 'scenarios' in payload:
+        columns = payload.get('columns', DEFAULT_COLUMNS)
+        records = payload['scenarios']
+    elif isinstance(payload, list):
+        records = payload
+    else:
+        records = [payload]
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise RequestError("シナリオはオブジェクト (またはその配列) で指定してください")
+    if not 0 < len(records) <= MAX_SCENARIOS:
+        raise RequestError(f"シナリオは 1〜{MAX_SCENARIOS} 件で指定してください")
+    if columns == 'all':
+        columns = None
+    elif not isinstance(columns, list):
+        raise RequestError('"columns" は列名の配列か "all" で指定してください')
+
+    scenarios = []
+    for i, record in enumerate(records):
+        record = dict(record)
+        scenario_id = record.pop('scenario_id', None)
+        try:
+            params = SimulationParams.from_dict(record)
+        except ValueError as e:
+            raise RequestError(f"{i} 件目: {e}") from None
+        scenarios.append((str(i) if scenario_id in (None, '') else str(scenario_id), params))
+    return scenarios, columns
+
+
+def _json_values(values):
+    # NaN (第2子なしの年齢など) は null にする
+    values = np.asarray(values)
+    if values.dtype.kind == 'f' and np.isnan(values).any():
+        return np.where(np.isnan(values), None, values).tolist()
+    return values.tolist()
+
+def result_payload(scenario_id, result, columns):
+    # そのシナリオに無い列 (年次計算の '年内最低貯金' など) は省く
+    names = list(result.columns) if columns is None else [name for name in columns if name in result.columns]
+    return {
+        'scenario_id': scenario_id,
+        'kpi': {
+            'bankrupt_year': result.bankrupt_year,
+            'shortfall_year': result.shortfall_year,
+            'min_assets_year': result.min_assets_year,
+            'min_assets': result.min_assets_disp,
+            'final_net_assets': result.final_net_assets,
+            'total_child_cost': result.total_child_cost,
+        },
+        'series': {name: _json_values(result.columns[name]) for name in names},
+    }
+
+
+def make_handler(batcher, stats, timeout=60):
+    class Handler(BaseHTTPRequestHandler):
+        server_version = 'kakeikanri-api'
+        verbose = False
+
+        def _send(self, status, payload):
+            data = json.dumps(payload, ensure_ascii=False, allow_nan=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send(200, {'status': 'ok'})
+            elif self.path == '/stats':
+                self._send(200, {
+                    'latency': stats.summary(),
+                    'batches': batcher.batches,
+                    'mean_batch_size': batcher.batched_scenarios / batcher.batches if batcher.batches else 0.0,
+                    'cache': RESULT_CACHE.stats(),
+                })
+            else:
+                self._send(404, {'error': f"{self.path} はありません"})
+
+        def do_POST(self):
+            if self.path != '/simulate':
+                self._send(404, {'error': f"{self.path} はありません"})
+                return
+            started = time.perf_counter()
+            try:
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    raise RequestError("Content-Length が正しくありません")
+                scenarios, columns = parse_request(self.rfile.read(length))
+                futures = [batcher.submit(params) for _, params in scenarios]
+                results = [f.result(timeout) for f in futures]
+                unknown = sorted(set(columns or ()).difference(*(r.columns for r in results)))
+                if unknown:
+                    raise RequestError(f"未知の列があります: {unknown}")
+                results = [result_payload(sid, r, columns) for (sid, _), r in zip(scenarios, results)]
+            except RequestError as e:
+                self._send(400, {'error': str(e)})
+                return
+            except Exception as e:
+                self._send(500, {'error': f"{type(e).__name__}: {e}"})
+                return
+            self._send(200, {'results': results})
+            stats.record(time.perf_counter() - started, len(scenarios))
+
+        def log_message(self, format, *args):
+            if self.verbose:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+class APIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # 同時に多数の接続が来ても取りこぼさない (既定は 5)
+
+
+def serve(port=8765, workers=2, max_batch=512, max_wait=0.005, verbose=False):
+    batcher = SimulationBatcher(workers, max_batch, max_wait)
+    stats = LatencyStats()
+    handler = make_handler(batcher, stats)
+    handler.verbose = verbose
+    server = APIServer((HOST, port), handler)
+    return server, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="家計シミュレーションのローカル JSON API")
+    parser.add_argument('--port', type=int, default=8765, help="待ち受けるポート (127.0.0.1 のみ)")
+    parser.add_argument('--workers', type=int, default=2, help="一括計算を行うワーカースレッド数")
+    parser.add_argument('--max-batch', type=int, default=512, help="1回の一括計算にまとめるシナリオ数の上限")
+    parser.add_argument('--max-wait-ms', type=float, default=5.0, help="後続のリクエストを待ってまとめる時間 (ミリ秒)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="リクエストごとにログを出す")
+    args = parser.parse_args(argv)
+    server, stats = serve(args.port, args.workers, args.max_batch, args.max_wait_ms / 1000, args.verbose)
+    print(f"http://{HOST}:{server.server_port} で待ち受けています (Ctrl+C で終了)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        summary = stats.summary()
+        if summary['n']:
+            print(f"\n{summary['requests']:,} リクエスト / {summary['scenarios']:,} シナリオ  "
+                  f"p50 {summary['p50_ms']:.1f} ms  p99 {summary['p99_ms']:.1f} ms", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
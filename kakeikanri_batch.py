@@ -0,0 +1,199 @@
+"""家計シミュレーションを Streamlit なしで一括実行するコマンド。
+
+    python kakeikanri_batch.py scenarios.jsonl -o results.csv
+    python kakeikanri_batch.py scenarios.csv -o results.parquet --workers 8 --chunk-size 2000
+
+入力は JSONL (1行1シナリオ) または CSV (1行1シナリオ、列名は SimulationParams の
+フィールド名)。scenario_id 列があればそれを、なければ入力の行番号 (0 始まり) を ID とする。
+出力は画面の詳細データと同じ年次の列を、シナリオ × 年の縦持ちで CSV / Parquet に書き出す。
+チャンク単位でワーカープロセスに配り、書き出したチャンクから順にメモリを解放する。
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from simulation import SimulationParams
+from pipeline import simulate_batch
+
+
+def read_records(path, fmt):
+    # (行番号, dict) を1件ずつ返す
+    with open(path, encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            for i, row in enumerate(csv.DictReader(f)):
+                yield i + 2, row  # ヘッダーが1行目
+        else:
+            for i, line in enumerate(f):
+                if line.strip():
+                    yield i + 1, json.loads(line)
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while chunk := list(itertools.islice(it, size)):
+        yield chunk
+
+
+def _pyarrow():
+    # pyarrow があれば Arrow で表を組み立てて書き出す (数値列をコピーせず、CSV も C++ 実装で速い)
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None
+    return pa
+
+
+def _round_arrow(table, decimals):
+    # pandas の round と同じ値にするため numpy で丸める (pyarrow.compute.round は末尾の桁がずれることがある)
+    pa = _pyarrow()
+    for i, field in enumerate(table.schema):
+        if pa.types.is_floating(field.type):
+            table = table.set_column(i, field, pa.array(np.round(table.column(i).to_numpy(), decimals), from_pandas=True))
+    return table
+
+
+def run_chunk(records, start_index, fmt, decimals):
+    """1チャンク分を計算し、(シナリオ数, 書き出し用データ, 列名) を返す (ワーカープロセスで実行)。"""
+    ids, params_list = [], []
+    for offset, (line_no, record) in enumerate(records):
+        record = dict(record)
+        scenario_id = record.pop('scenario_id', None)
+        try:
+            params_list.append(SimulationParams.from_dict(record))
+        except ValueError as e:
+            raise ValueError(f"{line_no} 行目: {e}") from None
+        ids.append(str(start_index + offset) if scenario_id in (None, '') else str(scenario_id))
+
+    ids = np.array(ids, dtype=object)
+    batches = simulate_batch(params_list)
+    # 入力順に並べ直す (期間ごとにまとめて計算しているため)。1グループなら元から入力順
+    rows = np.concatenate([np.repeat(b.index, len(b.years)) for b in batches])
+    order = None if len(batches) == 1 else np.argsort(rows, kind='stable')
+    pa = _pyarrow()
+    if pa is None:
+        # pyarrow が無ければ pandas で CSV にする (Parquet は pyarrow が必須)
+        import pandas as pd
+        frames = [b.to_frame(ids[b.index]) for b in batches]
+        table = frames[0] if order is None else pd.concat(frames, ignore_index=True).take(order)
+        return len(params_list), table.round(decimals).to_csv(index=False, header=False).encode('utf-8'), list(table.columns)
+
+    tables = [b.to_arrow(ids[b.index]) for b in batches]
+    table = tables[0] if order is None else pa.concat_tables(tables).take(order)
+    if fmt == 'csv':
+        import pyarrow.csv as pa_csv
+        buf = pa.BufferOutputStream()
+        pa_csv.write_csv(_round_arrow(table, decimals), buf, pa_csv.WriteOptions(include_header=False))
+        return len(params_list), buf.getvalue().to_pybytes(), table.column_names
+    return len(params_list), table, table.column_names
+
+
+class CsvSink:
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+        self.header_written = False
+
+    def write(self, payload, columns):
+        if not self.header_written:
+            self.f.write((','.join(columns) + '\n').encode('utf-8'))
+            self.header_written = True
+        self.f.write(payload)
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetSink:
+    def __init__(self, path):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet で出力するには pyarrow をインストールしてください") from None
+        self.pq, self.path = pq, path
+        self.writer = None
+
+    def write(self, payload, columns):
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, payload.schema)
+        self.writer.write_table(payload)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def run(input_path, output_path, input_format=None, output_format=None, workers=None,
+        chunk_size=1000, decimals=4, progress=sys.stderr):
+    input_format = input_format or ('csv' if input_path.lower().endswith('.csv') else 'jsonl')
+    output_format = output_format or ('parquet' if output_path.lower().endswith('.parquet') else 'csv')
+    workers = workers or os.cpu_count() or 1
+    sink = ParquetSink(output_path) if output_format == 'parquet' else CsvSink(output_path)
+
+    started = time.perf_counter()
+    done = 0
+
+    def report(n, columns, payload):
+        nonlocal done
+        sink.write(payload, columns)
+        done += n
+        if progress:
+            elapsed = time.perf_counter() - started
+            print(f"\r{done:,} シナリオ完了 ({done / elapsed:,.0f} シナリオ/秒)", end='', file=progress, flush=True)
+
+    chunks = chunked(read_records(input_path, input_format), chunk_size)
+    try:
+        if workers <= 1:
+            start_index = 0
+            for chunk in chunks:
+                n, payload, columns = run_chunk(chunk, start_index, output_format, decimals)
+                start_index += len(chunk)
+                report(n, columns, payload)
+        else:
+            # 書き込み待ちのチャンクを workers * 2 個までに抑え、入力順に書き出す
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                start_index = 0
+                for chunk in chunks:
+                    pending.append(pool.submit(run_chunk, chunk, start_index, output_format, decimals))
+                    start_index += len(chunk)
+                    if len(pending) >= workers * 2:
+                        n, payload, columns = pending.popleft().result()
+                        report(n, columns, payload)
+                while pending:
+                    n, payload, columns = pending.popleft().result()
+                    report(n, columns, payload)
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - started
+    if progress:
+        print(f"\n{done:,} シナリオを {elapsed:.1f} 秒で計算しました ({done / max(elapsed, 1e-9):,.0f} シナリオ/秒) -> {output_path}", file=progress)
+    return done, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="家計シミュレーションを一括実行し、年次の結果を CSV / Parquet に書き出す")
+    parser.add_argument('input', help="シナリオファイル (.jsonl / .csv)")
+    parser.add_argument('-o', '--output', required=True, help="出力ファイル (.csv / .parquet)")
+    parser.add_argument('--input-format', choices=['jsonl', 'csv'], help="入力形式 (既定: 拡張子から判定)")
+    parser.add_argument('--output-format', choices=['csv', 'parquet'], help="出力形式 (既定: 拡張子から判定)")
+    parser.add_argument('--workers', type=int, default=None, help="ワーカープロセス数 (既定: CPU 数、1 なら単一プロセス)")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="1回にまとめて計算するシナリオ数")
+    parser.add_argument('--decimals', type=int, default=4, help="CSV に書き出す小数点以下の桁数")
+    parser.add_argument('-q', '--quiet', action='store_true', help="進捗を表示しない")
+    args = parser.parse_args(argv)
+    try:
+        run(args.input, args.output, args.input_format, args.output_format, args.workers,
+            args.chunk_size, args.decimals, progress=None if args.quiet else sys.stderr)
+    except (ValueError, KeyError, json.JSONDecodeError) as e:
+        parser.exit(1, f"\nエラー: {e}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import numpy as np
+
+# 物価・賃金・住宅ローン金利・資産リターンを相関させて動かすための部品。
+# 乱数は montecarlo.draw_shocks が因子ごとに独立な標準正規で作り、ここで相関を付ける。
+
+# 因子 (montecarlo.SHOCKS と同じ名前)
+FACTOR_LABELS = {
+    'inflation': '物価上昇率',
+    'wage': '昇給率',
+    'mortgage_rate': '住宅ローン基準金利',
+    'fx': '為替 (米ドル/円)',
+    'foreign_stock': '外国株',
+    'foreign_bond': '外国債券',
+    'foreign_cash': '外貨預金',
+    'yen': '国内資産',
+}
+
+# 画面で初期表示する相関 (因子1, 因子2, 相関係数)
+DEFAULT_CORRELATIONS = (
+    ('inflation', 'wage', 0.5),
+    ('inflation', 'mortgage_rate', 0.3),
+    ('inflation', 'foreign_bond', -0.2),
+    ('fx', 'foreign_stock', 0.3),
+)
+
+
+def correlation_matrix(correlations, factors):
+    """(因子1, 因子2, 相関係数) の組から factors 順の相関行列を作る。指定のない組は無相関。"""
+    index = {name: i for i, name in enumerate(factors)}
+    corr = np.eye(len(factors))
+    for a, b, rho in correlations:
+        if a not in index or b not in index:
+            raise ValueError(f"未知の因子です: {a if a not in index else b}")
+        if a == b:
+            continue
+        if not -1 <= rho <= 1:
+            raise ValueError(f"相関係数は -1〜1 で指定してください: {a}-{b} = {rho}")
+        corr[index[a], index[b]] = corr[index[b], index[a]] = rho
+    return corr
+
+def cholesky_factor(correlations, factors=tuple(FACTOR_LABELS)):
+    # 相関行列のコレスキー分解。正定値でなければ ValueError
+    try:
+        return np.linalg.cholesky(correlation_matrix(correlations, factors))
+    except np.linalg.LinAlgError:
+        raise ValueError("相関行列が正定値になりません。相関係数の組み合わせを見直してください") from None
+
+def correlate(shocks, correlations):
+    """独立な標準正規ショック {因子: (paths, years)} に相関を付けて返す。
+
+    相関行列のコレスキー分解 L で z -> L z と変換する。相関の指定がなければそのまま返す
+    (乱数列は変わらない)。
+    """
+    if not correlations:
+        return shocks
+    factors = list(shocks)
+    chol = cholesky_factor(correlations, factors)
+    z = np.stack([shocks[name] for name in factors])
+    mixed = np.einsum('ij,j...->i...', chol, z)
+    return {name: mixed[i] for i, name in enumerate(factors)}
+
+
+def inflation_paths(mean, vol, persistence, z):
+    """年次の物価上昇率 (小数) を AR(1) で作る -> (paths, years)。
+
+    mean が長期平均、vol が定常状態の標準偏差、persistence が前年からの持続性。
+    初年度 (経過0年) はまだ物価が動かないので物価指数には使わない。
+    """
+    rates = np.empty(z.shape)
+    innovation = vol * np.sqrt(1 - persistence ** 2) * z
+    rates[:, 0] = mean + vol * z[:, 0]
+    for t in range(1, z.shape[1]):
+        rates[:, t] = mean + persistence * (rates[:, t - 1] - mean) + innovation[:, t]
+    return rates
+
+def cumulative_index(rates):
+    # 年次の変化率 (paths, years) -> 経過0年を 1 とする累積指数
+    growth = 1 + rates
+    growth[:, 0] = 1
+    return np.cumprod(growth, axis=1)
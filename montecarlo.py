@@ -0,0 +1,202 @@
+from dataclasses import dataclass
+import numpy as np
+
+from historical import block_bootstrap
+from macro import correlate, inflation_paths, cumulative_index
+from simulation import (
+    ASSET_COLUMNS, build_timeline, compute_income, compute_expenses, compute_mortgage,
+    run_portfolio, project_assets, asset_growth_rates, initial_balances, ideco_contributions,
+    project_assets_monthly, monthly_cash_flows, annual_cash_flow, to_yen, to_man,
+)
+
+# 金利シナリオごとの基準金利の年間ドリフト (%pt)。'stable' は get_rate_fluctuation の期待値
+RATE_DRIFT = {'fixed': 0.0, 'stable': 0.0025, 'rising': 0.05, 'sharp_rising': 0.20}
+
+
+# --- 市場の前提 (年率・%) ---
+@dataclass(frozen=True)
+class MarketAssumptions:
+    vol_foreign_stock: float = 18.0
+    vol_foreign_bond: float = 6.0
+    vol_foreign_cash: float = 0.5
+    vol_yen: float = 1.0
+    vol_fx: float = 10.0
+    vol_mortgage_rate: float = 0.15  # 基準金利の年次変化 (%pt)
+    vol_inflation: float = 0.0  # 物価上昇率の標準偏差 (%pt)。0 なら物価上昇率は固定
+    inflation_persistence: float = 0.5  # 物価上昇率の前年からの持続性 (AR(1) 係数)
+    vol_wage_growth: float = 0.0  # 昇給率の年次の揺らぎ (%pt)。0 なら昇給率は固定
+    correlations: tuple = ()  # 因子間の相関 ((因子1, 因子2, 相関係数), ...)。macro.correlate を参照
+
+
+@dataclass
+class MonteCarloResult:
+    years: np.ndarray
+    total_assets: np.ndarray  # (paths, years) 万円 (dtype を指定すれば float32 など)
+    net_assets: np.ndarray  # (paths, years) 万円
+    bankrupt_idx: np.ndarray  # (paths,) 資金ショートした年のインデックス (なければ -1)
+    shortfall_idx: np.ndarray  # (paths,) 生活防衛資金を維持できなくなった年のインデックス (なければ -1)
+    spending_cut: np.ndarray | None = None  # (paths, years) ガードレールで削った生活費 (万円)
+
+    @property
+    def n_paths(self):
+        return self.total_assets.shape[0]
+
+    @property
+    def bankrupt(self):
+        return self.bankrupt_idx >= 0
+
+    @property
+    def bankruptcy_probability(self):
+        return float(self.bankrupt.mean())
+
+    def percentiles(self, values, q=(5, 50, 95)):
+        # 各年のパーセンタイル -> (len(q), years)
+        return np.percentile(values, q, axis=0)
+
+
+# 乱数ショックの種類 (この順に生成する。後から追加した因子は末尾に足し、既存の乱数列を変えない)
+SHOCKS = ('fx', 'foreign_stock', 'foreign_bond', 'foreign_cash', 'yen', 'mortgage_rate', 'inflation', 'wage')
+
+
+def draw_shocks(n_paths, n_years, rng):
+    # 標準正規乱数を (paths, years) で生成する。パラメータを変えても同じショックを
+    # 使い回せる (common random numbers) よう、市場の前提とは分けて持つ
+    return {name: rng.standard_normal((n_paths, n_years)) for name in SHOCKS}
+
+
+def market_from_shocks(params, shocks, assumptions=MarketAssumptions()):
+    """ショックから利回り・為替・住宅ローン基準金利・物価/賃金のパスを (paths, years) で作る。
+
+    戻り値は (growth, base_rates, macro)。macro は変動させる場合だけ 'price_index' /
+    'wage_index' (経過0年を 1 とする累積指数) を持つ。
+    """
+    a = assumptions
+    shocks = correlate(shocks, a.correlations)
+
+    def returns(mean_pct, vol_pct, z):
+        # 年率リターン (小数)。-100% 未満にはならないよう下限を設ける
+        return np.maximum(mean_pct / 100 + vol_pct / 100 * z, -0.95)
+
+    growth = asset_growth_rates(
+        params,
+        fx_change_rate=params.fx_change_rate + a.vol_fx / 100 * shocks['fx'],
+        stock=returns(params.yield_foreign_stock, a.vol_foreign_stock, shocks['foreign_stock']),
+        bond=returns(params.yield_foreign_bond, a.vol_foreign_bond, shocks['foreign_bond']),
+        cash=returns(params.yield_foreign_cash, a.vol_foreign_cash, shocks['foreign_cash']),
+        yen=returns(params.yield_yen, a.vol_yen, shocks['yen']),
+    )
+    return growth, mortgage_rate_paths(params, shocks['mortgage_rate'], a), macro_paths(params, shocks, a)
+
+
+def mortgage_rate_paths(params, z, assumptions=MarketAssumptions()):
+    # 基準金利: 初年度は現在値、以降はシナリオのドリフト + ランダムウォーク ('fixed' は変動なし)
+    scenario = params.mortgage_rate_scenario
+    steps = np.full(z.shape, RATE_DRIFT.get(scenario, 0.0))
+    if scenario != 'fixed':
+        steps += assumptions.vol_mortgage_rate * z
+    steps[:, 0] = 0
+    return params.mortgage_base_rate + np.cumsum(steps, axis=1)
+
+
+def macro_paths(params, shocks, assumptions=MarketAssumptions()):
+    a = assumptions
+    macro = {}
+    if a.vol_inflation > 0:
+        rates = inflation_paths(params.inflation_rate, a.vol_inflation / 100, a.inflation_persistence, shocks['inflation'])
+        macro['price_index'] = cumulative_index(rates)
+    if a.vol_wage_growth > 0:
+        macro['wage_index'] = cumulative_index(params.head_income_growth / 100 + a.vol_wage_growth / 100 * shocks['wage'])
+    return macro
+
+
+def sample_market(params, n_years, n_paths, rng, assumptions=MarketAssumptions(), history=None, block_years=5):
+    if history is None:
+        return market_from_shocks(params, draw_shocks(n_paths, n_years, rng), assumptions)
+    # 過去の実績をブロック・ブートストラップする (利回りのパラメータは使わず実績そのもの)
+    sampled = block_bootstrap(history, n_paths, n_years, rng, block_years)
+    growth = asset_growth_rates(
+        params, fx_change_rate=sampled['fx'], stock=sampled['foreign_stock'],
+        bond=sampled['foreign_bond'], cash=sampled['foreign_cash'], yen=sampled['yen'],
+    )
+    # 実績にない金利・物価・賃金は乱数で作り、その3因子の間の相関だけを付ける
+    shocks = {name: rng.standard_normal((n_paths, n_years)) for name in ('mortgage_rate', 'inflation', 'wage')}
+    shocks = correlate(shocks, tuple(c for c in assumptions.correlations if c[0] in shocks and c[1] in shocks))
+    return growth, mortgage_rate_paths(params, shocks['mortgage_rate'], assumptions), macro_paths(params, shocks, assumptions)
+
+
+def _paths_result(timeline, mortgage, assets, rows=slice(None), dtype=None):
+    # パス行列は dtype (np.float32 なら半分のメモリ) で持つ。計算は円の float64 で済ませてから変換する
+    total = assets['total'][rows]
+    return MonteCarloResult(
+        years=timeline['西暦'],
+        total_assets=to_man(total, dtype),
+        net_assets=to_man(total - mortgage['loan_balance'], dtype),
+        bankrupt_idx=assets['bankrupt_idx'][rows],
+        shortfall_idx=assets['shortfall_idx'][rows],
+    )
+
+
+def simulate_paths(params, n_paths=10000, seed=None, assumptions=MarketAssumptions(), history=None, block_years=5, dtype=None):
+    # history (historical.HistoricalReturns) を渡すと市場の変動を過去の実績から作る。dtype は結果のパス行列の型
+    rng = np.random.default_rng(seed)
+    timeline = build_timeline(params)
+    growth, base_rates, macro = sample_market(params, len(timeline['西暦']), n_paths, rng, assumptions, history, block_years)
+    income = compute_income(params, timeline, macro.get('wage_index'))
+    expenses = compute_expenses(params, timeline, macro.get('price_index'))
+    mortgage = compute_mortgage(params, timeline, base_rates)
+    assets = run_portfolio(params, timeline, income, expenses, mortgage, growth)
+    return _paths_result(timeline, mortgage, assets, dtype=dtype)
+
+
+def simulate_paths_batch(params_list, n_paths=2000, seed=None, assumptions=MarketAssumptions(), dtype=None):
+    """複数のパラメータセットを同じ乱数ショック (common random numbers) で評価する。
+
+    全候補のパスを縦に積んで資産運用を一度に計算し、候補ごとの MonteCarloResult を返す。
+    """
+    timelines = [build_timeline(p) for p in params_list]
+    max_years = max(len(tl['西暦']) for tl in timelines)
+    shocks = draw_shocks(n_paths, max_years, np.random.default_rng(seed))
+
+    parts = []
+    for p, timeline in zip(params_list, timelines):
+        n_years = len(timeline['西暦'])
+        growth, base_rates, macro = market_from_shocks(p, {k: v[:, :n_years] for k, v in shocks.items()}, assumptions)
+        mortgage = compute_mortgage(p, timeline, base_rates)
+        parts.append((p, timeline, growth, mortgage, macro))
+
+    # 期間 (年数) と月次/年次の別が同じ候補ごとにまとめて計算する
+    results = [None] * len(params_list)
+    by_length = {}
+    for i, (p, timeline, *_) in enumerate(parts):
+        by_length.setdefault((len(timeline['西暦']), p.monthly), []).append(i)
+    for (n_years, monthly), members in by_length.items():
+        shape = (n_paths, n_years)
+        cash_flows, flows, ideco_adds, growths, initials = [], [], [], [], []
+        for i in members:
+            p, timeline, growth, mortgage, macro = parts[i]
+            ideco_add = np.broadcast_to(ideco_contributions(p, timeline), shape)
+            income = compute_income(p, timeline, macro.get('wage_index'))
+            expenses = compute_expenses(p, timeline, macro.get('price_index'))
+            cash_flows.append(annual_cash_flow(income, expenses, mortgage, ideco_add))
+            if monthly:
+                flows.append(monthly_cash_flows(income, expenses, mortgage, ideco_add))
+            ideco_adds.append(ideco_add)
+            growths.append({k: np.broadcast_to(v, shape) for k, v in growth.items()})
+            initials.append(initial_balances(p))
+        ps = [parts[i][0] for i in members]
+        initial = {k: np.repeat([b[k] for b in initials], n_paths) for k in ASSET_COLUMNS}
+        growth = {k: np.vstack([g[k] for g in growths]) for k in growths[0]}
+        ideco_add = np.vstack(ideco_adds)
+        policy = (
+            np.repeat([to_yen(p.safety_net_val) for p in ps], n_paths),
+            np.repeat([p.invest_surplus for p in ps], n_paths),
+            np.repeat([p.foreign_allocation for p in ps], n_paths).astype(float),
+        )
+        if monthly:
+            stacked = [(np.vstack([np.broadcast_to(f[c][0], shape) for f in flows]), share) for c, (_, share) in enumerate(flows[0])]
+            assets = project_assets_monthly(initial, growth, stacked, ideco_add, *policy)
+        else:
+            assets = project_assets(initial, growth, np.vstack(cash_flows), ideco_add, *policy)
+        for j, i in enumerate(members):
+            results[i] = _paths_result(parts[i][1], parts[i][3], assets, slice(j * n_paths, (j + 1) * n_paths), dtype)
+    return results
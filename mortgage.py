@@ -0,0 +1,130 @@
+from dataclasses import dataclass
+import numpy as np
+
+# 元利均等返済の閉形式計算。残高・金利・残り月数はすべて配列で渡せ、
+# (paths,) や (loans,) 単位でまとめて計算する。金利は月利 (小数)。
+
+
+# --- イベント ---
+@dataclass(frozen=True)
+class Prepayment:
+    year: int
+    amount: float  # 円 (その年の返済開始前に充当)
+    mode: str = 'shorten'  # 'shorten': 期間短縮型 / 'reduce': 返済額軽減型
+
+
+@dataclass(frozen=True)
+class Refinance:
+    year: int
+    rate: float  # 借り換え後の適用金利 (%/年、以降固定)
+    end_year: int | None = None  # 完済予定年の変更 (None なら据え置き)
+    cost: float = 0  # 諸費用 (円、残高に上乗せ)
+
+
+@dataclass
+class AmortizationSchedule:
+    # いずれも (paths, years) の円建て。payment / principal は繰上返済を含む
+    balance: np.ndarray
+    payment: np.ndarray
+    interest: np.ndarray
+    principal: np.ndarray
+
+
+def annuity_payment(balance, monthly_rate, n_months):
+    # 元利均等の毎月返済額
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        factor = (1 + monthly_rate) ** n_months
+        return np.where(monthly_rate > 0, balance * monthly_rate * factor / (factor - 1), balance / n_months)
+
+def _balance_after(balance, monthly_rate, payment, months):
+    # 毎月 payment を months か月返済した後の残高
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        growth = (1 + monthly_rate) ** months
+        return np.where(monthly_rate > 0, balance * growth - payment * (growth - 1) / monthly_rate, balance - payment * months)
+
+def amortize(balance, monthly_rate, n_months, months=12):
+    """残り n_months の元利均等返済を months か月分進める。
+
+    (返済後残高, 返済額合計, 利息合計) を返す。残高がない・残り月数が 0 以下の
+    ローンは何もしない。
+    """
+    balance, monthly_rate, n_months = np.broadcast_arrays(
+        np.asarray(balance, dtype=float), np.asarray(monthly_rate, dtype=float), np.asarray(n_months))
+    active = (balance > 0) & (n_months > 0)
+    n_safe = np.where(active, n_months, 1)
+    m = np.minimum(months, n_safe)
+    payment = annuity_payment(balance, monthly_rate, n_safe)
+    end = np.where(m >= n_safe, 0, _balance_after(balance, monthly_rate, payment, m))
+    end = np.where(active, end, balance)
+    paid = np.where(active, payment * m, 0)
+    return end, paid, paid - (balance - end)
+
+def months_to_repay(balance, monthly_rate, payment):
+    # 毎月 payment で完済するのに必要な月数 (切り上げ)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        n = np.where(monthly_rate > 0,
+                     np.log(payment / (payment - balance * monthly_rate)) / np.log1p(monthly_rate),
+                     balance / payment)
+    return np.maximum(np.ceil(np.nan_to_num(n, nan=1, posinf=1)), 1).astype(np.int64)
+
+
+def fixed_rate_schedule(balance, annual_rate, n_months, n_years):
+    # 金利が変わらない区間の年次スケジュールを一括で求める
+    balance = np.atleast_1d(np.asarray(balance, dtype=float))[:, None]
+    r = np.atleast_1d(np.asarray(annual_rate, dtype=float))[:, None] / 100 / 12
+    n = np.atleast_1d(np.asarray(n_months))[:, None]
+    active = (balance > 0) & (n > 0)
+    n_safe = np.where(active, n, 1)
+    elapsed = 12 * np.arange(1, n_years + 1)[None, :]
+    payment = annuity_payment(balance, r, n_safe)
+    end = np.where(elapsed >= n_safe, 0, _balance_after(balance, r, payment, np.minimum(elapsed, n_safe)))
+    end = np.where(active, end, balance)
+    paid = np.where(active, payment * np.clip(n_safe - (elapsed - 12), 0, 12), 0)
+    start = np.concatenate([np.broadcast_to(balance, (end.shape[0], 1)), end[:, :-1]], axis=1)
+    principal = start - end
+    return AmortizationSchedule(end, paid, paid - principal, principal)
+
+def yearly_schedule(balance, annual_rates, years, end_year, prepayments=(), refinances=()):
+    """年ごとの適用金利 annual_rates (%/年, (paths, years)) で返済スケジュールを作る。
+
+    各年の残り月数は (end_year - 年) * 12 (最低 1) で、年内は 1 年分を閉形式で進める。
+    金利が全期間一定でイベントもなければ全期間を 1 区間として計算する。
+    """
+    rates = np.atleast_2d(np.asarray(annual_rates, dtype=float))
+    years = np.asarray(years)
+    n_paths, n_years = rates.shape
+    balance = np.array(np.broadcast_to(np.asarray(balance, dtype=float), (n_paths,)))
+    n_left = np.maximum((np.broadcast_to(end_year, (n_paths,)) - years[0]) * 12, 1)
+
+    if not prepayments and not refinances and np.all(rates == rates[:, :1]):
+        return fixed_rate_schedule(balance, rates[:, 0], n_left, n_years)
+
+    refinanced_rate = np.full(n_paths, np.nan)
+    out = {k: np.zeros((n_paths, n_years)) for k in ('balance', 'payment', 'interest', 'principal')}
+    for i, year in enumerate(years):
+        for ev in refinances:
+            if ev.year == year:
+                balance = np.where(balance > 0, balance + ev.cost, balance)
+                refinanced_rate[:] = ev.rate
+                if ev.end_year is not None:
+                    n_left = np.full(n_paths, max((ev.end_year - year) * 12, 1))
+        monthly_r = np.where(np.isnan(refinanced_rate), rates[:, i], refinanced_rate) / 100 / 12
+
+        prepaid = np.zeros(n_paths)
+        for ev in prepayments:
+            if ev.year == year:
+                amount = np.clip(ev.amount, 0, np.maximum(balance, 0))
+                current_payment = annuity_payment(balance, monthly_r, n_left)
+                balance = balance - amount
+                if ev.mode == 'shorten':
+                    # 毎月の返済額を据え置き、返済期間を短くする
+                    n_left = np.where(balance > 0, np.minimum(months_to_repay(balance, monthly_r, current_payment), n_left), n_left)
+                prepaid += amount
+
+        balance, paid, interest = amortize(balance, monthly_r, n_left, 12)
+        out['balance'][:, i] = balance
+        out['payment'][:, i] = paid + prepaid
+        out['interest'][:, i] = interest
+        out['principal'][:, i] = out['payment'][:, i] - interest
+        n_left = np.maximum(n_left - 12, 1)
+    return AmortizationSchedule(**out)
@@ -0,0 +1,156 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+import numpy as np
+
+from simulation import (
+    build_timeline, compute_income, compute_expenses, compute_mortgage, project_assets,
+    project_assets_monthly, monthly_cash_flows, initial_balances, ideco_contributions, annual_cash_flow, to_yen, to_man,
+)
+from montecarlo import MarketAssumptions, sample_market
+
+# 黒字の配分・生活防衛資金・iDeCo 掛金の最適化。
+# 3つのパラメータは市場・収入・支出・ローンに影響しないので、市場シナリオと各ステージは
+# 1回だけ計算し、候補ごとのパスを縦に積んで資産運用だけを一括で計算する。全候補が
+# 同じ市場シナリオ (common random numbers) を使うので、候補間の差が乱数のばらつきに埋もれない。
+
+# 探索するパラメータ: 名前 -> (表示名, 既定の下限, 既定の上限, 既定の分割数)
+SEARCH_SPACE = {
+    'foreign_allocation': ('黒字分の外国株式への配分(%)', 0, 100, 6),
+    'safety_net_val': ('生活防衛資金 (万円)', 100, 1000, 5),
+    'ideco_monthly': ('iDeCo 毎月掛金 (万円)', 0, 6.8, 4),
+}
+# 候補 × パスの行数がこれ以上ならプロセスプールに分散する
+PARALLEL_THRESHOLD = 200000
+# 1回の資産運用計算に積む行数の上限 (メモリを抑える)
+CHUNK_ROWS = 50000
+
+
+@dataclass
+class OptimizeResult:
+    values: dict  # パラメータ名 -> 候補ごとの値 (candidates,)
+    median_final_net: np.ndarray  # 老後純資産の中央値 (万円)
+    p5_final_net: np.ndarray  # 老後純資産の下位5% (万円)
+    bankruptcy_probability: np.ndarray
+    shortfall_probability: np.ndarray  # 生活防衛資金を割る確率
+    target: float  # 資金ショート確率の上限
+    n_paths: int
+    current: int  # 現在の設定の候補番号
+
+    @property
+    def feasible(self):
+        return self.bankruptcy_probability <= self.target
+
+    @property
+    def best(self):
+        # 上限を満たす候補のうち中央値が最大のもの。満たす候補がなければ最も安全なもの
+        if self.feasible.any():
+            return int(np.argmax(np.where(self.feasible, self.median_final_net, -np.inf)))
+        return int(np.lexsort((-self.median_final_net, self.bankruptcy_probability))[0])
+
+    @property
+    def frontier(self):
+        return efficient_frontier(self.bankruptcy_probability, self.median_final_net)
+
+    def candidate(self, i):
+        return {name: v[i].item() for name, v in self.values.items()}
+
+
+def efficient_frontier(risk, reward):
+    """risk が小さく reward が大きい候補 (他の候補に両方で負けない候補) を risk の昇順で返す。"""
+    order = np.lexsort((-reward, risk))
+    best = np.maximum.accumulate(reward[order])
+    keep = np.r_[True, reward[order][1:] > best[:-1]]
+    return order[keep]
+
+
+def search_grid(ranges):
+    # {名前: (下限, 上限, 分割数)} -> {名前: 候補ごとの値}。全組み合わせを並べる
+    axes = {name: np.unique(np.linspace(low, high, int(steps)).round(1)) for name, (low, high, steps) in ranges.items()}
+    combos = np.array(list(itertools.product(*axes.values())), dtype=float).reshape(-1, len(axes))
+    return {name: combos[:, k] for k, name in enumerate(axes)}
+
+
+def evaluate_candidates(base, values, n_paths=1000, seed=0, assumptions=MarketAssumptions(), history=None, block_years=5):
+    """values の候補を同じ市場シナリオで評価する -> (中央値, P5, 資金ショート確率, 生活防衛資金を割る確率)。"""
+    n = len(next(iter(values.values())))
+    params_list = [replace(base, **{name: v[i].item() for name, v in values.items()}) for i in range(n)]
+    timeline = build_timeline(base)
+    n_years = len(timeline['西暦'])
+    growth, base_rates, macro = sample_market(base, n_years, n_paths, np.random.default_rng(seed), assumptions, history, block_years)
+    income = compute_income(base, timeline, macro.get('wage_index'))
+    expenses = compute_expenses(base, timeline, macro.get('price_index'))
+    mortgage = compute_mortgage(base, timeline, base_rates)
+    loan_final = np.broadcast_to(mortgage['loan_balance'], (n_paths, n_years))[:, -1]
+    shape = (n_paths, n_years)
+    tile = lambda a, k: np.tile(np.broadcast_to(a, shape), (k, 1))
+
+    out = np.empty((4, n))
+    step = max(1, CHUNK_ROWS // n_paths)
+    for start in range(0, n, step):
+        ps = params_list[start:start + step]
+        k = len(ps)
+        ideco_add = np.repeat([ideco_contributions(p, timeline) for p in ps], n_paths, axis=0)
+        policy = (
+            np.repeat([to_yen(p.safety_net_val) for p in ps], n_paths),
+            np.repeat([p.invest_surplus for p in ps], n_paths),
+            np.repeat([p.foreign_allocation for p in ps], n_paths).astype(float),
+        )
+        grown = {name: tile(g, k) for name, g in growth.items()}
+        if base.monthly:
+            flows = [(tile(amount, k), share) for amount, share in monthly_cash_flows(income, expenses, mortgage, 0)]
+            flows.append((-ideco_add, np.full(12, 1 / 12)))
+            assets = project_assets_monthly(initial_balances(base), grown, flows, ideco_add, *policy)
+        else:
+            cash_flow = tile(annual_cash_flow(income, expenses, mortgage, 0), k) - ideco_add
+            assets = project_assets(initial_balances(base), grown, cash_flow, ideco_add, *policy)
+        final_net = to_man(assets['total'][:, -1].reshape(k, n_paths) - loan_final)
+        out[0, start:start + k] = np.median(final_net, axis=1)
+        out[1, start:start + k] = np.percentile(final_net, 5, axis=1)
+        out[2, start:start + k] = (assets['bankrupt_idx'] >= 0).reshape(k, n_paths).mean(axis=1)
+        out[3, start:start + k] = (assets['shortfall_idx'] >= 0).reshape(k, n_paths).mean(axis=1)
+    return out
+
+
+def _evaluate_chunk(args):
+    base, values, n_paths, seed, assumptions, history, block_years = args
+    return evaluate_candidates(base, values, n_paths, seed, assumptions, history, block_years)
+
+
+def optimize(base, ranges=None, target=0.05, n_paths=1000, seed=0, assumptions=MarketAssumptions(), history=None, block_years=5, workers=None):
+    """配分・生活防衛資金・iDeCo 掛金の全組み合わせを評価し、資金ショート確率が target 以下で
+    老後純資産の中央値が最大の候補と、効率的フロンティアを求める。
+
+    ranges は {名前: (下限, 上限, 分割数)} (省略時は SEARCH_SPACE の既定値)。ranges に無い
+    パラメータは base の値のまま動かさない。現在の設定も候補に含める。候補が多ければ
+    プロセスプールに分ける。各プロセスは同じシードから同じ市場シナリオを作るので、結果は
+    分け方に依らない。
+    """
+    if ranges is None:
+        ranges = {name: (low, high, steps) for name, (_, low, high, steps) in SEARCH_SPACE.items()}
+    unknown = set(ranges) - set(SEARCH_SPACE)
+    if unknown:
+        raise ValueError(f"最適化できないパラメータです: {sorted(unknown)}")
+    values = search_grid(ranges)
+    # 現在の設定も候補に加えて同じ市場シナリオで評価する (比較の基準)
+    now = np.array([getattr(base, name) for name in values], dtype=float)
+    grid = np.column_stack(list(values.values()))
+    match = np.flatnonzero((grid == now).all(axis=1))
+    if len(match):
+        current = int(match[0])
+    else:
+        current = len(grid)
+        values = {name: np.append(v, now[k]) for k, (name, v) in enumerate(values.items())}
+    n = len(next(iter(values.values())))
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or n * n_paths < PARALLEL_THRESHOLD:
+        out = evaluate_candidates(base, values, n_paths, seed, assumptions, history, block_years)
+    else:
+        bounds = np.linspace(0, n, min(workers, n) + 1).astype(int)
+        jobs = [(base, {k: v[lo:hi] for k, v in values.items()}, n_paths, seed, assumptions, history, block_years)
+                for lo, hi in zip(bounds[:-1], bounds[1:])]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_evaluate_chunk, jobs))
+        out = np.concatenate(parts, axis=1)
+    return OptimizeResult(values, out[0], out[1], out[2], out[3], target, n_paths, current)
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# 1回の rerun の中の処理ごとの所要時間を測る。無効なときは lap が
+# 何もしないので、計測コードを残したままでもほぼコストがかからない。
+
+_LOG_LOCK = threading.Lock()
+
+
+def _process_started():
+    # プロセスの起動時刻 (time.time() 基準)。/proc が読めなければこのモジュールの読み込み時刻
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.time()
+
+PROCESS_STARTED = _process_started()
+# 起動時の所要時間 (秒)。プロセスで最初の1回だけ記録し、全セッションで共有する
+startup = {}
+
+
+def record_startup(name, seconds):
+    startup.setdefault(name, seconds)
+
+def mark_first_render():
+    # 最初の rerun の終わりに呼ぶと、プロセス起動から画面表示までの時間を記録する
+    record_startup('first_render', time.time() - PROCESS_STARTED)
+
+
+class PerfRecorder:
+    def __init__(self, history=200):
+        self.enabled = False
+        self.log_path = None  # 指定すると1 rerun ごとに JSONL で追記する
+        self.history = deque(maxlen=history)  # 完了した rerun の {処理名: 秒}
+        self._current = None
+        self._last = 0.0
+        self._started = 0.0
+
+    def start_run(self):
+        if not self.enabled:
+            self._current = None
+            return
+        self._current = {}
+        self._started = self._last = time.perf_counter()
+
+    def lap(self, name):
+        # 前回の lap (または start_run) からの経過時間を name に加算する
+        if self._current is None:
+            return
+        now = time.perf_counter()
+        self._current[name] = self._current.get(name, 0.0) + now - self._last
+        self._last = now
+
+    def finish_run(self, **extra):
+        if self._current is None:
+            return None
+        run = dict(self._current)
+        run['total'] = time.perf_counter() - self._started
+        self.history.append(run)
+        self._current = None
+        if self.log_path:
+            line = json.dumps({'timestamp': time.time(), **extra, 'timings': run}, ensure_ascii=False)
+            with _LOG_LOCK, open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        return run
+
+    def summary(self, q=(50, 90, 99)):
+        # 処理名 -> {'last': 直近, 'p50': ..., 'n': 件数} (ミリ秒)
+        if not self.history:
+            return {}
+        names = list(dict.fromkeys(name for run in self.history for name in run))
+        last = self.history[-1]
+        out = {}
+        for name in names:
+            values = np.array([run[name] for run in self.history if name in run]) * 1000
+            row = {'last': last.get(name, np.nan) * 1000}
+            row.update({f'p{p}': v for p, v in zip(q, np.percentile(values, q))})
+            row['n'] = len(values)
+            out[name] = row
+        return out
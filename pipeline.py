@@ -0,0 +1,232 @@
+from dataclasses import dataclass, fields
+import numpy as np
+
+from simulation import (
+    SimulationParams, SimulationResult, ASSET_COLUMNS, build_timeline, compute_income, compute_expenses,
+    compute_mortgage, run_portfolio, assemble_result, result_columns, project_assets,
+    asset_growth_rates, initial_balances, ideco_contributions, project_assets_monthly, monthly_cash_flows,
+    annual_cash_flow, to_yen,
+)
+from cache import ResultCache, RESULT_CACHE, params_key
+
+# シミュレーションをステージの依存グラフとして実行する。
+# 各ステージは自分が読むパラメータと上流ステージのキーだけでメモ化されるので、
+# 例えば為替シナリオだけを変えたときは資産運用ステージだけが再計算される。
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    func: object  # func(params, *上流ステージの出力)
+    fields: tuple  # このステージが読む SimulationParams のフィールド
+    deps: tuple = ()
+
+
+class Pipeline:
+    def __init__(self, stages, maxsize=256):
+        # stages は依存順 (上流が先) に並べる
+        self.stages = tuple(stages)
+        names = set()
+        for stage in self.stages:
+            missing = [d for d in stage.deps if d not in names]
+            if missing:
+                raise ValueError(f"ステージ {stage.name} の依存 {missing} が先に定義されていません")
+            names.add(stage.name)
+        self.caches = {stage.name: ResultCache(maxsize) for stage in self.stages}
+
+    def run(self, params):
+        # (ステージ名 -> 出力, 再計算したステージ名のリスト) を返す
+        keys, outputs, recomputed = {}, {}, []
+        sentinel = object()
+        for stage in self.stages:
+            key = params_key(stage.name, [getattr(params, f) for f in stage.fields], [keys[d] for d in stage.deps])
+            cache = self.caches[stage.name]
+            value = cache.get(key, sentinel)
+            if value is sentinel:
+                value = stage.func(params, *(outputs[d] for d in stage.deps))
+                cache.put(key, value)
+                recomputed.append(stage.name)
+            keys[stage.name] = key
+            outputs[stage.name] = value
+        return outputs, recomputed
+
+    def stats(self):
+        return {name: cache.stats() for name, cache in self.caches.items()}
+
+    def clear(self):
+        for cache in self.caches.values():
+            cache.clear()
+
+
+SIMULATION_STAGES = (
+    Stage('timeline', build_timeline, ('c1_year', 'has_child2', 'c2_year', 'head_age')),
+    Stage('income', compute_income,
+          ('head_income_base', 'head_income_growth', 'retirement_age', 'reemploy_ratio',
+           'retire_completely_age', 'pension_start_age', 'pension_amount', 'partner_income'),
+          deps=('timeline',)),
+    Stage('expenses', compute_expenses,
+          ('c1_edu', 'c1_boarding', 'has_child2', 'c2_edu', 'c2_boarding', 'boarding_cost_yearly',
+           'living_cost_base', 'fixed_cost_housing', 'inflation_rate'),
+          deps=('timeline',)),
+    Stage('mortgage', compute_mortgage,
+          ('mortgage_principal', 'mortgage_start_year', 'mortgage_end_year', 'mortgage_base_rate',
+           'mortgage_reduction_rate', 'mortgage_rate_scenario'),
+          deps=('timeline',)),
+    Stage('portfolio', run_portfolio,
+          ('initial_cash', 'safety_net_val', 'initial_invest_yen', 'yield_yen', 'fx_change_rate',
+           'initial_foreign_cash', 'yield_foreign_cash', 'initial_foreign_bond', 'yield_foreign_bond',
+           'initial_foreign_stock', 'yield_foreign_stock', 'initial_ideco', 'ideco_monthly',
+           'invest_surplus', 'foreign_allocation', 'monthly'),
+          deps=('timeline', 'income', 'expenses', 'mortgage')),
+)
+
+# 表示用でモデルに影響しないフィールド
+UNUSED_FIELDS = ('c1_month', 'c2_month')
+
+def _check_coverage(stages):
+    # フィールドの宣言漏れがあると古い結果を返してしまうので起動時に検査する
+    declared = {f for stage in stages for f in stage.fields} | set(UNUSED_FIELDS)
+    missing = [f.name for f in fields(SimulationParams) if f.name not in declared]
+    if missing:
+        raise RuntimeError(f"どのステージにも宣言されていないパラメータがあります: {missing}")
+
+_check_coverage(SIMULATION_STAGES)
+SIMULATION_PIPELINE = Pipeline(SIMULATION_STAGES)
+
+
+def simulate_incremental(params, pipeline=SIMULATION_PIPELINE):
+    # 全体キャッシュに無ければ、変更のあったステージだけを再計算する
+    def compute():
+        outputs, _ = pipeline.run(params)
+        return assemble_result(outputs['timeline'], outputs['income'], outputs['expenses'],
+                               outputs['mortgage'], outputs['portfolio'])
+    return RESULT_CACHE.get_or_compute(params_key('simulate', params), compute)
+
+
+# --- 複数パラメータの一括計算 ---
+# 縦持ちにするとき型を固定する列 (グループごとに型が変わらないように)
+LONG_DTYPES = {'第1子年齢': np.float64, '第2子年齢': np.float64}
+MONTHLY_ONLY_COLUMNS = ('年内最低貯金',)
+
+@dataclass
+class BatchResult:
+    index: np.ndarray  # 入力リスト上の位置
+    years: np.ndarray
+    columns: dict  # 列名 -> (rows, years) 万円
+    bankrupt_idx: np.ndarray  # 資金ショートした年のインデックス (なければ -1)
+    shortfall_idx: np.ndarray  # 生活防衛資金を維持できなくなった年のインデックス (なければ -1)
+    min_idx: np.ndarray  # 総資産が最小の年のインデックス
+    min_assets_val: np.ndarray  # 最小の総資産 (円)
+
+    @property
+    def n_rows(self):
+        return len(self.index)
+
+    @property
+    def bankrupt(self):
+        return self.bankrupt_idx >= 0
+
+    @property
+    def bankrupt_year(self):
+        # 資金ショートしない行は NaN
+        return np.where(self.bankrupt, self.years[self.bankrupt_idx], np.nan)
+
+    @property
+    def min_assets_year(self):
+        return self.years[self.min_idx]
+
+    @property
+    def final_net_assets(self):
+        return self.columns['純資産'][:, -1]
+
+    def result(self, j):
+        """j 行目を simulate と同じ SimulationResult にする (列はコピーするので、まとめた配列を保持しない)。"""
+        shape = (self.n_rows, len(self.years))
+        year = lambda idx: int(self.years[idx]) if idx >= 0 else None
+        return SimulationResult(
+            {name: np.broadcast_to(values, shape)[j].copy() for name, values in self.columns.items()},
+            bankrupt_year=year(self.bankrupt_idx[j]),
+            shortfall_year=year(self.shortfall_idx[j]),
+            min_assets_year=int(self.years[self.min_idx[j]]),
+            min_assets_val=float(self.min_assets_val[j]),
+        )
+
+    def _long(self):
+        # 列名 -> シナリオ × 年の縦持ち (rows * years,)。(rows, years) の連続配列ならコピーしない。
+        # 子の年齢は子がいないグループだけ NaN (float) になるので、どのグループも float64 にそろえる。
+        # 月次計算だけの列は、年次のグループでも欠損値の列として持たせる (どのグループも同じ列になる)
+        shape = (self.n_rows, len(self.years))
+        columns = {name: np.broadcast_to(values, shape).reshape(-1).astype(LONG_DTYPES.get(name, values.dtype), copy=False)
+                   for name, values in self.columns.items()}
+        for name in MONTHLY_ONLY_COLUMNS:
+            columns.setdefault(name, np.full(self.n_rows * len(self.years), np.nan))
+        return columns
+
+    def to_frame(self, ids):
+        """ids (各行のシナリオ ID) を先頭列にした縦持ちの DataFrame。"""
+        import pandas as pd
+        return pd.DataFrame({'scenario_id': np.repeat(np.asarray(ids, dtype=object), len(self.years)), **self._long()})
+
+    def to_arrow(self, ids):
+        """to_frame と同じ表を Arrow で返す。数値列は配列のメモリをそのまま参照する (NaN は欠損値にする)。"""
+        import pyarrow as pa
+        columns = {name: pa.array(values, from_pandas=True) for name, values in self._long().items()}
+        return pa.table({'scenario_id': pa.array(np.repeat(np.asarray(ids, dtype=object), len(self.years)), pa.string()), **columns})
+
+
+def _stack(dicts):
+    return {k: np.vstack([np.atleast_2d(d[k]) for d in dicts]) for k in dicts[0]}
+
+def simulate_batch(params_list, stages=SIMULATION_STAGES):
+    """多数のパラメータセットをまとめて計算する。
+
+    資産運用以外のステージは読むフィールドが同じ行どうしで使い回し、資産運用は
+    全行を (rows, years) の配列で一度に進める。期間 (年数) と月次/年次の別ごとに BatchResult を返す。
+    """
+    pre_stages = [s for s in stages if s.name != 'portfolio']
+    memo = {s.name: {} for s in pre_stages}
+    groups = {}
+    for row, p in enumerate(params_list):
+        keys, outputs = {}, {}
+        for stage in pre_stages:
+            key = (tuple(getattr(p, f) for f in stage.fields), tuple(keys[d] for d in stage.deps))
+            if key not in memo[stage.name]:
+                memo[stage.name][key] = stage.func(p, *(outputs[d] for d in stage.deps))
+            keys[stage.name] = key
+            outputs[stage.name] = memo[stage.name][key]
+        groups.setdefault((len(outputs['timeline']['西暦']), p.monthly), []).append((row, p, outputs))
+
+    results = []
+    for (_, monthly), members in groups.items():
+        rows = [m[0] for m in members]
+        ps = [m[1] for m in members]
+        timeline = _stack([m[2]['timeline'] for m in members])
+        income = _stack([m[2]['income'] for m in members])
+        expenses = _stack([m[2]['expenses'] for m in members])
+        mortgage = _stack([m[2]['mortgage'] for m in members])
+        ideco_add = np.vstack([ideco_contributions(p, m[2]['timeline']) for p, m in zip(ps, members)])
+        growth = _stack([{k: np.asarray(v, dtype=float).reshape(1, 1) for k, v in asset_growth_rates(p).items()} for p in ps])
+        balances = [initial_balances(p) for p in ps]
+        initial = {k: np.array([b[k] for b in balances]) for k in ASSET_COLUMNS}
+
+        cash_flow = annual_cash_flow(income, expenses, mortgage, ideco_add)
+        policy = (
+            np.array([to_yen(p.safety_net_val) for p in ps]),
+            np.array([p.invest_surplus for p in ps]),
+            np.array([p.foreign_allocation for p in ps], dtype=float),
+        )
+        if monthly:
+            assets = project_assets_monthly(initial, growth, monthly_cash_flows(income, expenses, mortgage, ideco_add), ideco_add, *policy)
+        else:
+            assets = project_assets(initial, growth, cash_flow, ideco_add, *policy)
+        assets['年間収支'] = cash_flow
+        results.append(BatchResult(
+            index=np.array(rows),
+            years=members[0][2]['timeline']['西暦'],
+            columns=result_columns(timeline, income, expenses, mortgage, assets),
+            bankrupt_idx=assets['bankrupt_idx'],
+            shortfall_idx=assets['shortfall_idx'],
+            min_idx=assets['min_idx'],
+            min_assets_val=assets['total'][np.arange(len(rows)), assets['min_idx']],
+        ))
+    return results
@@ -0,0 +1,723 @@
+import types
+from dataclasses import dataclass, field, fields, asdict
+import numpy as np
+
+from mortgage import amortize, yearly_schedule
+
+# --- 単位 ---
+# 入力と結果表は万円、資産運用の計算は円。変換は to_yen / to_man だけで行う
+YEN_PER_MAN = 10000
+
+
+def to_yen(man):
+    return man * YEN_PER_MAN
+
+def to_man(yen, dtype=None):
+    # dtype (np.float32 など) を指定すると、その型の配列に直接書き込む (float64 の中間配列を作らない)
+    if dtype is None:
+        return yen / YEN_PER_MAN
+    return np.divide(yen, YEN_PER_MAN, out=np.empty(np.shape(yen), dtype=dtype), casting='same_kind')
+
+# --- 定数データ ---
+EDUCATION_COSTS = {
+    '【A】公立中心(塾しっかり)': [10, 10, 10, 25, 25, 25, 35, 35, 35, 40, 45, 50, 60, 60, 80, 60, 70, 90, 90, 55, 55, 55, 0],
+    '【B】中高公立・私大文系': [10, 10, 10, 25, 25, 25, 35, 35, 35, 40, 45, 50, 60, 60, 80, 60, 70, 90, 135, 105, 105, 105, 0],
+    '【C】中高公立・私大理系': [10, 10, 10, 25, 25, 25, 35, 35, 35, 40, 45, 50, 60, 60, 80, 60, 70, 90, 170, 150, 150, 150, 0],
+    '【D】高校から私立(文系大)': [10, 10, 10, 25, 25, 25, 35, 35, 35, 40, 45, 50, 60, 60, 80, 100, 100, 110, 135, 105, 105, 105, 0],
+    '【E】高校から私立(理系大)': [10, 10, 10, 25, 25, 25, 35, 35, 35, 40, 45, 50, 60, 60, 80, 100, 100, 110, 170, 150, 150, 150, 0],
+    '【F】中学受験(私立中高一貫)・文系大': [10, 10, 10, 25, 25, 25, 35, 35, 35, 80, 100, 140, 145, 145, 150, 110, 110, 120, 135, 105, 105, 105, 0],
+    '【G】中学受験(私立中高一貫)・理系大': [10, 10, 10, 25, 25, 25, 35, 35, 35, 80, 100, 140, 145, 145, 150, 110, 110, 120, 170, 150, 150, 150, 0],
+    '【H】小学校から私立(文系大)': [10, 10, 10, 25, 25, 25, 160, 160, 160, 160, 170, 180, 145, 145, 150, 110, 110, 120, 135, 105, 105, 105, 0],
+    '【I】小学校から私立(理系大)': [10, 10, 10, 25, 25, 25, 160, 160, 160, 160, 170, 180, 145, 145, 150, 110, 110, 120, 170, 150, 150, 150, 0],
+}
+
+REARING_COSTS = {
+    '【A】標準プラン': [80, 80, 80, 90, 90, 90, 100, 100, 100, 110, 110, 120, 130, 130, 130, 140, 140, 140, 100, 100, 100, 100, 0],
+    '【B】ゆとりプラン': [100, 100, 100, 110, 110, 110, 120, 120, 120, 130, 130, 140, 150, 150, 150, 160, 160, 160, 150, 150, 150, 150, 0],
+}
+
+def _lookup_tables(costs):
+    # 年齢 -> 費用 (万円) の表を一度だけ NumPy 配列にしておく (プロセス内の全セッションで共有、書き換え不可)
+    tables = {}
+    for name, values in costs.items():
+        table = np.asarray(values)
+        table.setflags(write=False)
+        tables[name] = table
+    return types.MappingProxyType(tables)
+
+EDUCATION_TABLES = _lookup_tables(EDUCATION_COSTS)
+REARING_TABLES = _lookup_tables(REARING_COSTS)
+
+INCOME_PRESETS = {
+    '【A】保守的': {'base': 800, 'growth': 0.5},
+    '【B】標準': {'base': 800, 'growth': 1.5},
+    '【C】積極': {'base': 800, 'growth': 3.0},
+}
+
+LIVING_PRESETS = {
+    '【A】節約 (月30万)': 360,
+    '【B】標準 (月38万)': 456,
+    '【C】ゆとり (月48万)': 576,
+}
+
+INFLATION_PRESETS = {'0% (ゼロ)': 0.00, '1% (低め)': 0.01, '2% (標準)': 0.02, '3% (高め)': 0.03}
+MORTGAGE_RATE_SCENARIOS = {'固定 (変動なし)': 'fixed', '安定 (±微減)': 'stable', '緩やか上昇 (+0.05%/年)': 'rising', '急上昇 (+0.2%/年)': 'sharp_rising'}
+
+# 為替シナリオ定義
+FX_SCENARIOS = {
+    '📈 円安トレンド (米ドル価値 +1.0%/年)': 0.01,
+    '➡️ 為替横ばい (±0%/年)': 0.00,
+    '📉 緩やかな円高 (米ドル価値 -1.0%/年)': -0.01,
+    '⏬ 急速な円高 (米ドル価値 -2.5%/年)': -0.025,
+}
+
+START_YEAR = 2025
+# 養育費は標準プラン固定
+REARING_PLAN = '【A】標準プラン'
+
+
+# --- パラメータ ---
+@dataclass(frozen=True)
+class SimulationParams:
+    # 1. お子様・教育
+    c1_year: int = 2025
+    c1_month: int = 2
+    c1_edu: str = '【I】小学校から私立(理系大)'
+    c1_boarding: bool = False
+    has_child2: bool = False
+    c2_year: int | None = None
+    c2_month: int | None = None
+    c2_edu: str | None = None
+    c2_boarding: bool = False
+    boarding_cost_yearly: float = 0
+
+    # 2. 収入・生活費・定年
+    head_age: int = 38
+    head_income_base: float = 1050
+    head_income_growth: float = 1.5
+    retirement_age: int = 60
+    reemploy_ratio: float = 60
+    retire_completely_age: int = 65
+    pension_start_age: int = 65
+    pension_amount: float = 240
+    partner_income: float = 0
+    living_cost_base: float = 576
+    fixed_cost_housing: float = 19.2
+    inflation_rate: float = 0.02
+
+    # 3. 資産・ポートフォリオ
+    initial_cash: float = 330
+    safety_net_val: float = 300
+    initial_invest_yen: float = 360
+    yield_yen: float = 0.5
+    fx_change_rate: float = 0.01
+    initial_foreign_cash: float = 58
+    yield_foreign_cash: float = 2.0
+    initial_foreign_bond: float = 406
+    yield_foreign_bond: float = 3.0
+    initial_foreign_stock: float = 1683
+    yield_foreign_stock: float = 5.0
+    initial_ideco: float = 190
+    ideco_monthly: float = 3.0
+    invest_surplus: bool = True
+    foreign_allocation: float = 100
+
+    # 4. 住宅ローン
+    mortgage_principal: float = 6460
+    mortgage_start_year: int = 2024
+    mortgage_end_year: int = 2059
+    mortgage_base_rate: float = 2.841
+    mortgage_reduction_rate: float = 2.057
+    mortgage_rate_scenario: str = 'fixed'
+
+    # 5. 計算の細かさ
+    monthly: bool = False  # 月次で資金繰りを計算する (賞与・学費の納付月・年度途中の不足を反映)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, record):
+        # JSON / CSV の1行からパラメータを作る。CSV の文字列はフィールドの型に合わせて変換し、
+        # 空欄は None (省略可能なフィールド) か既定値になる
+        known = {f.name: f.type for f in fields(cls)}
+        unknown = sorted(set(record) - set(known))
+        if unknown:
+            raise ValueError(f"未知のパラメータがあります: {unknown}")
+        values = {}
+        for name, value in record.items():
+            optional = isinstance(known[name], types.UnionType)
+            if value is None or value == '':
+                if optional:
+                    values[name] = None
+                continue
+            values[name] = _coerce(name, value, _base_type(known[name]))
+        params = cls(**values)
+        _check_consistency(params)
+        return params
+
+
+def _check_consistency(p):
+    # 型は正しくても計算できない組み合わせ (表に無い教育プラン、第2子の誕生年なしなど) を弾く
+    for name in ('c1_edu',) + (('c2_edu',) if p.has_child2 else ()):
+        if getattr(p, name) not in EDUCATION_COSTS:
+            raise ValueError(f"{name} の値 {getattr(p, name)!r} は教育プランにありません (選べるもの: {list(EDUCATION_COSTS)})")
+    if p.has_child2 and p.c2_year is None:
+        raise ValueError("c2_year を指定してください (has_child2 が true のときは必須です)")
+    if p.mortgage_rate_scenario not in MORTGAGE_RATE_SCENARIOS.values():
+        raise ValueError(f"mortgage_rate_scenario の値 {p.mortgage_rate_scenario!r} は金利シナリオにありません "
+                         f"(選べるもの: {list(MORTGAGE_RATE_SCENARIOS.values())})")
+
+
+_TRUE_STRINGS = ('1', 'true', 'yes', 'on')
+_FALSE_STRINGS = ('0', 'false', 'no', 'off')
+
+def _base_type(tp):
+    # int | None -> int
+    if isinstance(tp, types.UnionType):
+        return next(t for t in tp.__args__ if t is not type(None))
+    return tp
+
+def _coerce(name, value, tp):
+    try:
+        if tp is bool:
+            if isinstance(value, str):
+                if value.strip().lower() in _TRUE_STRINGS: return True
+                if value.strip().lower() in _FALSE_STRINGS: return False
+                raise ValueError(value)
+            return bool(value)
+        if tp is int:
+            number = float(value)
+            if not number.is_integer(): raise ValueError(value)
+            return int(number)
+        if tp is float:
+            return float(value)
+        return str(value)
+    except ValueError:
+        raise ValueError(f"{name} の値 {value!r} を {tp.__name__} に変換できません") from None
+
+
+# --- 結果 ---
+@dataclass
+class SimulationResult:
+    # 列名 -> 年次配列 (金額は万円)
+    columns: dict = field(default_factory=dict)
+    bankrupt_year: int | None = None
+    shortfall_year: int | None = None  # 生活防衛資金を維持できなくなった年
+    min_assets_year: int = START_YEAR
+    min_assets_val: float = float('inf')  # 円
+
+    @property
+    def years(self):
+        return self.columns['西暦']
+
+    @property
+    def final_net_assets(self):
+        return float(self.columns['純資産'][-1])
+
+    @property
+    def min_assets_disp(self):
+        # 最も苦しい年の総資産 (万円)
+        return float(self.columns['総資産'][self.years == self.min_assets_year][0])
+
+    @property
+    def total_child_cost(self):
+        return float(self.columns['教育・養育・仕送り'].sum())
+
+    def to_frame(self, columns=None):
+        # pandas は読み込みが重いので、表が要るときに初めて import する (ワーカープロセスの起動も速くなる)
+        import pandas as pd
+        names = list(self.columns) if columns is None else list(columns)
+        return pd.DataFrame({name: self.columns[name] for name in names}, index=self.years)
+
+    def to_arrow(self, columns=None):
+        # 数値列は配列のメモリをそのまま参照する (コピーしない)。NaN (第2子なしの年齢など) は欠損値にする
+        import pyarrow as pa
+        names = list(self.columns) if columns is None else list(columns)
+        return pa.table({name: pa.array(np.ascontiguousarray(self.columns[name]), from_pandas=True) for name in names})
+
+    def to_parquet(self, where=None, columns=None):
+        # where (パスまたはファイル) を省略すると Parquet のバイト列を返す
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        sink = pa.BufferOutputStream() if where is None else where
+        pq.write_table(self.to_arrow(columns), sink)
+        return sink.getvalue().to_pybytes() if where is None else None
+
+
+# --- 関数定義 ---
+def get_rate_fluctuation(scenario, current_base_rate, rng=None):
+    if scenario == 'fixed': return current_base_rate
+    elif scenario == 'stable': return current_base_rate + ((rng or np.random).random() - 0.45) * 0.05
+    elif scenario == 'rising': return current_base_rate + 0.05
+    elif scenario == 'sharp_rising': return current_base_rate + 0.20
+    return current_base_rate
+
+def get_cost(age, cost_list):
+    if 0 <= age < len(cost_list): return cost_list[age]
+    return 0
+
+def get_boarding_cost(age, is_boarding, cost_per_year):
+    if is_boarding and (18 <= age <= 21): return cost_per_year
+    return 0
+
+def lookup_costs(ages, cost_list):
+    # get_cost の配列版 (範囲外・NaN は 0)。cost_list は EDUCATION_TABLES などの配列ならコピーしない
+    table = np.asarray(cost_list)
+    valid = (ages >= 0) & (ages < len(table))
+    idx = np.where(valid, ages, 0).astype(np.int64)
+    return np.where(valid, table[idx], 0)
+
+def boarding_costs(ages, is_boarding, cost_per_year):
+    if not is_boarding: return np.zeros(len(ages), dtype=np.int64)
+    return np.where((ages >= 18) & (ages <= 21), cost_per_year, 0)
+
+
+# --- ステージ ---
+def build_timeline(p):
+    last_child_grad_year = p.c1_year + 23
+    if p.has_child2: last_child_grad_year = max(last_child_grad_year, p.c2_year + 23)
+    end_year = max(START_YEAR + 45, last_child_grad_year)
+    years = np.arange(START_YEAR, end_year + 1)
+    elapsed = years - START_YEAR
+    return {
+        '西暦': years,
+        '経過年数': elapsed,
+        '世帯主年齢': p.head_age + elapsed,
+        '第1子年齢': years - p.c1_year,
+        '第2子年齢': (years - p.c2_year) if p.has_child2 else np.full(len(years), np.nan),
+    }
+
+def compute_income(p, timeline, wage_index=None):
+    # wage_index (paths, years) を渡すと昇給率の代わりにその累積指数で年収を伸ばす
+    elapsed = timeline['経過年数']
+    ages = timeline['世帯主年齢']
+    working = ages < p.retirement_age
+    reemployed = ~working & (ages < p.retire_completely_age)
+    if wage_index is None:
+        salary = p.head_income_base * (1 + p.head_income_growth / 100) ** elapsed
+    else:
+        salary = p.head_income_base * wage_index
+    # 再雇用時は定年直前年の年収が基準
+    n_working = int(working.sum())
+    peak_income = salary[..., n_working - 1:n_working] if n_working > 0 else 0
+    head_incomes = np.where(working, salary, np.where(reemployed, peak_income * (p.reemploy_ratio / 100), 0))
+    pension_incomes = np.where(ages >= p.pension_start_age, p.pension_amount, 0)
+    return {
+        '世帯主労働収入': head_incomes,
+        '年金収入': pension_incomes,
+        '世帯収入': head_incomes + p.partner_income + pension_incomes,
+    }
+
+def compute_expenses(p, timeline, price_index=None):
+    # price_index (paths, years) を渡すと生活費・教育費・養育費・仕送りをその物価指数で伸ばす
+    c1_age, c2_age = timeline['第1子年齢'], timeline['第2子年齢']
+    edu = lookup_costs(c1_age, EDUCATION_TABLES[p.c1_edu])
+    rearing = lookup_costs(c1_age, REARING_TABLES[REARING_PLAN])
+    boarding = boarding_costs(c1_age, p.c1_boarding, p.boarding_cost_yearly)
+    if p.has_child2:
+        edu = edu + lookup_costs(c2_age, EDUCATION_TABLES[p.c2_edu])
+        rearing = rearing + lookup_costs(c2_age, REARING_TABLES[REARING_PLAN])
+        boarding = boarding + boarding_costs(c2_age, p.c2_boarding, p.boarding_cost_yearly)
+    if price_index is None:
+        living = p.living_cost_base * (1 + p.inflation_rate) ** timeline['経過年数'] + p.fixed_cost_housing
+    else:
+        living = p.living_cost_base * price_index + p.fixed_cost_housing
+        edu, rearing, boarding = edu * price_index, rearing * price_index, boarding * price_index
+    return {
+        '教育費': edu,
+        '養育費': rearing,
+        '仕送り': boarding,
+        '生活費(インフレ込)': living,
+        '支出計(ローン除)': edu + rearing + boarding + living,
+    }
+
+def mortgage_rate_path(p, n_years, rng=None):
+    # 各年の基準金利 (%)。'stable' の揺らぎは rng (省略時はシード 0) から作るので毎回同じ結果になる
+    if p.mortgage_rate_scenario != 'stable':
+        steps = np.full(n_years, get_rate_fluctuation(p.mortgage_rate_scenario, 0.0))
+    else:
+        rng = np.random.default_rng(0) if rng is None else rng
+        steps = (rng.random(n_years) - 0.45) * 0.05
+    steps[0] = 0
+    return p.mortgage_base_rate + np.cumsum(steps)
+
+def compute_mortgage(p, timeline, base_rates=None):
+    # 年末ローン残高と年間返済額 (円)。base_rates は (paths, years) の基準金利パス
+    years = timeline['西暦']
+    if base_rates is None: base_rates = mortgage_rate_path(p, len(years))
+    base_rates = np.atleast_2d(base_rates)
+
+    # ローン初期計算: 返済開始からシミュレーション開始 (4月) までの返済
+    months_before = max(0, (START_YEAR - p.mortgage_start_year) * 12 + 3)
+    monthly_r_init = max(0, (p.mortgage_base_rate - p.mortgage_reduction_rate) / 100 / 12)
+    total_months = (p.mortgage_end_year - p.mortgage_start_year) * 12
+    balance, _, _ = amortize(to_yen(p.mortgage_principal), monthly_r_init, total_months, months_before)
+
+    applied_rate = np.maximum(0, base_rates - p.mortgage_reduction_rate)
+    schedule = yearly_schedule(balance, applied_rate, years, p.mortgage_end_year)
+    return {'loan_balance': schedule.balance, 'annual_payment': schedule.payment}
+
+ASSET_COLUMNS = ('貯金', '国内資産', '外国(現金)', '外国(債券)', '外国(株)', 'iDeCo')
+# 黒字の投資先・リバランスの対象
+INVESTABLE_COLUMNS = ('国内資産', '外国(現金)', '外国(債券)', '外国(株)')
+# 既定の取り崩し順 (生活防衛資金の不足分)
+DEFAULT_DRAWDOWN_ORDER = ('外国(株)', '外国(債券)', '国内資産')
+IDECO_UNLOCK_AGE = 60  # iDeCo を取り崩せる年齢
+
+def project_assets(initial, growth, cash_flow, ideco_add, safety_net_amount, invest_surplus, foreign_allocation,
+                   plan=None, ages=None, flex_spending=None):
+    """資産推移を (paths, years) の配列で一括計算する (金額は円)。
+
+    initial は ASSET_COLUMNS ごとの初期残高、growth は '国内資産' / '外国(現金)' /
+    '外国(債券)' / '外国(株)' の年次成長率で、いずれも (paths, years) に
+    ブロードキャストできればよい。iDeCo は外国株と同じ成長率で運用する。
+    plan (strategy.StrategyPlan) で取り崩し順・配分・リバランス・支出のガードレールを
+    パスごとに変えられる。省略時は DEFAULT_DRAWDOWN_ORDER の順に取り崩し、黒字は
+    foreign_allocation に従って外国株と国内資産に配分する。ages (years,) は iDeCo の
+    取り崩しと年齢による配分に、flex_spending (円) はガードレールで削る支出に使う。
+    """
+    n_paths, n_years = cash_flow.shape
+    shape = (n_paths, n_years)
+    col = {k: j for j, k in enumerate(ASSET_COLUMNS)}
+    growth_rows = [(col[k], np.broadcast_to(growth[k], shape)) for k in INVESTABLE_COLUMNS]
+    g_f_stock = np.broadcast_to(growth['外国(株)'], shape)
+    ideco_add = np.broadcast_to(ideco_add, shape)
+    safety_net_amount = np.broadcast_to(np.asarray(safety_net_amount, dtype=float), (n_paths,))
+    invest_surplus = np.broadcast_to(np.asarray(invest_surplus, dtype=bool), (n_paths,))
+    allocation = np.broadcast_to(np.asarray(foreign_allocation, dtype=float) / 100.0, (n_paths,))
+
+    # 残高は (資産, paths)。資産ごとの行が連続するので行単位の演算が速い
+    bal = np.empty((len(ASSET_COLUMNS), n_paths))
+    for k, j in col.items():
+        bal[j] = np.broadcast_to(np.asarray(initial[k], dtype=float), (n_paths,))
+    cash, ideco = bal[col['貯金']], bal[col['iDeCo']]
+    invest_rows = [col[k] for k in INVESTABLE_COLUMNS]
+    if plan is None:
+        order = np.array([col[k] for k in DEFAULT_DRAWDOWN_ORDER])
+        default_weights = np.zeros((len(ASSET_COLUMNS), n_paths))
+        default_weights[col['外国(株)']] = allocation
+        default_weights[col['国内資産']] = 1 - allocation
+        weights_at = lambda i: default_weights
+    else:
+        order = plan.order
+        weights_at = lambda i: plan.weights(i, allocation)
+    if ages is None and (order == col['iDeCo']).any():
+        raise ValueError("iDeCo を取り崩すには ages が必要です")
+    guardrail = plan is not None and plan.guard_drawdown is not None
+    if guardrail:
+        flex_spending = np.broadcast_to(0 if flex_spending is None else flex_spending, shape)
+        liquid = bal[:col['iDeCo']].sum(axis=0)
+        peak = liquid.copy()
+        cuts = np.zeros(shape)
+    paths = np.arange(n_paths) if order.ndim > 1 else None
+
+    hist = {k: np.empty(shape) for k in ASSET_COLUMNS}
+    bankrupt_idx = np.full(n_paths, -1)
+    shortfall_idx = np.full(n_paths, -1)
+
+    for i in range(n_years):
+        # iDeCo積立と運用 (積立は年央に入る想定)
+        add = ideco_add[:, i]
+        ideco += add + (ideco + add / 2) * g_f_stock[:, i]
+
+        # --- 資産運用 (成長) ---
+        for j, g in growth_rows:
+            bal[j] *= (1 + g[:, i])
+        cash += cash_flow[:, i]
+
+        # --- 支出のガードレール ---
+        # 流動資産が最高値から guard_drawdown 以上減っていたら、その年の削れる支出を guard_cut 減らす
+        if guardrail:
+            cut = np.where(liquid < peak * (1 - plan.guard_drawdown), flex_spending[:, i] * plan.guard_cut, 0)
+            cash += cut
+            cuts[:, i] = cut
+
+        # --- 生活防衛資金ロジック ---
+        # 不足分を取り崩し順に補う
+        deficit = np.where(cash < safety_net_amount, safety_net_amount - cash, 0)
+        ideco_locked = ages is not None and ages[i] < IDECO_UNLOCK_AGE
+        for k in range(order.shape[-1]):
+            if order.ndim == 1:
+                j = order[k]
+                if j == col['iDeCo'] and ideco_locked:
+                    continue
+                take = np.minimum(bal[j], deficit)
+                bal[j] -= take
+            else:
+                # パスごとに取り崩し順が違う (-1 は該当なし)
+                j = order[:, k]
+                rows = np.maximum(j, 0)
+                available = np.where((j < 0) | ((j == col['iDeCo']) & ideco_locked), 0, bal[rows, paths])
+                take = np.minimum(available, deficit)
+                bal[rows, paths] -= take
+            cash += take
+            deficit -= take
+        # 取り崩せる資産が尽きて生活防衛資金を維持できない / 現金もマイナス (資金ショート)
+        shortfall_idx[(deficit > 0) & (shortfall_idx < 0)] = i
+        bankrupt_idx[(deficit > 0) & (cash < 0) & (bankrupt_idx < 0)] = i
+
+        # 黒字分を配分に従って投資する
+        surplus = np.where((cash > safety_net_amount) & invest_surplus, cash - safety_net_amount, 0)
+        cash -= surplus
+        weights = weights_at(i)
+        for j in invest_rows:
+            bal[j] += surplus * weights[j]
+
+        # 目標配分へのリバランス
+        if plan is not None and plan.rebalance is not None:
+            invested = bal[invest_rows].sum(axis=0)
+            for j in invest_rows:
+                bal[j] = np.where(plan.rebalance, invested * weights[j], bal[j])
+
+        if guardrail:
+            liquid = bal[:col['iDeCo']].sum(axis=0)
+            np.maximum(peak, liquid, out=peak)
+
+        for k, j in col.items():
+            hist[k][:, i] = bal[j]
+
+    total = hist['貯金'] + hist['国内資産'] + hist['外国(現金)'] + hist['外国(債券)'] + hist['外国(株)'] + hist['iDeCo']
+    hist['bankrupt_idx'] = bankrupt_idx
+    hist['shortfall_idx'] = shortfall_idx
+    hist['min_idx'] = np.argmin(total, axis=1)
+    hist['total'] = total
+    if guardrail:
+        hist['spending_cut'] = cuts
+    return hist
+
+# --- 月次の資金繰り ---
+# 1年 (経過年数) は4月から翌3月まで。各年の金額を次の割合で月に割り振る
+FISCAL_MONTHS = np.array([4, 5, 6, 7, 8, 9, 10, 11, 12, 1, 2, 3])
+BONUS_MONTHS = {6: 2.0, 12: 2.0}  # 賞与の月と、月給の何か月分か (年収 = 月給 × 16)
+PENSION_MONTHS = (2, 4, 6, 8, 10, 12)  # 年金は偶数月に2か月分ずつ
+EDUCATION_PAYMENT_MONTHS = {4: 0.5, 10: 0.5}  # 学費は前期 (4月) と後期 (10月) に納める
+
+def monthly_shares(weights):
+    # {月: 重み} -> FISCAL_MONTHS 順の割合 (合計 1)
+    w = np.array([weights.get(int(m), 0.0) for m in FISCAL_MONTHS], dtype=float)
+    return w / w.sum()
+
+SALARY_SHARE = monthly_shares({m: 1.0 + BONUS_MONTHS.get(m, 0.0) for m in range(1, 13)})
+PENSION_SHARE = monthly_shares({m: 1.0 for m in PENSION_MONTHS})
+EDUCATION_SHARE = monthly_shares(EDUCATION_PAYMENT_MONTHS)
+EVEN_SHARE = np.full(12, 1 / 12)
+
+def monthly_cash_flows(income, expenses, mortgage, ideco_add):
+    """年次の収入・支出 (円) を、月への割り振り方ごとに (金額, 割合) の組にする。
+
+    金額は (paths, years) にブロードキャストでき、支出は負。各年の合計は年次の収支と同じ。
+    """
+    labor = to_yen(income['世帯収入'] - income['年金収入'])  # 世帯主と配偶者の給与
+    other = expenses['養育費'] + expenses['仕送り'] + expenses['生活費(インフレ込)']
+    return (
+        (labor, SALARY_SHARE),
+        (to_yen(income['年金収入']), PENSION_SHARE),
+        (-to_yen(expenses['教育費']), EDUCATION_SHARE),
+        (-to_yen(other) - mortgage['annual_payment'] - ideco_add, EVEN_SHARE),
+    )
+
+def _accumulate(ufunc, a):
+    # ufunc.accumulate(a, axis=0) と同じ。(12か月, paths) のように行が少なく列が多い配列では、
+    # 行ごとに ufunc を呼ぶ方が NumPy の accumulate より数倍速い
+    out = np.array(a, dtype=float)
+    for m in range(1, len(out)):
+        ufunc(out[m], out[m - 1], out=out[m])
+    return out
+
+def _increments(a):
+    # 累計 (月, paths) -> 各月の増分
+    out = a.copy()
+    out[1:] -= a[:-1]
+    return out
+
+def project_assets_monthly(initial, growth, flows, ideco_add, safety_net_amount, invest_surplus, foreign_allocation):
+    """project_assets の月次版。貯金は毎月の収支で増減し、生活防衛資金を割った月にその分を取り崩す。
+
+    flows は monthly_cash_flows の (金額, 割合) の組、ideco_add は年間の iDeCo 積立 (毎月末に 1/12)。
+    年内の12か月は (月, paths) の配列の累積和・累積最小値で計算する。Python のループは年の外側ループと、
+    _accumulate の中の月のループ (1回ごとに全パス分の ufunc を呼ぶ) で、パスについてはループしない。
+    取り崩しが要る年は取り崩し順の資産ごとのループも加わるが、不足が出たパスだけを取り出して計算するので、
+    黒字の年はほとんどコストがかからない。
+    黒字の投資は年次版と同じく年度末に行い、取り崩し順は DEFAULT_DRAWDOWN_ORDER (戦略は年次版のみ)。
+    戻り値は project_assets と同じ年度末の値に加え、'年内最低貯金' (paths, years) を持つ。
+    """
+    n_paths, n_years = np.broadcast_shapes(*(np.shape(a) for a, _ in flows), *(np.shape(growth[k]) for k in INVESTABLE_COLUMNS))
+    col = {k: j for j, k in enumerate(ASSET_COLUMNS)}
+
+    def by_year(a):
+        # (paths, years) -> (years, paths) の連続した配列 (年ごとの行を速く取り出す)。
+        # 全パスで同じ値なら (years, 1) のまま使い、パス数分に広げない
+        a = np.atleast_2d(np.asarray(a, dtype=float))
+        return np.ascontiguousarray(np.broadcast_to(a, (a.shape[0], n_years)).T)
+    flows = [(by_year(amount), np.asarray(share)[:, None]) for amount, share in flows]
+    factors = {k: 1 + by_year(growth[k]) for k in INVESTABLE_COLUMNS}  # 年率の成長 (1 + g)
+    ideco_add = by_year(ideco_add)
+    safety_net_amount = np.broadcast_to(np.asarray(safety_net_amount, dtype=float), (n_paths,))
+    invest_surplus = np.broadcast_to(np.asarray(invest_surplus, dtype=bool), (n_paths,))
+    allocation = np.broadcast_to(np.asarray(foreign_allocation, dtype=float) / 100.0, (n_paths,))
+
+    bal = np.empty((len(ASSET_COLUMNS), n_paths))
+    for k, j in col.items():
+        bal[j] = np.broadcast_to(np.asarray(initial[k], dtype=float), (n_paths,))
+    cash, ideco = bal[col['貯金']], bal[col['iDeCo']]
+    order = [(col[k], k) for k in DEFAULT_DRAWDOWN_ORDER]
+
+    # 年末の残高と年内最低の貯金は (years, ...) に書き、最後に (paths, years) にする
+    year_end = np.empty((n_years, len(ASSET_COLUMNS), n_paths))
+    min_cash = np.empty((n_years, n_paths))
+    bankrupt_idx = np.full(n_paths, -1)
+    shortfall_idx = np.full(n_paths, -1)
+
+    for i in range(n_years):
+        f = {k: v[i] for k, v in factors.items()}
+
+        # iDeCo: 毎月末に積み立て、残りの月数だけ外国株と同じ成長をする (月率 r の等比級数)
+        r = f['外国(株)'] ** (1 / 12)
+        months_grown = np.where(r != 1, (f['外国(株)'] - 1) / np.where(r != 1, r - 1, 1), 12)
+        ideco *= f['外国(株)']
+        ideco += ideco_add[i] / 12 * months_grown
+
+        # 取り崩す前の月末の貯金 (月, paths) と、生活防衛資金を割らないためにその月までに取り崩す累計額
+        flow = sum(share * amount[i] for amount, share in flows)
+        month_cash = cash + _accumulate(np.add, flow)
+        need = np.maximum(safety_net_amount - _accumulate(np.minimum, month_cash), 0)
+
+        rows = np.flatnonzero(need[-1] > 0)
+        if rows.size:
+            # 取り崩しが要るパスだけ: 各月の不足を、年初の価値に割り戻して取り崩し順に年初残高から充てる
+            need = need[:, rows]
+            demand = _increments(need)
+            month_cash[:, rows] += need
+            left = np.arange(rows.size)  # 不足が残っている列 (rows の中の位置)
+            for j, k in order:
+                paths = rows[left]
+                d = demand[:, left]
+                # 年初からの累積成長 (月, paths) = 月率の累積積
+                monthly = f[k][paths if f[k].size > 1 else [0]] ** (1 / 12)
+                grown = _accumulate(np.multiply, np.broadcast_to(monthly, (12, monthly.size)))
+                units = _accumulate(np.add, d / grown)
+                cap = bal[j, paths]
+                # 年末まで足りる列は不足をそのまま充てる。途中で尽きる列は残高の分だけ
+                short = units[-1] > cap
+                bal[j, paths] -= np.minimum(units[-1], cap)
+                demand[:, left[~short]] = 0
+                left = left[short]
+                if not left.size:
+                    break
+                # 残高を超えた分 (年初の価値) の各月の増分が、次の資産に回す不足
+                over = np.maximum(units[:, short] - cap[short], 0)
+                demand[:, left] = _increments(over) * grown[:, short if grown.shape[1] > 1 else [0]]
+            if left.size:
+                # 取り崩せる資産が尽きた月がある / 現金もマイナスになった月がある (資金ショート)
+                unmet = rows[left]
+                month_cash[:, unmet] -= _accumulate(np.add, demand[:, left])
+                shortfall_idx[unmet[shortfall_idx[unmet] < 0]] = i
+                broke = unmet[(month_cash[:, unmet] < 0).any(axis=0)]
+                bankrupt_idx[broke[bankrupt_idx[broke] < 0]] = i
+        for k in INVESTABLE_COLUMNS:
+            bal[col[k]] *= f[k]
+        cash[:] = month_cash[-1]
+        min_cash[i] = month_cash.min(axis=0)
+
+        # 黒字分を年度末に配分に従って投資する
+        surplus = np.where((cash > safety_net_amount) & invest_surplus, cash - safety_net_amount, 0)
+        cash -= surplus
+        bal[col['外国(株)']] += surplus * allocation
+        bal[col['国内資産']] += surplus * (1 - allocation)
+        year_end[i] = bal
+
+    hist = {k: np.ascontiguousarray(year_end[:, j].T) for k, j in col.items()}
+    total = hist['貯金'] + hist['国内資産'] + hist['外国(現金)'] + hist['外国(債券)'] + hist['外国(株)'] + hist['iDeCo']
+    hist['bankrupt_idx'] = bankrupt_idx
+    hist['shortfall_idx'] = shortfall_idx
+    hist['min_idx'] = np.argmin(total, axis=1)
+    hist['total'] = total
+    hist['年内最低貯金'] = np.ascontiguousarray(min_cash.T)
+    return hist
+
+def asset_growth_rates(p, fx_change_rate=None, stock=None, bond=None, cash=None, yen=None):
+    # 利回り (小数) と為替変動率から円建ての年次成長率を求める。省略時はパラメータの固定値
+    fx = p.fx_change_rate if fx_change_rate is None else fx_change_rate
+    stock = p.yield_foreign_stock / 100 if stock is None else stock
+    bond = p.yield_foreign_bond / 100 if bond is None else bond
+    cash = p.yield_foreign_cash / 100 if cash is None else cash
+    yen = p.yield_yen / 100 if yen is None else yen
+    return {
+        '国内資産': yen,
+        '外国(現金)': (1 + cash) * (1 + fx) - 1,
+        '外国(債券)': (1 + bond) * (1 + fx) - 1,
+        '外国(株)': (1 + stock) * (1 + fx) - 1,
+    }
+
+def initial_balances(p):
+    return {
+        '貯金': to_yen(p.initial_cash),
+        '国内資産': to_yen(p.initial_invest_yen),
+        '外国(現金)': to_yen(p.initial_foreign_cash),
+        '外国(債券)': to_yen(p.initial_foreign_bond),
+        '外国(株)': to_yen(p.initial_foreign_stock),
+        'iDeCo': to_yen(p.initial_ideco),
+    }
+
+def annual_cash_flow(income, expenses, mortgage, ideco_add):
+    # 年間収支 (円) = 世帯収入 - (生活費などの支出 + ローン返済) - iDeCo 掛金
+    return to_yen(income['世帯収入']) - (to_yen(expenses['支出計(ローン除)']) + mortgage['annual_payment']) - ideco_add
+
+def ideco_contributions(p, timeline):
+    # iDeCo積立 (60歳まで)
+    return np.where(timeline['世帯主年齢'] < 60, to_yen(p.ideco_monthly) * 12, 0)
+
+def run_portfolio(p, timeline, income, expenses, mortgage, growth=None):
+    # 金額は円。mortgage / growth が (paths, years) なら全パスをまとめて計算する
+    if growth is None: growth = asset_growth_rates(p)
+    ideco_add = ideco_contributions(p, timeline)
+    cash_flow = np.atleast_2d(annual_cash_flow(income, expenses, mortgage, ideco_add))
+    if p.monthly:
+        hist = project_assets_monthly(initial_balances(p), growth, monthly_cash_flows(income, expenses, mortgage, ideco_add), ideco_add,
+                                      to_yen(p.safety_net_val), p.invest_surplus, p.foreign_allocation)
+    else:
+        hist = project_assets(initial_balances(p), growth, cash_flow, ideco_add,
+                              to_yen(p.safety_net_val), p.invest_surplus, p.foreign_allocation)
+    hist['年間収支'] = cash_flow
+    return hist
+
+
+# --- シミュレーション実行 ---
+def result_columns(timeline, income, expenses, mortgage, assets):
+    # 各ステージの出力を結果表の列 (万円) にまとめる。ローン・資産は (paths, years)
+    columns = {**timeline, **income, **expenses}
+    for k in ASSET_COLUMNS:
+        columns[k] = to_man(assets[k])
+    columns['ローン残高'] = to_man(mortgage['loan_balance'])
+    columns['ローン返済'] = to_man(mortgage['annual_payment'])
+    columns['年間収支'] = to_man(assets['年間収支'])
+    columns['総資産'] = columns['貯金'] + columns['国内資産'] + columns['外国(現金)'] + columns['外国(債券)'] + columns['外国(株)'] + columns['iDeCo']
+    columns['純資産'] = columns['総資産'] - columns['ローン残高']
+    columns['教育・養育・仕送り'] = expenses['教育費'] + expenses['養育費'] + expenses['仕送り']
+    if '年内最低貯金' in assets:
+        columns['年内最低貯金'] = to_man(assets['年内最低貯金'])
+    return columns
+
+def assemble_result(timeline, income, expenses, mortgage, assets):
+    # 1パス目を結果表にする
+    years = timeline['西暦']
+    columns = {k: v[0] if v.ndim == 2 else v for k, v in result_columns(timeline, income, expenses, mortgage, assets).items()}
+    bankrupt_idx = assets['bankrupt_idx'][0]
+    shortfall_idx = assets['shortfall_idx'][0]
+    min_idx = assets['min_idx'][0]
+    return SimulationResult(
+        columns,
+        bankrupt_year=int(years[bankrupt_idx]) if bankrupt_idx >= 0 else None,
+        shortfall_year=int(years[shortfall_idx]) if shortfall_idx >= 0 else None,
+        min_assets_year=int(years[min_idx]),
+        min_assets_val=float(assets['total'][0, min_idx]),
+    )
+
+def simulate(params):
+    timeline = build_timeline(params)
+    income = compute_income(params, timeline)
+    expenses = compute_expenses(params, timeline)
+    mortgage = compute_mortgage(params, timeline)
+    assets = run_portfolio(params, timeline, income, expenses, mortgage)
+    return assemble_result(timeline, income, expenses, mortgage, assets)
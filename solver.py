@@ -0,0 +1,111 @@
+from dataclasses import dataclass, replace
+import numpy as np
+
+from pipeline import simulate_batch
+from montecarlo import MarketAssumptions, simulate_paths_batch
+
+# 逆算ソルバー: 「資産が生活防衛資金を一度も下回らない」範囲で、あるパラメータの
+# 上限 (または下限) を探す。総資産には取り崩し対象外の iDeCo や外貨預金が含まれるので、
+# 取り崩しで貯金を生活防衛資金まで戻せなくなった時点 (shortfall) を下回ったとみなす。
+# 1回の反復で区間内の複数の候補をまとめて評価し、実行可能 / 不可能の境目を含む
+# 小区間に絞り込んでいく (多分割の二分法)。
+
+
+@dataclass(frozen=True)
+class Goal:
+    field: str
+    label: str
+    feasible_side: str  # 'low': 小さいほど安全 (上限を探す) / 'high': 大きいほど安全 (下限を探す)
+    low: float
+    high: float
+    resolution: float  # これ以下の区間幅になったら終了
+    integer: bool = False
+    floor_field: str | None = None  # 探索の下限をこのフィールドの値 (base の値) 以上にする
+
+
+GOALS = {
+    'max_mortgage_principal': Goal('mortgage_principal', '最大借入額 (万円)', 'low', 0, 20000, 10),
+    'max_living_cost': Goal('living_cost_base', '最大の年間生活費 (万円)', 'low', 0, 2000, 1),
+    'earliest_retirement': Goal('retire_completely_age', '最も早い完全リタイア年齢', 'high', 40, 80, 1, integer=True,
+                                floor_field='retirement_age'),
+}
+
+
+@dataclass
+class SolveResult:
+    goal: Goal
+    value: float | None  # 条件を満たす最も攻めた値 (範囲内に無ければ None)
+    success_rate: float | None  # value での成功率 (決定論的なら 1.0)
+    bounded: bool  # 探索範囲の端まで条件を満たした
+    evaluations: int
+    iterations: int
+
+
+def success_rates(params_list, n_paths=None, seed=0, assumptions=MarketAssumptions()):
+    """各パラメータセットで生活防衛資金を最後まで維持できる割合を返す。
+
+    n_paths が None なら決定論的に評価し、結果は 0 か 1 になる。
+    """
+    rates = np.empty(len(params_list))
+    if n_paths is None:
+        for batch in simulate_batch(params_list):
+            rates[batch.index] = batch.shortfall_idx < 0
+        return rates
+    for i, mc in enumerate(simulate_paths_batch(params_list, n_paths, seed, assumptions)):
+        rates[i] = (mc.shortfall_idx < 0).mean()
+    return rates
+
+
+def search_range(goal, base, low=None, high=None):
+    # 完全リタイア年齢は定年より前にしても収入が変わらないので、下限を定年に合わせる
+    low = goal.low if low is None else low
+    if goal.floor_field is not None:
+        low = max(low, getattr(base, goal.floor_field))
+    return low, goal.high if high is None else high
+
+
+def solve(base, goal, target_success=1.0, n_paths=None, seed=0, assumptions=MarketAssumptions(),
+          candidates=8, low=None, high=None, max_iterations=20):
+    """goal のパラメータを動かし、成功率が target_success 以上となる最も攻めた値を探す。
+
+    成功率はパラメータに対して単調 (feasible_side 側ほど安全) であることを前提とする。
+    モンテカルロでは全候補を同じ乱数 (common random numbers) で評価するので、
+    候補間の差が乱数のばらつきに埋もれない。
+    """
+    if isinstance(goal, str):
+        goal = GOALS[goal]
+    low, high = search_range(goal, base, low, high)
+    # safe 側から risky 側へ向かって探索する
+    safe, risky = (low, high) if goal.feasible_side == 'low' else (high, low)
+    evaluations = 0
+
+    def evaluate(values):
+        nonlocal evaluations
+        evaluations += len(values)
+        values = [int(round(v)) if goal.integer else float(v) for v in values]
+        return values, success_rates([replace(base, **{goal.field: v}) for v in values], n_paths, seed, assumptions)
+
+    (safe, risky), rates = evaluate([safe, risky])
+    if rates[0] < target_success:
+        return SolveResult(goal, None, float(rates[0]), False, evaluations, 0)
+    if rates[1] >= target_success:
+        return SolveResult(goal, risky, float(rates[1]), True, evaluations, 0)
+
+    safe_rate = float(rates[0])
+    iterations = 0
+    while abs(risky - safe) > goal.resolution and iterations < max_iterations:
+        iterations += 1
+        points = np.linspace(safe, risky, candidates + 2)[1:-1]
+        if goal.integer:
+            points = [v for v in dict.fromkeys(int(round(v)) for v in points) if v not in (safe, risky)]
+            if not points:
+                break
+        values, rates = evaluate(points)
+        # safe 側から見て最初に条件を外れた候補の手前までを新しい区間にする
+        failed = np.flatnonzero(rates < target_success)
+        k = failed[0] if len(failed) else len(values)
+        if k > 0:
+            safe, safe_rate = values[k - 1], float(rates[k - 1])
+        if k < len(values):
+            risky = values[k]
+    return SolveResult(goal, safe, safe_rate, False, evaluations, iterations)
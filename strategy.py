@@ -0,0 +1,169 @@
+from dataclasses import dataclass
+import numpy as np
+
+from simulation import (
+    ASSET_COLUMNS, INVESTABLE_COLUMNS, DEFAULT_DRAWDOWN_ORDER,
+    build_timeline, compute_income, compute_expenses, compute_mortgage,
+    project_assets, asset_growth_rates, initial_balances, ideco_contributions, annual_cash_flow, to_yen, to_man,
+)
+from montecarlo import MarketAssumptions, sample_market, _paths_result
+
+# 取り崩し・配分の戦略。戦略は設定値だけを持ち、StrategyPlan が (paths,) の配列に
+# 展開して project_assets に渡す。戦略ごとにパスを縦に積めば、複数の戦略を
+# 同じ市場シナリオで1回の計算にまとめて比較できる。
+
+
+@dataclass(frozen=True)
+class GlidePath:
+    # 外国株の比率 (%) を start_age から end_age にかけて直線的に変える
+    start_age: int
+    end_age: int
+    start_stock: float
+    end_stock: float
+
+    def stock_share(self, ages):
+        t = np.clip((np.asarray(ages, dtype=float) - self.start_age) / max(self.end_age - self.start_age, 1), 0, 1)
+        return (self.start_stock + (self.end_stock - self.start_stock) * t) / 100
+
+
+@dataclass(frozen=True)
+class Guardrail:
+    drawdown: float  # 流動資産 (iDeCo 以外) が最高値からこの割合 (%) 以上減ったら
+    cut: float  # 生活費 (固定資産税等を除く) をこの割合 (%) 減らす
+
+
+@dataclass(frozen=True)
+class Strategy:
+    label: str
+    drawdown_order: tuple = DEFAULT_DRAWDOWN_ORDER  # 生活防衛資金の不足を補う順 (iDeCo は60歳から)
+    target: tuple = ()  # 黒字の配分 ((資産, 比率%), ...)。空なら foreign_allocation で外国株と国内資産に
+    glide: GlidePath | None = None  # 指定すると外国株の比率を年齢で変える (残りは target の比で配分)
+    rebalance: bool = False  # 毎年末に投資資産を配分どおりに戻す
+    guardrail: Guardrail | None = None
+
+
+STRATEGIES = {
+    'current': Strategy('現行 (外国株から取り崩す)'),
+    'safe_first': Strategy('安全資産から取り崩す', drawdown_order=('外国(現金)', '国内資産', '外国(債券)', '外国(株)', 'iDeCo')),
+    'balanced': Strategy('60/30/10 で毎年リバランス', drawdown_order=('外国(債券)', '国内資産', '外国(株)', '外国(現金)'),
+                         target=(('外国(株)', 60), ('外国(債券)', 30), ('国内資産', 10)), rebalance=True),
+    'glide': Strategy('年齢で株式比率を下げる (80%→30%)', drawdown_order=('外国(債券)', '国内資産', '外国(株)', '外国(現金)'),
+                      target=(('外国(株)', 80), ('外国(債券)', 15), ('国内資産', 5)), glide=GlidePath(40, 65, 80, 30), rebalance=True),
+    'guardrail': Strategy('下落時は生活費を10%削る', guardrail=Guardrail(20, 10)),
+}
+
+
+def _check(strategy):
+    for name in strategy.drawdown_order:
+        if name not in ASSET_COLUMNS or name == '貯金':
+            raise ValueError(f"{strategy.label}: 取り崩せない資産です: {name}")
+    for name, _ in strategy.target:
+        if name not in INVESTABLE_COLUMNS:
+            raise ValueError(f"{strategy.label}: 配分できない資産です: {name}")
+    if strategy.target and sum(w for _, w in strategy.target) <= 0:
+        raise ValueError(f"{strategy.label}: 配分の合計が 0 です")
+
+
+def _weight_table(strategy, ages):
+    # (years, 資産) の配分。target も glide もなければ None (foreign_allocation に従う)
+    if not strategy.target and strategy.glide is None:
+        return None
+    col = {k: j for j, k in enumerate(ASSET_COLUMNS)}
+    base = np.zeros(len(ASSET_COLUMNS))
+    for name, w in strategy.target or (('外国(株)', 100),):
+        base[col[name]] += w
+    base /= base.sum()
+    table = np.tile(base, (len(ages), 1))
+    if strategy.glide is not None:
+        stock = strategy.glide.stock_share(ages)
+        rest = base.copy()
+        rest[col['外国(株)']] = 0
+        if rest.sum() <= 0:
+            rest[col['国内資産']] = 1
+        table = np.outer(1 - stock, rest / rest.sum())
+        table[:, col['外国(株)']] = stock
+    return table
+
+
+class StrategyPlan:
+    """戦略のリストとパスごとの戦略番号 (paths,) を、project_assets が使う配列に展開する。"""
+
+    def __init__(self, strategies, strategy_index, ages):
+        for s in strategies:
+            _check(s)
+        col = {k: j for j, k in enumerate(ASSET_COLUMNS)}
+        self.index = np.asarray(strategy_index)
+        n_years = len(ages)
+
+        # 取り崩し順 (戦略, 順番)。-1 は該当なし。全戦略で同じなら (順番,) にして速い経路を使う
+        width = max(len(s.drawdown_order) for s in strategies)
+        orders = np.full((len(strategies), width), -1)
+        for k, s in enumerate(strategies):
+            orders[k, :len(s.drawdown_order)] = [col[name] for name in s.drawdown_order]
+        self.order = orders[0] if (orders == orders[0]).all() else orders[self.index]
+        if self.order.ndim == 1:
+            self.order = self.order[self.order >= 0]
+
+        # 配分表 (戦略, years, 資産)。foreign_allocation に従う戦略は uses_param
+        tables = [_weight_table(s, ages) for s in strategies]
+        self.uses_param = np.array([t is None for t in tables])[self.index]
+        self.table = np.stack([np.zeros((n_years, len(ASSET_COLUMNS))) if t is None else t for t in tables])
+
+        rebalance = np.array([s.rebalance for s in strategies])
+        self.rebalance = rebalance[self.index] if rebalance.any() else None
+        guards = [s.guardrail for s in strategies]
+        if any(guards):
+            self.guard_drawdown = np.array([g.drawdown / 100 if g else 0 for g in guards])[self.index]
+            self.guard_cut = np.array([g.cut / 100 if g else 0 for g in guards])[self.index]
+        else:
+            self.guard_drawdown = self.guard_cut = None
+
+    def weights(self, i, allocation):
+        # i 年目の配分 -> (資産, paths)
+        w = self.table[self.index, i].T.copy()
+        if self.uses_param.any():
+            col = {k: j for j, k in enumerate(ASSET_COLUMNS)}
+            w[:, self.uses_param] = 0
+            w[col['外国(株)'], self.uses_param] = allocation[self.uses_param]
+            w[col['国内資産'], self.uses_param] = 1 - allocation[self.uses_param]
+        return w
+
+
+def simulate_strategies(params, strategies, n_paths=None, seed=0, assumptions=MarketAssumptions(), history=None, block_years=5):
+    """各戦略を同じ市場シナリオで評価し、戦略ごとの MonteCarloResult を返す。
+
+    n_paths が None なら決定論的に (1パスとして) 評価する。全戦略のパスを縦に積み、
+    資産運用を1回で計算する。月次 (params.monthly) には対応しておらず、常に年次で計算する。
+    """
+    strategies = [STRATEGIES[s] if isinstance(s, str) else s for s in strategies]
+    timeline = build_timeline(params)
+    n_years = len(timeline['西暦'])
+    if n_paths is None:
+        n = 1
+        growth, base_rates, macro = asset_growth_rates(params), None, {}
+    else:
+        n = n_paths
+        growth, base_rates, macro = sample_market(params, n_years, n_paths, np.random.default_rng(seed), assumptions, history, block_years)
+    income = compute_income(params, timeline, macro.get('wage_index'))
+    expenses = compute_expenses(params, timeline, macro.get('price_index'))
+    mortgage = compute_mortgage(params, timeline, base_rates)
+
+    shape = (n, n_years)
+    ideco_add = ideco_contributions(params, timeline)
+    cash_flow = np.broadcast_to(annual_cash_flow(income, expenses, mortgage, ideco_add), shape)
+    flex = np.broadcast_to(to_yen(expenses['生活費(インフレ込)'] - params.fixed_cost_housing), shape)
+    stack = lambda a: np.tile(np.broadcast_to(a, shape), (len(strategies), 1))
+    plan = StrategyPlan(strategies, np.repeat(np.arange(len(strategies)), n), timeline['世帯主年齢'])
+    assets = project_assets(
+        initial_balances(params), {k: stack(v) for k, v in growth.items()}, stack(cash_flow), stack(ideco_add),
+        to_yen(params.safety_net_val), params.invest_surplus, params.foreign_allocation,
+        plan, timeline['世帯主年齢'], stack(flex),
+    )
+    results = []
+    for k in range(len(strategies)):
+        rows = slice(k * n, (k + 1) * n)
+        result = _paths_result(timeline, mortgage, assets, rows)
+        if 'spending_cut' in assets:
+            result.spending_cut = to_man(assets['spending_cut'][rows])
+        results.append(result)
+    return results
@@ -0,0 +1,111 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields, replace
+import numpy as np
+
+from simulation import SimulationParams
+from pipeline import simulate_batch
+from cache import MC_CACHE, params_key
+
+# 感度分析の対象パラメータ: 名前 -> (表示名, 既定の下限, 既定の上限)
+SWEEP_PARAMETERS = {
+    'yield_foreign_stock': ('外国株 利回り(%)', 2.0, 8.0),
+    'yield_foreign_bond': ('外国債券 利回り(%)', 1.0, 5.0),
+    'fx_change_rate': ('為替変動率 (米ドル価値/年)', -0.025, 0.01),
+    'head_income_growth': ('世帯主 昇給率 (%/年)', 0.0, 3.0),
+    'inflation_rate': ('物価上昇率', 0.0, 0.03),
+    'living_cost_base': ('年間生活費 (万円)', 360, 720),
+    'mortgage_base_rate': ('住宅ローン基準金利 (%)', 2.0, 4.0),
+    'retire_completely_age': ('完全リタイア年齢', 60, 70),
+    'foreign_allocation': ('黒字分の外国株式への配分(%)', 0, 100),
+    'safety_net_val': ('生活防衛資金 (万円)', 100, 1000),
+}
+MAX_AXES = 3
+# これ以上の行数ならプロセスプールに分散する (小さいグリッドは起動コストの方が大きい)
+PARALLEL_THRESHOLD = 20000
+
+_INT_FIELDS = {f.name for f in fields(SimulationParams) if f.type == 'int' or f.type is int}
+
+
+@dataclass
+class SweepResult:
+    axes: dict  # パラメータ名 -> 値の配列 (グリッドの軸順)
+    final_net_assets: np.ndarray  # グリッド形状 (万円)
+    min_assets_year: np.ndarray
+    bankrupt_year: np.ndarray  # 資金ショートしなければ NaN
+
+    @property
+    def bankrupt(self):
+        return ~np.isnan(self.bankrupt_year)
+
+
+def axis_values(name, low, high, steps):
+    values = np.linspace(low, high, steps)
+    if name in _INT_FIELDS:
+        values = np.unique(np.round(values).astype(int))
+    return values
+
+def grid_params(base, axes):
+    names = list(axes)
+    return [replace(base, **dict(zip(names, combo))) for combo in itertools.product(*(list(axes[n]) for n in names))]
+
+def evaluate_kpis(params_list):
+    # 入力順に (最終純資産, 最も苦しい年, 資金ショート年) を返す
+    n = len(params_list)
+    final_net, min_year, bankrupt_year = np.empty(n), np.empty(n, dtype=np.int64), np.empty(n)
+    for batch in simulate_batch(params_list):
+        final_net[batch.index] = batch.final_net_assets
+        min_year[batch.index] = batch.min_assets_year
+        bankrupt_year[batch.index] = batch.bankrupt_year
+    return final_net, min_year, bankrupt_year
+
+def evaluate_kpis_parallel(params_list, workers=None, chunk_size=5000):
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(params_list) < PARALLEL_THRESHOLD:
+        return evaluate_kpis(params_list)
+    chunks = [params_list[i:i + chunk_size] for i in range(0, len(params_list), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(evaluate_kpis, chunks))
+    return tuple(np.concatenate([part[k] for part in parts]) for k in range(3))
+
+def run_sweep(base, axes, workers=None):
+    if not 1 <= len(axes) <= MAX_AXES:
+        raise ValueError(f"スイープするパラメータは1〜{MAX_AXES}個にしてください")
+    axes = {name: np.asarray(values) for name, values in axes.items()}
+    shape = tuple(len(v) for v in axes.values())
+    final_net, min_year, bankrupt_year = evaluate_kpis_parallel(grid_params(base, axes), workers)
+    return SweepResult(axes, final_net.reshape(shape), min_year.reshape(shape), bankrupt_year.reshape(shape))
+
+def tornado(base, ranges):
+    """各パラメータを下限・上限に振ったときの最終純資産の変化を、振れ幅の大きい順に返す。"""
+    names = list(ranges)
+    params_list = [base]
+    for name in names:
+        low, high = ranges[name]
+        params_list += [replace(base, **{name: low}), replace(base, **{name: high})]
+    final_net, _, bankrupt_year = evaluate_kpis(params_list)
+    rows = []
+    for i, name in enumerate(names):
+        low_val, high_val = final_net[1 + 2 * i], final_net[2 + 2 * i]
+        rows.append({
+            'name': name,
+            'low': ranges[name][0],
+            'high': ranges[name][1],
+            'low_final_net': low_val,
+            'high_final_net': high_val,
+            'low_bankrupt': not np.isnan(bankrupt_year[1 + 2 * i]),
+            'high_bankrupt': not np.isnan(bankrupt_year[2 + 2 * i]),
+            'swing': abs(high_val - low_val),
+        })
+    rows.sort(key=lambda r: r['swing'], reverse=True)
+    return final_net[0], rows
+
+def cached_run_sweep(base, axes, workers=None):
+    # 軸の順番で結果の形が変わるので、キーは dict ではなく (名前, 値) の並びにする (dict のキーは並べ替えられる)
+    key = params_key('run_sweep', base, [(name, list(values)) for name, values in axes.items()])
+    return MC_CACHE.get_or_compute(key, lambda: run_sweep(base, axes, workers))
+
+def cached_tornado(base, ranges):
+    key = params_key('tornado', base, list(ranges.items()))
+    return MC_CACHE.get_or_compute(key, lambda: tornado(base, ranges))
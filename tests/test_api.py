@@ -0,0 +1,57 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from simulation import SimulationParams, simulate
+from kakeikanri_api import RequestError, SimulationBatcher, parse_request, serve
+
+
+def test_bad_scenario_does_not_fail_batch():
+    # 長めに待って、両方のシナリオを同じバッチに入れる
+    batcher = SimulationBatcher(workers=1, max_wait=0.2)
+    good = SimulationParams(head_income_base=777)
+    bad = SimulationParams(has_child2=True)  # c2_year / c2_edu なし (from_dict を通さずに作る)
+    futures = [batcher.submit(bad), batcher.submit(good)]
+    assert futures[1].result(10).final_net_assets == simulate(good).final_net_assets
+    with pytest.raises(Exception):
+        futures[0].result(10)
+
+
+@pytest.mark.parametrize('record', [{'has_child2': True}, {'has_child2': True, 'c2_year': 2029}, {'c1_edu': 'x'}])
+def test_inconsistent_scenario_is_request_error(record):
+    with pytest.raises(RequestError):
+        parse_request(json.dumps({'scenarios': [{}, record]}).encode())
+
+
+@pytest.fixture
+def server():
+    server, _ = serve(0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _post(server, body, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=30)
+    conn.request('POST', '/simulate', body=body, headers=headers or {})
+    res = conn.getresponse()
+    return res.status, json.loads(res.read())
+
+
+def test_bad_content_length_is_400(server):
+    conn = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=30)
+    conn.putrequest('POST', '/simulate')
+    conn.putheader('Content-Length', 'abc')
+    conn.endheaders()
+    res = conn.getresponse()
+    assert res.status == 400
+
+
+def test_simulate_and_inconsistent_request(server):
+    status, body = _post(server, json.dumps({'head_income_base': 700}))
+    assert status == 200 and body['results'][0]['kpi']['final_net_assets'] == simulate(SimulationParams(head_income_base=700)).final_net_assets
+    status, body = _post(server, json.dumps({'has_child2': True}))
+    assert status == 400 and 'c2' in body['error']
@@ -0,0 +1,55 @@
+import csv
+import json
+
+import pytest
+
+from kakeikanri_batch import run
+
+# 第2子なし (年次) と第2子あり (月次) は別のグループで計算される
+MIXED = [{}, {'has_child2': True, 'c2_year': 2029, 'c2_edu': '【A】公立中心(塾しっかり)', 'monthly': True}]
+
+
+def _write_jsonl(path, records):
+    path.write_text(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records), encoding='utf-8')
+
+
+@pytest.mark.parametrize('chunk_size', [1, 1000])
+@pytest.mark.parametrize('suffix', ['csv', 'parquet'])
+def test_mixed_groups(tmp_path, suffix, chunk_size):
+    src = tmp_path / 'in.jsonl'
+    _write_jsonl(src, MIXED)
+    out = tmp_path / f'out.{suffix}'
+    done, _ = run(str(src), str(out), workers=1, chunk_size=chunk_size, progress=None)
+    assert done == 2
+    if suffix == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(out)
+        ids = table.column('scenario_id').to_pylist()
+        child2 = table.column('第2子年齢').to_pylist()
+    else:
+        with open(out, encoding='utf-8', newline='') as f:
+            rows = list(csv.DictReader(f))
+        ids = [r['scenario_id'] for r in rows]
+        child2 = [r['第2子年齢'] or None for r in rows]
+    # 入力順のまま、第2子なしの年齢は欠損値
+    assert ids[0] == '0' and ids[-1] == '1'
+    assert child2[0] is None and child2[-1] is not None
+
+
+def test_mixed_groups_csv_input(tmp_path):
+    src = tmp_path / 'in.csv'
+    src.write_text('has_child2,c2_year,c2_edu,monthly\n,,,\ntrue,2029,【A】公立中心(塾しっかり),true\n', encoding='utf-8')
+    done, _ = run(str(src), str(tmp_path / 'out.csv'), workers=1, progress=None)
+    assert done == 2
+
+
+@pytest.mark.parametrize('bad, message', [
+    ({'has_child2': True, 'c2_edu': '【A】公立中心(塾しっかり)'}, 'c2_year'),
+    ({'has_child2': True, 'c2_year': 2029}, 'c2_edu'),
+    ({'c1_edu': '存在しないプラン'}, 'c1_edu'),
+])
+def test_inconsistent_row_reports_line(tmp_path, bad, message):
+    src = tmp_path / 'in.jsonl'
+    _write_jsonl(src, [{}, bad])
+    with pytest.raises(ValueError, match=f'2 行目: {message}'):
+        run(str(src), str(tmp_path / 'out.csv'), workers=1, progress=None)
@@ -0,0 +1,67 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+import cache
+from cache import ResultCache, params_key
+from montecarlo import MarketAssumptions
+from simulation import SimulationParams
+
+
+@dataclass(frozen=True)
+class Rates:
+    stock: float = 5.0
+    bond: float = 2.0
+
+
+@dataclass(frozen=True)
+class Vols:
+    stock: float = 5.0
+    bond: float = 2.0
+
+
+def test_params_key_normalises_numbers():
+    assert params_key('x', 330) == params_key('x', 330.0) == params_key('x', np.int64(330)) == params_key('x', np.float32(330))
+    assert params_key('x', -0.0) == params_key('x', 0.0) == params_key('x', 0)
+    assert params_key('x', SimulationParams(living_cost_base=330)) == params_key('x', SimulationParams(living_cost_base=330.0))
+    assert params_key('x', True) != params_key('x', 1)
+    assert params_key('x', 1) != params_key('x', 2)
+
+
+def test_params_key_tags_dataclasses_with_their_type():
+    # 同じフィールドでも型が違えば別のキー (別の種類の設定を取り違えない)
+    assert params_key(Rates()) != params_key(Vols())
+    assert params_key(Rates()) != params_key({'stock': 5.0, 'bond': 2.0})
+    assert params_key(MarketAssumptions()) == params_key(MarketAssumptions(vol_fx=10))
+    assert params_key(SimulationParams(), 'a') != params_key(SimulationParams(), 'b')
+
+
+def test_lru_evicts_least_recently_used():
+    c = ResultCache(maxsize=2)
+    c.put('a', 1)
+    c.put('b', 2)
+    assert c.get('a') == 1  # a を使ったので、次に追い出されるのは b
+    c.put('c', 3)
+    assert c.get('b') is None
+    assert (c.get('a'), c.get('c')) == (1, 3)
+    assert len(c) == 2 and c.stats()['misses'] == 1
+
+
+def test_get_or_compute_computes_once():
+    c = ResultCache()
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    assert c.get_or_compute('k', compute) == c.get_or_compute('k', compute) == 1
+    assert calls == [1] and c.stats()['hits'] == 1
+
+
+def test_ttl_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    c = ResultCache(ttl=60)
+    c.put('k', 'v')
+    now[0] += 59
+    assert c.get('k') == 'v'
+    now[0] += 2
+    assert c.get('k') is None
+    assert len(c) == 0  # 期限切れのエントリは取り除かれる
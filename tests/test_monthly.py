@@ -0,0 +1,96 @@
+import numpy as np
+
+from montecarlo import MarketAssumptions, simulate_paths_batch
+from pipeline import simulate_batch
+from simulation import (
+    ASSET_COLUMNS, DEFAULT_DRAWDOWN_ORDER, EDUCATION_SHARE, EVEN_SHARE, INVESTABLE_COLUMNS, SALARY_SHARE,
+    SimulationParams, project_assets_monthly, simulate,
+)
+
+N_PATHS, N_YEARS = 3, 8
+SAFETY_NET = 1_000_000
+
+
+def monthly_reference(initial, growth, flows, ideco_add, safety_net, allocation):
+    # 1か月ずつ進める素朴なループ: 運用資産は月率で成長し、貯金が生活防衛資金を割った月に取り崩し順に充てる
+    out = {k: np.empty((N_PATHS, N_YEARS)) for k in (*ASSET_COLUMNS, '年内最低貯金')}
+    bankrupt_idx, shortfall_idx = np.full(N_PATHS, -1), np.full(N_PATHS, -1)
+    for p in range(N_PATHS):
+        bal = {k: float(initial[k]) for k in ASSET_COLUMNS}
+        for i in range(N_YEARS):
+            monthly = {k: (1 + growth[k][p, i]) ** (1 / 12) for k in INVESTABLE_COLUMNS}
+            low = np.inf
+            for m in range(12):
+                for k in INVESTABLE_COLUMNS:
+                    bal[k] *= monthly[k]
+                bal['iDeCo'] = bal['iDeCo'] * monthly['外国(株)'] + ideco_add[p, i] / 12
+                bal['貯金'] += sum(amount[p, i] * share[m] for amount, share in flows)
+                want = max(safety_net - bal['貯金'], 0)
+                for k in DEFAULT_DRAWDOWN_ORDER:
+                    take = min(want, bal[k])
+                    bal[k] -= take
+                    bal['貯金'] += take
+                    want -= take
+                if want > 1e-6 and shortfall_idx[p] < 0:
+                    shortfall_idx[p] = i
+                if bal['貯金'] < 0 and bankrupt_idx[p] < 0:
+                    bankrupt_idx[p] = i
+                low = min(low, bal['貯金'])
+            surplus = max(bal['貯金'] - safety_net, 0)
+            bal['貯金'] -= surplus
+            bal['外国(株)'] += surplus * allocation
+            bal['国内資産'] += surplus * (1 - allocation)
+            for k in ASSET_COLUMNS:
+                out[k][p, i] = bal[k]
+            out['年内最低貯金'][p, i] = low
+    return out, bankrupt_idx, shortfall_idx
+
+
+def test_matches_month_by_month_loop():
+    rng = np.random.default_rng(3)
+    initial = {'貯金': 2_000_000, '国内資産': 1_500_000, '外国(現金)': 300_000, '外国(債券)': 800_000,
+               '外国(株)': 2_500_000, 'iDeCo': 400_000}
+    growth = {k: rng.normal(0.03, 0.15, (N_PATHS, N_YEARS)) for k in INVESTABLE_COLUMNS}
+    # 給与 (賞与月に多い)・学費 (4月と10月)・毎月の支出。途中の年から赤字になり、最後は資産が尽きる
+    salary = np.linspace(6_000_000, 2_000_000, N_YEARS) * np.ones((N_PATHS, 1))
+    flows = ((salary, SALARY_SHARE), (np.full((N_PATHS, N_YEARS), -1_200_000), EDUCATION_SHARE),
+             (np.full((N_PATHS, N_YEARS), -4_800_000), EVEN_SHARE))
+    ideco_add = np.full((N_PATHS, N_YEARS), 276_000.0)
+
+    hist = project_assets_monthly(initial, growth, flows, ideco_add, SAFETY_NET, True, 60)
+    ref, bankrupt_idx, shortfall_idx = monthly_reference(initial, growth, flows, ideco_add, SAFETY_NET, 0.6)
+    for k, expected in ref.items():
+        np.testing.assert_allclose(hist[k], expected, rtol=1e-9, atol=1e-3, err_msg=k)
+    np.testing.assert_array_equal(hist['bankrupt_idx'], bankrupt_idx)
+    np.testing.assert_array_equal(hist['shortfall_idx'], shortfall_idx)
+    assert (shortfall_idx >= 0).any()  # 取り崩しきれない年まで確かめている
+
+
+CASES = [
+    SimulationParams(monthly=True),
+    SimulationParams(monthly=True, living_cost_base=700, initial_cash=150),  # 年度途中に取り崩す
+    SimulationParams(monthly=True, has_child2=True, c2_year=2028, c2_edu='【B】中高公立・私大文系', mortgage_principal=0),
+]
+
+
+def test_batch_matches_simulate():
+    for batch in simulate_batch(CASES):
+        for j, i in enumerate(batch.index):
+            expected, got = simulate(CASES[i]), batch.result(j)
+            for name, values in expected.columns.items():
+                np.testing.assert_allclose(got.columns[name], values, rtol=1e-12, err_msg=name)
+            assert (got.bankrupt_year, got.shortfall_year, got.min_assets_year) == \
+                   (expected.bankrupt_year, expected.shortfall_year, expected.min_assets_year)
+
+
+def test_paths_batch_without_volatility_matches_simulate():
+    # 変動をすべて 0 にすると、どのパスも決定論的な計算と同じになる
+    calm = MarketAssumptions(vol_foreign_stock=0, vol_foreign_bond=0, vol_foreign_cash=0, vol_yen=0, vol_fx=0, vol_mortgage_rate=0)
+    for params, mc in zip(CASES, simulate_paths_batch(CASES, n_paths=4, seed=0, assumptions=calm)):
+        expected = simulate(params)
+        for got in mc.total_assets:
+            np.testing.assert_allclose(got, expected.columns['総資産'], rtol=1e-9)
+        for got in mc.net_assets:
+            np.testing.assert_allclose(got, expected.columns['純資産'], rtol=1e-9)
+        shortfall = -1 if expected.shortfall_year is None else list(expected.years).index(expected.shortfall_year)
+        np.testing.assert_array_equal(mc.shortfall_idx, shortfall)
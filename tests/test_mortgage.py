@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from mortgage import Prepayment, Refinance, amortize, yearly_schedule
+
+BALANCE = 30_000_000  # 円
+YEARS = np.arange(2025, 2045)
+END_YEAR = 2055
+
+
+def monthly_reference(balance, annual_rates, years, end_year, costs=None):
+    # 月ごとに利息を付けて返済する素朴なループ。返済額は年初に残り月数から決め、年内は一定
+    n_left = max((end_year - years[0]) * 12, 1)
+    out = {k: [] for k in ('balance', 'payment', 'interest')}
+    for year, rate in zip(years, annual_rates):
+        balance += (costs or {}).get(year, 0) if balance > 0 else 0
+        r = rate / 100 / 12
+        payment = balance * r / (1 - (1 + r) ** -n_left) if r > 0 else balance / n_left
+        paid = interest = 0.0
+        for _ in range(12):
+            if balance <= 0 or n_left <= 0:
+                break
+            interest += balance * r
+            balance = balance * (1 + r) - payment
+            paid += payment
+            n_left -= 1
+            if n_left == 0:
+                balance = 0.0
+        out['balance'].append(balance)
+        out['payment'].append(paid)
+        out['interest'].append(interest)
+        n_left = max(n_left, 1)
+    return {k: np.array(v) for k, v in out.items()}
+
+
+def assert_matches(schedule, ref, atol=1e-5):
+    for name in ('balance', 'payment', 'interest'):
+        np.testing.assert_allclose(getattr(schedule, name)[0], ref[name], rtol=0, atol=atol, err_msg=name)
+
+
+@pytest.mark.parametrize('rates', [
+    np.full(len(YEARS), 1.2),  # 固定金利 (全期間を1区間で計算)
+    np.linspace(0.5, 3.0, len(YEARS)),  # 変動金利 (1年ずつ計算)
+])
+def test_closed_form_matches_monthly_loop(rates):
+    assert_matches(yearly_schedule(BALANCE, rates[None, :], YEARS, END_YEAR), monthly_reference(BALANCE, rates, YEARS, END_YEAR))
+
+
+def test_zero_rate_repays_evenly():
+    schedule = yearly_schedule(12_000_000, np.zeros((1, 12)), np.arange(2025, 2037), 2035)
+    np.testing.assert_allclose(schedule.payment[0], [1_200_000] * 10 + [0, 0])
+    np.testing.assert_allclose(schedule.interest[0], 0)
+    np.testing.assert_allclose(schedule.balance[0], np.maximum(12_000_000 - 1_200_000 * np.arange(1, 13), 0))
+
+
+def test_amortize_skips_finished_loans():
+    end, paid, interest = amortize([0.0, 1_000_000], 0.001, [120, 0])
+    np.testing.assert_array_equal(end, [0.0, 1_000_000])
+    np.testing.assert_array_equal(paid, [0, 0])
+    np.testing.assert_array_equal(interest, [0, 0])
+
+
+def test_prepayment_shorten_keeps_payment_and_reduce_keeps_term():
+    rates = np.full((1, len(YEARS)), 1.5)
+    plain = yearly_schedule(BALANCE, rates, YEARS, 2045)
+    shorten = yearly_schedule(BALANCE, rates, YEARS, 2045, prepayments=(Prepayment(2030, 5_000_000, 'shorten'),))
+    reduce = yearly_schedule(BALANCE, rates, YEARS, 2045, prepayments=(Prepayment(2030, 5_000_000, 'reduce'),))
+    i = list(YEARS).index(2030)
+    # 繰上返済の年の支払いには充当額が含まれる
+    # (期間短縮型は残り月数を切り上げて返済額を決め直すので、据え置きの返済額とは端数だけずれる)
+    assert shorten.payment[0, i] == pytest.approx(plain.payment[0, i] + 5_000_000, rel=1e-3)
+    assert reduce.payment[0, i] < plain.payment[0, i] + 5_000_000
+    # 期間短縮型: 毎月の返済額はほぼ据え置きで、完済予定より前に終わる
+    assert shorten.payment[0, i + 1] == pytest.approx(plain.payment[0, i + 1], rel=1e-3)
+    paid_off = np.flatnonzero(shorten.balance[0] == 0)[0]
+    assert YEARS[paid_off] < 2044
+    # 返済額軽減型: 返済額が下がり、完済は予定どおり
+    assert reduce.payment[0, i + 1] < plain.payment[0, i + 1]
+    assert reduce.balance[0, -2] > 0 and reduce.balance[0, -1] == 0
+    # 総利息は期間短縮型の方が少ない
+    assert shorten.interest.sum() < reduce.interest.sum() < plain.interest.sum()
+
+
+def test_refinance_mid_term_matches_monthly_loop():
+    rates = np.full(len(YEARS), 2.5)
+    schedule = yearly_schedule(BALANCE, rates[None, :], YEARS, END_YEAR, refinances=(Refinance(2032, 0.9, cost=400_000),))
+    switched = np.where(YEARS >= 2032, 0.9, rates)
+    assert_matches(schedule, monthly_reference(BALANCE, switched, YEARS, END_YEAR, costs={2032: 400_000}))
+
+
+def test_refinance_can_change_end_year():
+    rates = np.full((1, len(YEARS)), 1.0)
+    schedule = yearly_schedule(BALANCE, rates, YEARS, END_YEAR, refinances=(Refinance(2030, 1.0, end_year=2040),))
+    # 完済予定年の前年末で残高がなくなる (当初の end_year と同じ数え方)
+    assert schedule.balance[0, list(YEARS).index(2038)] > 0
+    np.testing.assert_array_equal(schedule.balance[0, list(YEARS).index(2039):], 0)
+
+
+def test_full_prepayment_ends_the_loan():
+    rates = np.full((1, len(YEARS)), 1.0)
+    before = yearly_schedule(BALANCE, rates[:, :5], YEARS[:5], END_YEAR).balance[0, -1]
+    schedule = yearly_schedule(BALANCE, rates, YEARS, END_YEAR, prepayments=(Prepayment(2030, BALANCE, 'shorten'),))
+    i = list(YEARS).index(2030)
+    # 残高を超える分は充当されず、その年で完済して以降は支払いがない
+    assert schedule.payment[0, i] == pytest.approx(before)
+    np.testing.assert_array_equal(schedule.balance[0, i:], 0)
+    np.testing.assert_array_equal(schedule.payment[0, i + 1:], 0)
+    np.testing.assert_array_equal(schedule.interest[0, i:], 0)
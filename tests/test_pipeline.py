@@ -0,0 +1,55 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from cache import RESULT_CACHE, params_key
+from pipeline import SIMULATION_STAGES, Pipeline, Stage, _check_coverage, simulate_incremental
+from simulation import SimulationParams, simulate
+
+
+def test_changed_field_recomputes_only_stages_that_read_it():
+    pipeline = Pipeline(SIMULATION_STAGES)
+    base = SimulationParams()
+    _, recomputed = pipeline.run(base)
+    assert recomputed == ['timeline', 'income', 'expenses', 'mortgage', 'portfolio']
+    assert pipeline.run(base)[1] == []
+    assert pipeline.run(replace(base, fx_change_rate=-0.02))[1] == ['portfolio']
+    # 物価上昇率は支出を変え、支出を読む資産運用も計算し直す
+    assert pipeline.run(replace(base, inflation_rate=0.03))[1] == ['expenses', 'portfolio']
+    # 表示用のフィールドはどのステージも読まない
+    assert pipeline.run(replace(base, c1_month=1))[1] == []
+
+
+def test_partial_recompute_matches_full_simulation():
+    pipeline = Pipeline(SIMULATION_STAGES)
+    base = SimulationParams()
+    pipeline.run(base)
+    params = replace(base, fx_change_rate=-0.02)
+    result = simulate_incremental(params, pipeline)
+    expected = simulate(params)
+    for name, values in expected.columns.items():
+        np.testing.assert_array_equal(result.columns[name], values, err_msg=name)
+
+
+def test_repeat_call_hits_result_cache():
+    pipeline = Pipeline(SIMULATION_STAGES)
+    params = SimulationParams(living_cost_base=417.5)
+    first = simulate_incremental(params, pipeline)
+    assert RESULT_CACHE.get(params_key('simulate', params)) is first
+    stage_misses = {name: s['misses'] for name, s in pipeline.stats().items()}
+    # 2回目は全体キャッシュから返り、ステージのキャッシュも見ない
+    assert simulate_incremental(params, pipeline) is first
+    assert {name: s['misses'] for name, s in pipeline.stats().items()} == stage_misses
+    assert all(s['hits'] == 0 for s in pipeline.stats().values())
+
+
+def test_undeclared_field_is_rejected():
+    stages = [replace(s, fields=tuple(f for f in s.fields if f != 'fx_change_rate')) for s in SIMULATION_STAGES]
+    with pytest.raises(RuntimeError, match='fx_change_rate'):
+        _check_coverage(stages)
+
+
+def test_stage_order_is_checked():
+    with pytest.raises(ValueError, match='timeline'):
+        Pipeline([Stage('income', lambda p, t: None, (), deps=('timeline',))])
@@ -0,0 +1,31 @@
+from dataclasses import replace
+
+from cache import cached_solve
+from simulation import SimulationParams, simulate
+from solver import GOALS, solve
+
+
+def test_earliest_retirement_starts_at_retirement_age():
+    base = SimulationParams(living_cost_base=400)
+    res = solve(base, 'earliest_retirement')
+    # 定年より前の完全リタイア年齢は収入を変えないので、答えは定年以上になる
+    assert res.value >= base.retirement_age
+    final = lambda age: simulate(replace(base, retire_completely_age=age)).final_net_assets
+    assert final(base.retirement_age - 10) == final(base.retirement_age)
+
+
+def test_earliest_retirement_changes_outcome():
+    base = SimulationParams()
+    res = solve(base, 'earliest_retirement')
+    assert base.retirement_age < res.value < 80 and not res.bounded
+    # 1年早めると条件を外れる (答えの年齢が結果を左右している)
+    earlier = simulate(replace(base, retire_completely_age=res.value - 1))
+    assert earlier.shortfall_year is not None
+    assert simulate(replace(base, retire_completely_age=res.value)).shortfall_year is None
+
+
+def test_cached_solve_reuses_result():
+    base = SimulationParams(living_cost_base=410)
+    first = cached_solve(base, 'max_living_cost')
+    assert cached_solve(base, GOALS['max_living_cost']) is first
+    assert first.value == solve(base, 'max_living_cost').value
@@ -0,0 +1,36 @@
+import numpy as np
+
+from montecarlo import MarketAssumptions, simulate_paths
+from simulation import SimulationParams, simulate
+from strategy import STRATEGIES, simulate_strategies
+
+PARAMS = SimulationParams(living_cost_base=520)
+
+
+def test_current_strategy_matches_baseline():
+    # 現行の戦略は戦略なしの計算と同じ結果になる (他の戦略と一緒に計算しても変わらない)
+    expected = simulate(PARAMS)
+    for results in (simulate_strategies(PARAMS, ['current']), simulate_strategies(PARAMS, list(STRATEGIES))):
+        np.testing.assert_allclose(results[0].total_assets[0], expected.columns['総資産'], rtol=1e-12)
+        np.testing.assert_allclose(results[0].net_assets[0], expected.columns['純資産'], rtol=1e-12)
+
+    mc = simulate_paths(PARAMS, n_paths=200, seed=5)
+    current = simulate_strategies(PARAMS, list(STRATEGIES), n_paths=200, seed=5)[0]
+    np.testing.assert_allclose(current.net_assets, mc.net_assets, rtol=1e-12)
+    np.testing.assert_array_equal(current.shortfall_idx, mc.shortfall_idx)
+
+
+def test_strategies_share_market_scenarios():
+    # 全戦略を同じ乱数ショックで評価する: まとめて計算しても1戦略ずつ計算しても同じ
+    names = list(STRATEGIES)
+    together = simulate_strategies(PARAMS, names, n_paths=200, seed=7, assumptions=MarketAssumptions(vol_inflation=0.5))
+    for name, result in zip(names, together):
+        alone = simulate_strategies(PARAMS, [name], n_paths=200, seed=7, assumptions=MarketAssumptions(vol_inflation=0.5))[0]
+        np.testing.assert_allclose(result.net_assets, alone.net_assets, rtol=1e-12, err_msg=name)
+    # 同じ戦略を2回並べれば、パスごとに全く同じ結果になる
+    twice = simulate_strategies(PARAMS, ['balanced', 'balanced'], n_paths=200, seed=7)
+    np.testing.assert_array_equal(twice[0].net_assets, twice[1].net_assets)
+    # ローン残高 (市場シナリオだけで決まる) は戦略によらず同じ
+    debt = [r.total_assets - r.net_assets for r in together]
+    for d in debt[1:]:
+        np.testing.assert_allclose(d, debt[0], rtol=1e-12)
@@ -0,0 +1,21 @@
+from simulation import SimulationParams
+from sweep import axis_values, cached_run_sweep, cached_tornado
+
+
+def test_sweep_is_cached_per_axis_order():
+    base = SimulationParams()
+    axes = {'yield_foreign_stock': axis_values('yield_foreign_stock', 2.0, 8.0, 3),
+            'living_cost_base': axis_values('living_cost_base', 360, 720, 4)}
+    first = cached_run_sweep(base, axes)
+    # 再描画では同じ結果を使い回す
+    assert cached_run_sweep(base, dict(axes)) is first
+    # 軸の順番が違えば別の結果 (形が入れ替わる)
+    swapped = cached_run_sweep(base, dict(reversed(list(axes.items()))))
+    assert swapped.final_net_assets.shape == (4, 3)
+    assert (swapped.final_net_assets == first.final_net_assets.T).all()
+
+
+def test_tornado_is_cached():
+    base = SimulationParams()
+    ranges = {'inflation_rate': (0.0, 0.03), 'living_cost_base': (360, 720)}
+    assert cached_tornado(base, ranges) is cached_tornado(base, dict(ranges))